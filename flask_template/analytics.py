@@ -0,0 +1,101 @@
+"""
+analytics.py  –  dashboard metrics computed from a user's daily rollup rows
+
+Every metric is a plain function over rows of mmungoshi_daily_rollup (see
+rollups.py), so the per-metric /api endpoints and /api/dashboard share one
+implementation.  dashboard() computes all four from a single fetch of the
+user's rows and reports how long each one took.
+"""
+
+import json
+import time
+from datetime import datetime, timedelta
+
+from flask_template import balance
+
+ROLLUP_SQL = """
+    SELECT Day, TaskCategory, Minutes, TaskCount, CompletedCount,
+           HourHist, MoodScoreSum, FeedbackCount
+    FROM mmungoshi_daily_rollup
+    WHERE UserID = %s
+"""
+
+
+def _day(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _hist(value):
+    if isinstance(value, (str, bytes)):
+        return json.loads(value)
+    return value or []
+
+
+# ─── Metrics ─────────────────────────────────────────────────────────────────
+def daily_streak(rows):
+    """Length of the run of consecutive days ending at the latest completed day."""
+    days = sorted({_day(r['Day']) for r in rows if r['CompletedCount']}, reverse=True)
+    n = 0
+    for i, d in enumerate(days):
+        if d != days[0] - timedelta(days=i):
+            break
+        n += 1
+    return n
+
+
+def mode_breakdown(rows):
+    """[{mode, total_minutes}] for every category the user has assignments in."""
+    minutes, counts = {}, {}
+    for r in rows:
+        cat = r['TaskCategory']
+        minutes[cat] = minutes.get(cat, 0) + int(r['Minutes'])
+        counts[cat]  = counts.get(cat, 0) + int(r['TaskCount'])
+    return [{'mode': cat, 'total_minutes': minutes[cat]}
+            for cat in sorted(minutes) if counts[cat] > 0]
+
+
+def heatmap(rows):
+    """[{hr, weekday, cnt}] of assignment starts, weekday numbered like MySQL's DAYOFWEEK (1 = Sunday)."""
+    cells = {}
+    for r in rows:
+        if not r['TaskCount']:
+            continue
+        weekday = _day(r['Day']).isoweekday() % 7 + 1
+        for hr, cnt in enumerate(_hist(r['HourHist'])):
+            if cnt:
+                cells[(hr, weekday)] = cells.get((hr, weekday), 0) + cnt
+    return [{'hr': hr, 'weekday': wd, 'cnt': cnt} for (hr, wd), cnt in sorted(cells.items())]
+
+
+def weekly_balance(rows, week_start, block_length):
+    """Average mood change × intensity × (duration / block) of feedback given in the week."""
+    week_end = week_start + timedelta(days=7)
+    total, n = 0.0, 0
+    for r in rows:
+        if week_start <= _day(r['Day']) < week_end:
+            total += float(r['MoodScoreSum'])
+            n     += int(r['FeedbackCount'])
+    return balance.from_totals(total, n, block_length)
+
+
+# ─── All at once ─────────────────────────────────────────────────────────────
+def dashboard(rows, week_start, block_length):
+    """All four metrics from one set of rows, with per-metric timings in ms."""
+    timings = {}
+
+    def timed(name, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        timings[name] = round((time.perf_counter() - start) * 1000, 3)
+        return result
+
+    return {
+        'daily_streak':   {'streak': timed('daily_streak', daily_streak, rows)},
+        'mode_breakdown': timed('mode_breakdown', mode_breakdown, rows),
+        'heatmap':        timed('heatmap', heatmap, rows),
+        'weekly_balance': {
+            'week_start': week_start.isoformat(),
+            'score':      timed('weekly_balance', weekly_balance, rows, week_start, block_length),
+        },
+        'timings_ms': timings,
+    }
@@ -1,30 +1,53 @@
 # app.py
 from flask import (
     Flask, render_template, request, session, redirect,
-    url_for, flash, jsonify, g
+    url_for, flash, jsonify, g, Response, stream_with_context, stream_template,
+    make_response
 )
-from flask_session import Session
+from functools import wraps
 from datetime import datetime, timedelta, date
 import time
 import pymysql
-import yaml
-from pathlib import Path
 from flask import current_app
 import os
 
+from flask_template import dbpool
+from flask_template import pagination
+from flask_template import registry
+from flask_template import sqlstats
+from flask_template import catalog
+from flask_template import deletes
+from flask_template import resultcache
+from flask_template import rollups
+from flask_template import analytics
+from flask_template import autoplan
+from flask_template import balance
+from flask_template import sessions
+from flask_template import intervals
+from flask_template import rows as rowtypes
+
 # Model classes
 from flask_template.user import user
 from flask_template.task import task
 from flask_template.user_task import user_task
 from flask_template.feedback import feedback
+from flask_template.notification import notification
+from flask_template.recurrence import recurrence
+from flask_template import scheduler
+from flask_template.broker import get_broker
+import csv
+import io
+import hashlib
+import hmac
+import json
+import queue
+import threading
 
 # ─── App setup ───────────────────────────────────────────────────────────────
 app = Flask(__name__, static_url_path='')
 app.config['SECRET_KEY']                 = '5sdghsgRTg'
-app.config['SESSION_PERMANENT']          = True
-app.config['SESSION_TYPE']               = 'filesystem'
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(minutes=30)
-Session(app)
+sessions.init_app(app)     # server-side store, see sessions.py
 
 BLOCK_LENGTH = 30  # fixed global block length
 
@@ -38,64 +61,35 @@ def format_datetime(value, fmt='%Y-%m-%d %H:%M:%S'):
         return 'NA'
 app.jinja_env.filters['format_datetime'] = format_datetime
 
-# ─── Before each request: auto‐transition + notifications ────────────────────
+# ─── Before each request: background workers ────────────────────────────────
+# Status transitions are applied by the background scheduler (scheduler.py);
+# notifications reach the browser over /notifications/stream.
 @app.before_request
-def process_transitions():
-    g.notifications = []
-    # allow login/logout without blocking
-    if request.endpoint in ('login', 'logout', 'static'):
-        return
-    if 'user' not in session:
-        return
-    now_str = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
-
-    # Pending → In Progress
-    rows = dbselect(
-        "SELECT UserTaskID FROM mmungoshi_user_task "
-        "WHERE TaskStatus='pending' AND TaskStartTime <= %s",
-        [now_str]
-    )
-    if rows:
-        ids = [str(r['UserTaskID']) for r in rows]
-        dbupdate(
-            f"UPDATE mmungoshi_user_task "
-            f"SET TaskStatus='in_progress' "
-            f"WHERE UserTaskID IN ({','.join(ids)})"
-        )
-        for r in rows:
-            g.notifications.append({
-                'Type':       'started',
-                'UserTaskID': r['UserTaskID'],
-                'CreatedAt':  now_str
-            })
-
-    # In Progress → Completed
-    rows2 = dbselect(
-        "SELECT UserTaskID FROM mmungoshi_user_task "
-        "WHERE TaskStatus='in_progress' AND TaskEndTime <= %s",
-        [now_str]
-    )
-    if rows2:
-        ids2 = [str(r['UserTaskID']) for r in rows2]
-        dbupdate(
-            f"UPDATE mmungoshi_user_task "
-            f"SET TaskStatus='completed' "
-            f"WHERE UserTaskID IN ({','.join(ids2)})"
-        )
-        for r in rows2:
-            g.notifications.append({
-                'Type':       'complete_reminder',
-                'UserTaskID': r['UserTaskID'],
-                'CreatedAt':  now_str
-            })
+def start_scheduler():
+    if os.getenv('SHIBUI_SCHEDULER', 'thread') != 'off':
+        scheduler.ensure_started()
+
+@app.after_request
+def sql_timing(response):
+    # per-request query count/time (see sqlstats.py); streamed bodies are
+    # generated after this runs, so they only report the queries made so far
+    stats = g.get('_sqlstats')
+    if stats is not None:
+        response.headers.add('Server-Timing', stats.server_timing())
+        if stats.repeated or stats.n_plus_one:
+            sqlstats.report(stats, request.endpoint)
+    return response
 
 # ─── Inject into templates ────────────────────────────────────────────────────
 @app.context_processor
 def inject_user():
+    # the session only holds UserID/UserType; the rest of the row comes from the catalog
+    me = session.get('user')
+    if me is not None:
+        me = catalog.get_user(me['UserID']) or me
     return {
-        'me':            session.get('user'),
-        'mode':          session.get('mode'),
-        'notifications': g.get('notifications', [])
+        'me':            me,
+        'mode':          session.get('mode')
     }
 
 @app.context_processor
@@ -106,11 +100,14 @@ def inject_now():
 # ─── Authentication & mode ───────────────────────────────────────────────────
 def checkSession():
     if 'active' in session:
-        if time.time() - session['active'] > 1800:
+        now = time.time()
+        if now - session['active'] > 1800:
             flash('Your session has timed out.')
             session.clear()
             return False
-        session['active'] = time.time()
+        # refreshing at most once a minute keeps most requests from rewriting the session
+        if now - session['active'] > 60:
+            session['active'] = now
         return True
     return False
 
@@ -122,7 +119,9 @@ def login():
 
         u = user()
         if u.tryLogin(email, pw):
-            session['user']   = u.data[0]
+            session.regenerate()        # a pre-login session id is never reused
+            session['user']   = {'UserID':   u.data[0]['UserID'],
+                                 'UserType': u.data[0]['UserType']}
             session['mode']   = 'Flow'
             session['active'] = time.time()
             session.permanent = True
@@ -176,22 +175,25 @@ def manage_user():
             return redirect(url_for('manage_user'))
 
     # ───────────────────────── DELETE (POST) ───────────────────────
+    # the user and everything they own go in one transaction (deletes.py)
     if action == 'delete' and request.method == 'POST':
-        conn = dbconnect()                      # ← same-file helper
-        try:
-            with conn.cursor() as cur:
-                # 1) remove feedback and assignments first
-                cur.execute("DELETE FROM mmungoshi_feedback   WHERE UserID = %s", (pkval,))
-                cur.execute("DELETE FROM mmungoshi_user_task  WHERE UserID = %s", (pkval,))
-            conn.commit()
-        finally:
-            conn.close()
-
-        # 2) now delete the user
-        o.deleteById(pkval)
+        if not (pkval or '').isdigit():
+            flash("No user selected to delete.", "danger")
+            return redirect(url_for('manage_user'))
+        deletes.delete_users([pkval])
         flash("User and related tasks/feedback deleted.", "warning")
         return redirect(url_for('manage_user'))
 
+    if action == 'delete_many' and request.method == 'POST':
+        me_id  = session['user']['UserID']
+        admins = {u['UserID'] for u in catalog.users() if u['UserType'] == 'Administrator'}
+        ids    = [int(i) for i in request.form.getlist('pkval') if i.isdigit()]
+        keep   = [i for i in ids if i in admins and i != me_id]
+        counts = deletes.delete_users([i for i in ids if i not in keep])
+        flash(f"{counts.get('user', 0)} users and their tasks/feedback deleted"
+              + (f"; {len(keep)} other administrators left alone." if keep else "."), "warning")
+        return redirect(url_for('manage_user'))
+
     # ───────────────────────── INSERT ──────────────────────────────
     if action == 'insert':
         if request.method == 'POST':
@@ -224,10 +226,10 @@ def manage_user():
                 'UserEmail':     request.form.get('UserEmail'),
                 'UserType':      new_type,
                 'UserPassword':  request.form.get('UserPassword'),
-                'UserPassword2': request.form.get('UserPassword2')
+                'UserPassword2': request.form.get('UserPassword2'),
+                'Version':       request.form.get('Version')
             })
-            if o.verify_update():
-                o.update()
+            if o.verify_update() and o.update():
                 flash("User updated.")
                 return redirect(url_for('manage_user'))
         else:
@@ -253,8 +255,7 @@ def manage_user():
 def list_tasks():
     if not checkSession() or session['user']['UserType']!='Administrator':
         return redirect(url_for('login'))
-    t = task(); t.getAll()
-    return render_template('tasks/list.html', tasks=t.data)
+    return render_template('tasks/list.html', tasks=catalog.tasks())
 
 @app.route('/tasks/manage', methods=['GET', 'POST'])
 def manage_task():
@@ -290,50 +291,32 @@ def manage_task():
                 'TaskCategory':     request.form['TaskCategory'],
                 'TaskSubcategory':  request.form['TaskSubcategory'],
                 'DefaultIntensity': request.form['DefaultIntensity'],
-                'DefaultDuration':  request.form['DefaultDuration']
+                'DefaultDuration':  request.form['DefaultDuration'],
+                'Version':          request.form.get('Version')
             }]
-            if obj.verify_new():
-                obj.update()
+            if obj.verify_new() and obj.update():
                 flash("Task updated!", "success")
                 return redirect(url_for('list_tasks'))
         return render_template('tasks/manage.html', obj=obj)
 
     # ───────────────────────── DELETE ─────────────────────────
-    if action == 'delete' and pk and request.method == 'POST':
-
-        conn = dbconnect()                     # <-- open a fresh connection
-        try:
-            with conn.cursor() as cur:
-
-                # 1) delete feedback rows linked to this task
-                cur.execute(
-                    """
-                    DELETE f
-                    FROM   mmungoshi_feedback  AS f
-                    JOIN   mmungoshi_user_task AS ut
-                        ON ut.UserTaskID = f.UserTaskID
-                    WHERE  ut.TaskID = %s
-                    """,
-                    (pk,)
-                )
-
-                # 2) delete assignments for this task
-                cur.execute(
-                    "DELETE FROM mmungoshi_user_task WHERE TaskID = %s",
-                    (pk,)
-                )
-
-            conn.commit()                      # commit both deletes
-        finally:
-            conn.close()                       # always close the connection
-
-        # 3) delete the master task (now orphan-free)
-        t = task()
-        t.deleteById(pk)
+    # the task, its assignments and their feedback go in one transaction (deletes.py)
+    if action in ('delete', 'delete_many') and request.method == 'POST':
+        # a task delete takes every user's assignments with it: administrators only
+        if not checkSession() or session['user']['UserType'] != 'Administrator':
+            return redirect(url_for('login'))
 
+    if action == 'delete' and pk and request.method == 'POST':
+        deletes.delete_tasks([pk])
         flash("Task and related assignments/feedback deleted.", "warning")
         return redirect(url_for('list_tasks'))
 
+    if action == 'delete_many' and request.method == 'POST':
+        ids = [int(i) for i in request.form.getlist('pk') if i.isdigit()]
+        counts = deletes.delete_tasks(ids)
+        flash(f"{counts.get('task', 0)} tasks and {counts.get('user_task', 0)} assignments deleted.", "warning")
+        return redirect(url_for('list_tasks'))
+
 
     # ───────────────────────── FALLBACK ───────────────────────
     return redirect(url_for('list_tasks'))
@@ -353,6 +336,19 @@ def _clean_status(val: str, default: str = 'pending') -> str:
     val = (val or default).strip().lower()
     return val if val in VALID_STATUSES else default
 
+def _overlap_message(uid, start, end, ignore=None):
+    """Why [start, end) cannot be booked for uid (see intervals.py), or None if it is free."""
+    if request.form.get('AllowOverlap'):
+        return None
+    clashes = intervals.conflicts(uid, start, end, ignore)
+    if not clashes:
+        return None
+    minutes = int((end - start).total_seconds() // 60)
+    free = intervals.nearest_free(uid, start, minutes, ignore)
+    when = ', '.join(c['TaskStartTime'].strftime('%a %H:%M') for c in clashes[:3])
+    return (f"This overlaps {len(clashes)} other assignment(s) ({when}). "
+            f"Nearest free slot: {free:%Y-%m-%d %H:%M}. Tick \"Schedule anyway\" to keep this time.")
+
 
 @app.route('/user_tasks/manage', methods=['GET', 'POST'])
 def manage_user_task():
@@ -371,9 +367,9 @@ def manage_user_task():
     action = request.args.get('action')          # new | insert | edit | delete
     pkval  = request.args.get('pkval')           # assignment id
 
-    # ─── 2. dropdown choices ─────────────────────────────────────────
-    tm = task();  tm.getAll();   all_tasks = tm.data or []
-    um = user();  um.getAll();   all_users = um.data or []
+    # ─── 2. dropdown choices (cached, see catalog.py) ────────────────
+    all_tasks = catalog.tasks()
+    all_users = catalog.users()
     def _choices():
         return {'users': all_users, 'tasks': all_tasks}
 
@@ -420,8 +416,8 @@ def manage_user_task():
                     if mt.data:
                         mt.data[0]['TaskName'] = new_name
                         if mt.verify_new() or getattr(mt, 'verify_update', lambda: True)():
-                            mt.update()          # commit the change
-                            master['TaskName'] = new_name        # keep in-memory copy in sync
+                            if mt.update():      # commit the change
+                                master['TaskName'] = new_name    # keep in-memory copy in sync
 
             # overrides / defaults
             intensity = request.form.get('Intensity') or master['DefaultIntensity']
@@ -435,6 +431,37 @@ def manage_user_task():
             dt_end   = dt_start + timedelta(minutes=mins)
             status   = _clean_status(request.form.get('TaskStatus'))  # ← normalised
 
+            # repeating assignment: store the rule and materialise its occurrences
+            freq = request.form.get('RepeatFreq', 'none')
+            if freq in recurrence.FREQS:
+                rule = recurrence()
+                rule.data = [{
+                    'UserID':    target_user,
+                    'TaskID':    master_id,
+                    'StartsOn':  dt_start.strftime('%Y-%m-%d'),
+                    'StartTime': dt_start.strftime('%H:%M:%S'),
+                    'Duration':  mins,
+                    'Intensity': intensity,
+                    'Freq':      freq,
+                    'Every':     request.form.get('RepeatEvery') or 1,
+                    'Weekdays':  ','.join(request.form.getlist('RepeatWeekdays')) if freq == 'weekly' else None,
+                    'Until':     request.form.get('RepeatUntil') or None,
+                    'MaxCount':  request.form.get('RepeatCount') or None,
+                    'Generated': 0,
+                    'Active':    1,
+                }]
+                if rule.verify_new():
+                    rule.insert()
+                    made = recurrence()
+                    created = made.materialise(rule.data[0][rule.pk],
+                                               allow_overlap=bool(request.form.get('AllowOverlap')))
+                    skipped = f', {made.skipped} skipped (overlapping)' if made.skipped else ''
+                    flash(f'{created} repeating assignments scheduled from {date_str} at {time_str}{skipped}',
+                          'success')
+                    return redirect(url_for('list_user_tasks', user_id=filter_user))
+                obj.errors = rule.errors
+                return render_template('user_tasks/add.html', obj=obj, user_id=filter_user)
+
             ut = user_task()
             ut.data = [{
                 'UserID':         target_user,
@@ -445,6 +472,11 @@ def manage_user_task():
                 'ActualDuration': duration,
                 'TaskStatus':     status
             }]
+            clash = _overlap_message(target_user, dt_start, dt_end)
+            if clash:
+                flash(clash, 'danger')
+                obj.data = ut.data
+                return render_template('user_tasks/add.html', obj=obj, user_id=filter_user)
             if ut.verify_new():
                 ut.insert()
                 flash(f'Task scheduled for {date_str} at {time_str}', 'success')
@@ -488,6 +520,7 @@ def manage_user_task():
             duration = str(mins)
             dt_end   = dt_start + timedelta(minutes=mins)
             status   = _clean_status(request.form.get('TaskStatus'))
+            moved    = intervals.span(ut.data[0]) != (dt_start, dt_end)
 
             ut.data = [{
                 'UserTaskID':     pkval,
@@ -497,14 +530,18 @@ def manage_user_task():
                 'TaskEndTime':    dt_end.strftime('%Y-%m-%d %H:%M:%S'),
                 'Intensity':      intensity,
                 'ActualDuration': duration,
-                'TaskStatus':     status
+                'TaskStatus':     status,
+                'Version':        request.form.get('Version')
             }]
-            if ut.verify_new():
-                ut.update()
+            # only a new time is checked: other edits keep whatever the row overlapped before
+            clash = moved and _overlap_message(target_user, dt_start, dt_end, ignore=pkval)
+            if clash:
+                ut.errors = [clash]
+            elif ut.verify_new() and ut.update():
                 flash('Assignment updated.', 'success')
                 return redirect(url_for('list_user_tasks', user_id=filter_user))
 
-            flash('Validation failed — please correct the errors.', 'danger')
+            flash(' '.join(ut.errors) or 'Validation failed — please correct the errors.', 'danger')
 
         ut.choices = _choices()
         return render_template('user_tasks/manage.html', obj=ut, user_id=filter_user)
@@ -513,27 +550,16 @@ def manage_user_task():
     # DELETE  (called from a POST form button)
     # ───────────────────────── DELETE assignment ─────────────────────────
     if action == "delete" and pkval and request.method == "POST":
-        pkval = int(pkval)              # ensure INT, not str
+        ut = user_task();  ut.getById(pkval)
+        if not ut.data:
+            flash('That assignment no longer exists.', 'danger')
+            return redirect(url_for('list_user_tasks', user_id=filter_user))
+        if (not is_admin) and (str(ut.data[0]['UserID']) != str(session['user']['UserID'])):
+            flash('You don’t have permission to delete that assignment.', 'danger')
+            return redirect(url_for('list_user_tasks', user_id=filter_user))
 
-        conn = dbconnect()              # autocommit = False in helper!
-        try:
-            with conn.cursor() as cur:
-                # 1) remove feedback rows
-                cur.execute(
-                    "DELETE FROM mmungoshi_feedback WHERE UserTaskID = %s",
-                    (pkval,)
-                )
-            conn.commit()               # ---- FK now sees no children ----
-
-            with conn.cursor() as cur:
-                # 2) remove the assignment itself
-                cur.execute(
-                    "DELETE FROM mmungoshi_user_task WHERE UserTaskID = %s",
-                    (pkval,)
-                )
-            conn.commit()               # final commit
-        finally:
-            conn.close()
+        # the assignment and its feedback go in one transaction (deletes.py)
+        deletes.delete_assignments([pkval])
 
         flash("Assignment and its feedback deleted.", "warning")
         return redirect(url_for('list_user_tasks', user_id=filter_user))
@@ -552,11 +578,11 @@ def list_user_tasks():
 
     ut = user_task()
 
-    # ─── Handle deletion ────────────────────────────────────────────────────
-    if action == 'delete' and pkval:
+    # ─── Handle deletion (POST; with its feedback, see deletes.py) ──────────
+    if action == 'delete' and pkval and request.method == 'POST':
         if is_admin:
-            ut.deleteById(pkval)
-            flash("Assignment deleted.", "warning")
+            deletes.delete_assignments([pkval])
+            flash("Assignment and its feedback deleted.", "warning")
         else:
             flash("You don't have permission to delete assignments.", "danger")
         return redirect(url_for('list_user_tasks', user_id=user_id_filter))
@@ -564,9 +590,7 @@ def list_user_tasks():
     # ─── Show “New Task” form ───────────────────────────────────────────────
     if action == 'new' and request.method == 'GET':
         ut.createBlank()
-        users = user();   users.getAll()
-        tasks = task();   tasks.getAll()
-        ut.choices = {'users': users.data, 'tasks': tasks.data}
+        ut.choices = {'users': catalog.users(), 'tasks': catalog.tasks()}
         return render_template('user_tasks/add.html', obj=ut)
 
     # ─── Process insertion ─────────────────────────────────────────────────
@@ -591,14 +615,12 @@ def list_user_tasks():
             }]
             if not new_t.verify_new():
                 flash("Error creating master task.", "danger")
-                new_t.choices = {'users': user().getAll() or [], 'tasks': []}
+                new_t.choices = {'users': catalog.users(), 'tasks': []}
                 return render_template('user_tasks/add.html', obj=new_t)
             new_t.insert()
             master = new_t.data[0]
         else:
-            tm = task(); tm.getAll()
-            master_id = request.form['TaskID']
-            master    = next((t for t in tm.data if str(t['TaskID']) == master_id), {})
+            master = catalog.get_task(request.form['TaskID']) or {}
 
         # compute overrides or defaults
         intensity = request.form.get('Intensity') or master.get('DefaultIntensity')
@@ -633,9 +655,7 @@ def list_user_tasks():
             return redirect(url_for('list_user_tasks', user_id=user_id_filter))
 
         if request.method == 'GET':
-            users = user(); users.getAll()
-            tasks = task(); tasks.getAll()
-            ut.choices = {'users': users.data, 'tasks': tasks.data}
+            ut.choices = {'users': catalog.users(), 'tasks': catalog.tasks()}
             return render_template('user_tasks/manage.html', obj=ut)
 
         # POST update
@@ -644,10 +664,13 @@ def list_user_tasks():
             'TaskStartTime':  request.form['TaskStartTime'],
             'TaskEndTime':    request.form['TaskEndTime'],
             'Intensity':      request.form['Intensity'],
-            'ActualDuration': request.form['Duration']
+            'ActualDuration': request.form['Duration'],
+            'Version':        request.form.get('Version')
         })
-        ut.update()
-        flash("Assignment updated.", "success")
+        if ut.update():
+            flash("Assignment updated.", "success")
+        else:
+            flash(' '.join(ut.errors), "danger")
         return redirect(url_for('list_user_tasks', user_id=user_id_filter))
 
     # ─── Final list of assignments ──────────────────────────────────────────
@@ -678,24 +701,34 @@ def list_user_tasks():
     LEFT JOIN mmungoshi_feedback AS f ON f.UserTaskID = ut.UserTaskID
     """
 
-    params = []
+    # keyset pagination on (TaskStartTime, UserTaskID), newest first
+    keys  = ['TaskStartTime', 'UserTaskID']
+    limit = pagination.clamp_limit(request.args.get('limit'))
+    after = pagination.decode_cursor(request.args.get('after'), len(keys))
+
+    where, params = [], []
     if uid is not None:
-        base_q += "\nWHERE ut.UserID = %s"
+        where.append("ut.UserID = %s")
         params.append(uid)
+    if after is not None:
+        clause, key_params = pagination.keyset_clause([f"ut.{k}" for k in keys], after, descending=True)
+        where.append(clause)
+        params.extend(key_params)
+    if where:
+        base_q += "\nWHERE " + " AND ".join(where)
 
-    base_q += "\nORDER BY ut.TaskStartTime DESC"
+    base_q += "\nORDER BY ut.TaskStartTime DESC, ut.UserTaskID DESC\nLIMIT %s"
+    params.append(limit + 1)
 
-    rows = dbselect(base_q, params)
+    # slotted rows: the admin "all users" page holds up to a full page of them
+    rows, next_after = pagination.next_cursor(list(dbselect(base_q, params, slots=True)), keys, limit)
 
     # Split into the two lists
     flow_tasks   = [r for r in rows if r['TaskCategory'] == 'Flow']
     motion_tasks = [r for r in rows if r['TaskCategory'] == 'Motion']
 
     # Build user list for admin dropdown
-    users = []
-    if is_admin:
-        um = user(); um.getAll()
-        users = um.data
+    users = catalog.users() if is_admin else []
 
     # Render
     return render_template(
@@ -703,20 +736,50 @@ def list_user_tasks():
         flow_tasks=flow_tasks,
         motion_tasks=motion_tasks,
         users=users,
-        user_id_filter=user_id_filter
+        user_id_filter=user_id_filter,
+        next_after=next_after
     )
 
 # ─── Planner ─────────────────────────────────────────────────────────────────
+PLANNER_VIEWS = ('day', 'week', 'month')
+
+def _planner_window(view, anchor):
+    """[start, end) of the day / week (from Monday) / month containing anchor, plus the previous window's start."""
+    if view == 'day':
+        start = anchor
+        end   = start + timedelta(days=1)
+        prev  = start - timedelta(days=1)
+    elif view == 'week':
+        start = anchor - timedelta(days=anchor.weekday())
+        end   = start + timedelta(days=7)
+        prev  = start - timedelta(days=7)
+    else:
+        start = anchor.replace(day=1)
+        end   = (start + timedelta(days=32)).replace(day=1)
+        prev  = (start - timedelta(days=1)).replace(day=1)
+    return start, end, prev
+
 @app.route('/planner')
 def planner():
+    # ?view=day|week|month&date=YYYY-MM-DD  (default: this week)
     if not checkSession():
         return redirect(url_for('login'))
 
     uid  = session['user']['UserID']
     mode = session.get('mode')
+    view = request.args.get('view', 'week')
+    if view not in PLANNER_VIEWS:
+        view = 'week'
+    try:
+        anchor = date.fromisoformat(request.args.get('date', ''))
+    except ValueError:
+        anchor = date.today()
+    start, end, prev = _planner_window(view, anchor)
 
-    query = """
+    # score columns first (balance.SCORE_SELECT), then what the page shows
+    query = f"""
       SELECT
+        {balance.SCORE_SELECT},
         ut.UserTaskID,
         t.TaskName,
         t.TaskCategory,
@@ -740,87 +803,357 @@ def planner():
       JOIN mmungoshi_task      t ON ut.TaskID       = t.TaskID
       LEFT JOIN mmungoshi_feedback f ON f.UserTaskID = ut.UserTaskID
       WHERE ut.UserID = %s
+        AND ut.TaskStartTime >= %s AND ut.TaskStartTime < %s
         AND t.TaskCategory = %s
       ORDER BY ut.TaskStartTime
     """
 
-    tasks = dbselect(query, [uid, mode])
-    balance_score = compute_balance_score(tasks)
+    # half-open range on (UserID, TaskStartTime): only the window's rows are read.
+    # One tuple fetch feeds both the score arrays and the page's rows.
+    with dbpool.get_pool().cursor(pymysql.cursors.Cursor) as cur:
+        cur.execute(query, [BLOCK_LENGTH, uid, start, end, mode])
+        names = [d[0] for d in cur.description]
+        rows = cur.fetchall()
+    balance_score = balance.score(balance.from_tuples(names, rows), BLOCK_LENGTH)
+    tasks = [dict(zip(names, r)) for r in rows]
 
     return render_template(
         'planner.html',
         tasks=tasks,
-        balance_score=balance_score
+        balance_score=balance_score,
+        view=view,
+        views=PLANNER_VIEWS,
+        window_start=start,
+        window_end=end - timedelta(days=1),
+        prev_date=prev,
+        next_date=end,
+        today=date.today()
     )
 
 # ─── Reporting APIs ──────────────────────────────────────────────────────────
+# These read mmungoshi_daily_rollup (one row per user, day and category, kept
+# current by rollups.py) instead of aggregating the user's whole history; the
+# metrics themselves live in analytics.py.
+def _week_start():
+    return date.today() - timedelta(days=date.today().weekday())
+
+def conditional_report(view=None, *, tables=()):
+    """
+    Conditional GET for a per-user reporting endpoint.  The ETag combines the
+    user's rollup data version (bumped on every change to their rollups),
+    today's date (the default windows move daily) and the query string, so
+    a matching If-None-Match is answered 304 after one keyed lookup, without
+    running the view.  Endpoints that read other tables than the rollups
+    name them (registry kinds) in `tables`; their write stamps
+    (resultcache.table_versions) go into the ETag too.
+    """
+    if view is None:
+        return lambda v: conditional_report(v, tables=tables)
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not checkSession():
+            return view(*args, **kwargs)
+        uid = session['user']['UserID']
+        version = rollups.data_version(uid)     # read first: a later write only makes us conservative
+        if version is None:
+            return view(*args, **kwargs)
+        if tables:
+            stamps = resultcache.table_versions([registry.table_name(k) for k in tables])
+            if stamps is None:
+                return view(*args, **kwargs)
+            version = f"{version}|{sorted(stamps.items())}"
+        tag = hashlib.sha1(
+            f"{request.endpoint}|{uid}|{version}|{date.today()}|{request.query_string.decode()}".encode()
+        ).hexdigest()[:24]
+        if request.if_none_match.contains_weak(tag):
+            resp = Response(status=304)
+        else:
+            resp = make_response(view(*args, **kwargs))
+            if resp.status_code != 200:
+                return resp
+        resp.set_etag(tag, weak=True)
+        resp.headers['Cache-Control'] = 'private, no-cache'
+        resp.vary.add('Cookie')
+        return resp
+    return wrapper
+
 @app.route('/api/daily_streak')
+@conditional_report
 def api_daily_streak():
     if not checkSession():
         return jsonify(error='login'),401
     uid = session['user']['UserID']
-    row = dbselect("""
-      WITH days AS (
-        SELECT DISTINCT DATE(TaskEndTime) d
-        FROM mmungoshi_user_task
-        WHERE UserID=%s AND TaskStatus='completed'
-      ), runs AS (
-        SELECT d, DATE_SUB(d, INTERVAL ROW_NUMBER() OVER (ORDER BY d) DAY) grp
-        FROM days
-      )
-      SELECT COUNT(*) AS streak
-      FROM runs
-      WHERE grp=(SELECT grp FROM runs ORDER BY d DESC LIMIT 1)
-    """, [uid])
-    return jsonify(streak=row[0]['streak'] if row else 0)
+    rows = dbselect(analytics.ROLLUP_SQL + " AND CompletedCount > 0", [uid], cache=True, user_id=uid)
+    return jsonify(streak=analytics.daily_streak(rows))
 
 @app.route('/api/mode_breakdown')
+@conditional_report
 def api_mode_breakdown():
     if not checkSession():
         return jsonify(error='login'),401
     uid = session['user']['UserID']
-    rows = dbselect("""
-      SELECT t.TaskCategory AS mode,
-             SUM(TIMESTAMPDIFF(MINUTE, ut.TaskStartTime, ut.TaskEndTime)) AS total_minutes
-      FROM mmungoshi_user_task ut
-      JOIN mmungoshi_task t ON t.TaskID=ut.TaskID
-      WHERE ut.UserID=%s
-      GROUP BY mode
-    """, [uid])
-    return jsonify(rows)
+    rows = dbselect(analytics.ROLLUP_SQL + " AND TaskCount > 0", [uid], cache=True, user_id=uid)
+    return jsonify(analytics.mode_breakdown(rows))
 
 @app.route('/api/heatmap')
+@conditional_report
 def api_heatmap():
     if not checkSession():
         return jsonify(error='login'),401
     uid = session['user']['UserID']
-    rows = dbselect("""
-      SELECT HOUR(TaskStartTime) AS hr,
-             DAYOFWEEK(TaskStartTime) AS weekday,
-             COUNT(*) AS cnt
-      FROM mmungoshi_user_task
-      WHERE UserID=%s
-      GROUP BY hr,weekday
-    """, [uid])
-    return jsonify(rows)
+    rows = dbselect(analytics.ROLLUP_SQL + " AND TaskCount > 0", [uid], cache=True, user_id=uid)
+    return jsonify(analytics.heatmap(rows))
 
 @app.route('/api/weekly_balance')
+@conditional_report
 def api_weekly_balance():
     if not checkSession():
         return jsonify(error='login'),401
     uid = session['user']['UserID']
-    monday = (date.today() - timedelta(days=date.today().weekday())).isoformat()
-    row = dbselect("""
-      SELECT ROUND(AVG(
-        (f.MoodAfter - f.MoodBefore)*f.Intensity*(f.ActualDuration/%s)
-      ),2) AS score
-      FROM mmungoshi_user_task ut
-      JOIN mmungoshi_feedback f ON f.UserTaskID=ut.UserTaskID
-      WHERE ut.UserID=%s
-        AND f.Timestamp >= %s
-        AND f.Timestamp < DATE_ADD(%s, INTERVAL 7 DAY)
-    """, [BLOCK_LENGTH, uid, monday, monday])
-    return jsonify(week_start=monday, score=row[0]['score'] if row and row[0]['score']!=None else None)
+    monday = _week_start()
+    rows = dbselect(analytics.ROLLUP_SQL + " AND Day >= %s AND Day < DATE_ADD(%s, INTERVAL 7 DAY)",
+                    [uid, monday, monday], cache=True, user_id=uid)
+    return jsonify(week_start=monday.isoformat(),
+                   score=analytics.weekly_balance(rows, monday, BLOCK_LENGTH))
+
+BALANCE_SQL = f"""
+    SELECT {balance.SCORE_SELECT}
+    FROM mmungoshi_user_task ut
+    JOIN mmungoshi_task t ON t.TaskID = ut.TaskID
+    LEFT JOIN mmungoshi_feedback f ON f.UserTaskID = ut.UserTaskID
+    WHERE ut.UserID = %s AND ut.TaskStartTime >= %s
+"""
+
+@app.route('/api/balance')
+@conditional_report(tables=('user_task', 'feedback', 'task'))   # raw rows, not the rollups
+def api_balance():
+    # ?group=week|category|rolling[&window=7]&since=YYYY-MM-DD
+    if not checkSession():
+        return jsonify(error='login'),401
+    uid   = session['user']['UserID']
+    group = request.args.get('group', 'week')
+    since = request.args.get('since') or (date.today() - timedelta(days=182)).isoformat()
+    # plain tuple cursor: the rows go straight into one float matrix
+    with dbpool.get_pool().cursor(pymysql.cursors.Cursor) as cur:
+        cur.execute(BALANCE_SQL, [BLOCK_LENGTH, uid, since])
+        cols = balance.from_cursor(cur)
+
+    if group == 'category':
+        categories = {t['TaskID']: t['TaskCategory'] for t in catalog.tasks()}
+        scores = balance.by_category(cols, BLOCK_LENGTH, categories)
+    elif group == 'rolling':
+        try:
+            window = max(1, min(int(request.args.get('window', 7)), 1000))
+        except ValueError:
+            return jsonify(error='bad parameters'),400
+        scores = balance.rolling(cols, window, BLOCK_LENGTH).tolist()
+    else:
+        group, scores = 'week', balance.by_week(cols, BLOCK_LENGTH)
+    return jsonify(group=group, since=since, overall=balance.score(cols, BLOCK_LENGTH), scores=scores)
+
+@app.route('/api/dashboard')
+@conditional_report
+def api_dashboard():
+    # all four metrics from one read of the user's rollup rows
+    if not checkSession():
+        return jsonify(error='login'),401
+    uid = session['user']['UserID']
+    start = time.perf_counter()
+    rows = dbselect(analytics.ROLLUP_SQL, [uid], cache=True, user_id=uid)
+    fetch_ms = round((time.perf_counter() - start) * 1000, 3)
+    result = analytics.dashboard(rows, _week_start(), BLOCK_LENGTH)
+    result['timings_ms']['fetch'] = fetch_ms
+    return jsonify(result)
+
+@app.route('/api/free_slots')
+def api_free_slots():
+    # ?minutes=30&date=YYYY-MM-DD&days=1&from=06:00&to=22:00[&at=YYYY-MM-DD HH:MM][&limit=50]
+    if not checkSession():
+        return jsonify(error='login'),401
+    uid = session['user']['UserID']
+    try:
+        minutes = max(1, min(int(request.args.get('minutes', BLOCK_LENGTH)), 24 * 60))
+        first   = date.fromisoformat(request.args.get('date') or date.today().isoformat())
+        days    = max(1, min(int(request.args.get('days', 1)), 31))
+        day_from = datetime.strptime(request.args.get('from', '06:00'), '%H:%M').time()
+        day_to   = datetime.strptime(request.args.get('to', '22:00'), '%H:%M').time()
+        limit   = max(1, min(int(request.args.get('limit', 50)), 500))
+        at      = request.args.get('at')
+        at      = datetime.strptime(at, '%Y-%m-%d %H:%M') if at else None
+    except ValueError:
+        return jsonify(error='bad parameters'),400
+
+    now = datetime.now().replace(second=0, microsecond=0)
+    slots = []
+    for i in range(days):
+        day = first + timedelta(days=i)
+        frm = max(datetime.combine(day, day_from), now)
+        to  = datetime.combine(day, day_to)
+        if frm < to:
+            slots += intervals.free_slots(uid, frm, to, minutes, limit - len(slots))
+        if len(slots) >= limit:
+            break
+    result = {'minutes': minutes,
+              'slots': [{'start': s.isoformat(), 'end': e.isoformat()} for s, e in slots]}
+    if at is not None:
+        result['nearest'] = intervals.nearest_free(uid, at, minutes).isoformat()
+    return jsonify(result)
+
+# ─── Auto-plan ───────────────────────────────────────────────────────────────
+def _autoplan(uid, args):
+    # ?days=1|7&date=YYYY-MM-DD&from=06:00&to=22:00&flow_share=0.5&tolerance=0.1&max_minutes=240
+    first = date.fromisoformat(args.get('date') or date.today().isoformat())
+    days  = max(1, min(int(args.get('days', 1)), 14))
+    day_from = datetime.strptime(args.get('from', '06:00'), '%H:%M').time()
+    day_to   = datetime.strptime(args.get('to', '22:00'), '%H:%M').time()
+    share     = float(args.get('flow_share', 0.5))
+    tolerance = float(args.get('tolerance', 0.1))
+    max_minutes = int(args.get('max_minutes') or 0) or None
+
+    cands   = autoplan.candidates(uid, catalog.tasks(), BLOCK_LENGTH)
+    windows = autoplan.free_windows(uid, first, days, day_from, day_to)
+    return autoplan.plan(cands, windows, BLOCK_LENGTH, share, tolerance, max_minutes)
+
+def _plan_item(start, end, c):
+    return {'TaskID': c.task_id, 'TaskName': c.name, 'TaskCategory': c.category,
+            'TaskStartTime': start.strftime('%Y-%m-%d %H:%M:%S'),
+            'TaskEndTime': end.strftime('%Y-%m-%d %H:%M:%S'),
+            'ActualDuration': c.minutes, 'Intensity': round(c.intensity),
+            'ExpectedScore': round(c.value, 2)}
+
+@app.route('/api/autoplan')
+def api_autoplan():
+    if not checkSession():
+        return jsonify(error='login'),401
+    try:
+        result = _autoplan(session['user']['UserID'], request.args)
+    except ValueError:
+        return jsonify(error='bad parameters'),400
+    result['items'] = [_plan_item(*i) for i in result['items']]
+    return jsonify(result)
+
+@app.route('/autoplan', methods=['GET', 'POST'])
+def autoplan_page():
+    # GET proposes a plan; POST books the proposed rows the user kept ticked
+    if not checkSession():
+        return redirect(url_for('login'))
+    uid = session['user']['UserID']
+
+    if request.method == 'POST':
+        rows, taken, unknown = [], intervals.Schedule(datetime.min), 0
+        for value in request.form.getlist('item'):
+            try:
+                task_id, start, minutes = value.split('|')
+                start = datetime.strptime(start, '%Y-%m-%d %H:%M:%S')
+                end = start + timedelta(minutes=int(minutes))
+                task_id = int(task_id)
+            except ValueError:
+                continue            # not a row this page produced
+            if catalog.get_task(task_id) is None:
+                unknown += 1        # deleted since the plan was made, or never a task
+                continue
+            if end <= start or taken.conflicts(start, end) or intervals.conflicts(uid, start, end):
+                continue            # the calendar changed since the plan was made
+            taken.add(len(rows), start, end)
+            rows.append({'UserID': uid, 'TaskID': task_id,
+                         'TaskStartTime': start.strftime('%Y-%m-%d %H:%M:%S'),
+                         'TaskEndTime': end.strftime('%Y-%m-%d %H:%M:%S'),
+                         'TaskStatus': 'pending'})
+        booked = user_task().insertMany(rows)
+        skipped = len(request.form.getlist('item')) - booked - unknown
+        if unknown:
+            flash(f"{unknown} planned blocks skipped: their task no longer exists.", 'warning')
+        flash(f"{booked} planned blocks added" + (f", {skipped} skipped (overlapping or invalid)" if skipped else ""),
+              'success')
+        return redirect(url_for('planner', view='week', date=request.form.get('date') or None))
+
+    try:
+        result = _autoplan(uid, request.args)
+    except ValueError:
+        flash('Invalid planning options.', 'danger')
+        result = _autoplan(uid, {})
+    result['items'] = [_plan_item(*i) for i in result['items']]
+    return render_template('autoplan.html', plan=result, args=request.args, today=date.today())
+
+# ─── Notifications ───────────────────────────────────────────────────────────
+# each open stream holds a worker thread: streams are short (browsers reconnect
+# with Last-Event-ID) and capped per worker so normal requests keep threads free
+STREAM_SECONDS = int(os.getenv('SHIBUI_STREAM_SECONDS', 55))
+MAX_STREAMS    = int(os.getenv('SHIBUI_MAX_STREAMS', 16))
+STREAM_RETRY_MS = 30000  # when the cap is reached, try again after this
+_stream_slots  = threading.BoundedSemaphore(MAX_STREAMS)
+
+def _sse(event, data, event_id=None):
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/notifications')
+def list_notifications():
+    if not checkSession():
+        return jsonify(error='login'),401
+    rows, unread = notification().get_unread(session['user']['UserID'])
+    return jsonify(unread=unread, items=[notification.to_event(r) for r in rows])
+
+@app.route('/notifications/read', methods=['POST'])
+def read_notifications():
+    if not checkSession():
+        return jsonify(error='login'),401
+    upto = request.form.get('upto', type=int)
+    notification().mark_read(session['user']['UserID'], upto)
+    return jsonify(ok=True)
+
+@app.route('/notifications/stream')
+def notifications_stream():
+    if not checkSession():
+        return jsonify(error='login'),401
+    uid     = session['user']['UserID']
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    broker  = get_broker()
+
+    def events():
+        # taken inside the generator, so the finally below always gives it back
+        if not _stream_slots.acquire(blocking=False):
+            yield f"retry: {STREAM_RETRY_MS}\n\n"
+            return
+        q = broker.subscribe(uid)
+        try:
+            n = notification()
+            if last_id is None:
+                # first connect: current unread state for the badge and dropdown
+                rows, unread = n.get_unread(uid)
+                items = [notification.to_event(r) for r in rows]
+                top = items[0]['NotificationID'] if items else None
+                yield _sse('snapshot', {'unread': unread, 'items': items}, top)
+            else:
+                # reconnect: replay everything that arrived while we were away, oldest first
+                after = last_id
+                while True:
+                    rows = n.get_since(uid, after)
+                    for r in rows:
+                        ev = notification.to_event(r)
+                        yield _sse('notification', ev, ev['NotificationID'])
+                    if len(rows) < n.REPLAY_PAGE:
+                        break
+                    after = rows[-1]['NotificationID']
+
+            deadline = time.time() + STREAM_SECONDS
+            while time.time() < deadline:
+                try:
+                    ev = q.get(timeout=15)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield _sse('notification', ev, ev['NotificationID'])
+        finally:
+            broker.unsubscribe(uid, q)
+            _stream_slots.release()
+
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 # ─── Feedback Management ─────────────────────────────────────────────────────
 @app.route('/feedback/list', methods=['GET','POST'])
@@ -851,35 +1184,28 @@ def list_feedback():
     action = request.args.get('action')
     pkval  = request.args.get('pkval')
 
-    # ─── Build TaskName map ───────────────────────────────────────────────────
-    tm = task(); tm.getAll()
-    tmap = {t['TaskID']: t['TaskName'] for t in tm.data}
-
-    # ─── Prepare the task‐assignment dropdown (scoped by user_id_filter) ────
-    ut = user_task()
-    if is_admin:
-        if user_id_filter is None:
-            ut.getAll()
+    # ─── Task‐assignment dropdown, loaded only by the forms that show it ────
+    def _choices(uid):
+        # one user's assignments; an admin with no user chosen gets the
+        # newest page of everyone's rather than the whole table
+        tmap = catalog.task_names()
+        ut = user_task()
+        if uid is None:
+            ut.getPage(limit=pagination.MAX_LIMIT, order_by='UserTaskID', descending=True, slots=True)
         else:
-            ut.getByField('UserID', user_id_filter)
-    else:
-        ut.getByField('UserID', session['user']['UserID'])
-
-    fb.choices = {
-        'tasks': [
-            {
-              'UserTaskID': r['UserTaskID'],
-              'TaskName':   tmap.get(r['TaskID'], '')
-            }
-            for r in ut.data
-        ]
-    }
+            ut.getByField('UserID', uid)
+        return {
+            'tasks': [
+                {
+                  'UserTaskID': r['UserTaskID'],
+                  'TaskName':   tmap.get(r['TaskID'], '')
+                }
+                for r in ut.data
+            ]
+        }
 
     # ─── Load user list for admin dropdown ───────────────────────────────────
-    users = []
-    if is_admin:
-        um = user(); um.getAll()
-        users = um.data
+    users = catalog.users() if is_admin else []
 
     # ─── DELETE feedback ─────────────────────────────────────────────────────
     if action == 'delete' and pkval:
@@ -903,6 +1229,7 @@ def list_feedback():
             fb.insert()
             flash("Feedback submitted.")
             return redirect(url_for('list_feedback', user_id=user_id_filter))
+        fb.choices = _choices(target_user)
         return render_template(
             'feedback/add.html',
             obj=fb,
@@ -919,16 +1246,19 @@ def list_feedback():
             'MoodAfter':      request.form['MoodAfter'],
             'ActualDuration': request.form['ActualDuration'],
             'Intensity':      request.form['Intensity'],
-            'Comments':       request.form.get('Comments','').strip()
+            'Comments':       request.form.get('Comments','').strip(),
+            'Version':        request.form.get('Version')
         })
         # allow reassign for admins
         if is_admin and form_user:
             fb.data[0]['UserID'] = target_user
 
-        if fb.verify_update():
-            fb.update()
+        if fb.verify_update() and fb.update():
             flash("Feedback updated.")
             return redirect(url_for('list_feedback', user_id=user_id_filter))
+        for e in fb.errors:
+            flash(e, "danger")
+        fb.choices = _choices(fb.data[0]['UserID'])
         return render_template(
             'feedback/manage.html',
             obj=fb,
@@ -939,6 +1269,7 @@ def list_feedback():
     # ─── SHOW NEW-FEEDBACK FORM ──────────────────────────────────────────────
     if pkval == 'new':
         fb.createBlank()
+        fb.choices = _choices(user_id_filter)
         return render_template(
             'feedback/add.html',
             obj=fb,
@@ -949,6 +1280,7 @@ def list_feedback():
     # ─── SHOW EDIT-FEEDBACK FORM ─────────────────────────────────────────────
     if pkval:
         fb.getById(pkval)
+        fb.choices = _choices(fb.data[0]['UserID'])
         return render_template(
             'feedback/manage.html',
             obj=fb,
@@ -956,108 +1288,174 @@ def list_feedback():
             user_id=user_id_filter
         )
 
-    # ─── FINAL LISTING ────────────────────────────────────────────────────────
-    if is_admin:
-        if user_id_filter is None:
-            fb.getAll()
-        else:
-            fb.getByField('UserID', user_id_filter)
-    else:
-        fb.getByField('UserID', user_id_filter)
+    # ─── FINAL LISTING (keyset-paginated on FeedbackID, newest first) ───────
+    fb.getPage(
+        after=request.args.get('after'),
+        limit=request.args.get('limit'),
+        order_by='FeedbackID',
+        descending=True,
+        where=None if user_id_filter is None else {'UserID': user_id_filter}
+    )
 
     return render_template(
         'feedback/list.html',
         obj=fb,
         users=users,
-        user_id_filter=user_id_filter
+        user_id_filter=user_id_filter,
+        next_after=fb.next_cursor
     )
 
-# ─── Compute Balance Score ───────────────────────────────────────────────────
-def compute_balance_score(tasks):
-    if not tasks:
-        return "NA"
-    total = 0
-    for row in tasks:
-        mb        = row['MoodBefore']; ma = row['MoodAfter']
-        mood_diff = (int(ma)-int(mb)) if (mb is not None and ma is not None) else 0
-        intensity = int(row.get('FeedbackIntensity') or row['DefaultIntensity'] or 1)
-        duration  = int(row.get('ActualDuration') or row['DefaultDuration'] or BLOCK_LENGTH)
-        total    += mood_diff * intensity * (duration / BLOCK_LENGTH)
-    return round(total/len(tasks),2)
+# ─── Metrics ─────────────────────────────────────────────────────────────────
+@app.route('/metrics')
+def metrics():
+    # Prometheus scrape target: with METRICS_TOKEN set it needs that bearer token,
+    # without it only local scrapers are served (query shapes are not public)
+    token = os.getenv('METRICS_TOKEN')
+    if token:
+        allowed = hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    else:
+        allowed = request.remote_addr in ('127.0.0.1', '::1')
+    if not allowed:
+        return Response('unauthorized\n', status=401, mimetype='text/plain')
+    body = sqlstats.render_prometheus(dbpool.get_pool().stats(), resultcache.stats(),
+                                      app.session_interface.stats())
+    return Response(body, mimetype='text/plain; version=0.0.4')
 
 # ─── DB Helpers ─────────────────────────────────────────────────────────────
 
 def dbconnect():
     """
-    Establishes a MySQL connection.
-    - On Render: reads credentials from environment variables.
-    - Locally: falls back to config.yml in the same folder.
+    Checks a MySQL connection out of the shared pool (see dbpool.py).
+    Calling close() on it hands it back to the pool instead of hanging up.
     """
-    if os.getenv("DB_HOST"):  # Render / production
-        return pymysql.connect(
-            host=os.getenv("DB_HOST"),
-            port=int(os.getenv("DB_PORT", 3306)),
-            user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PW"),
-            database=os.getenv("DB_NAME"),
-            autocommit=True
-        )
-    # Fallback for local development
-    cfg_path = Path(__file__).parent / "config.yml"
-    cfg = yaml.safe_load(cfg_path.read_text())["db"]
-    return pymysql.connect(
-        host=cfg["host"],
-        port=cfg.get("port", 3306),
-        user=cfg["user"],
-        password=cfg["pw"],
-        database=cfg["db"],
-        autocommit=True
-    )
-
+    return dbpool.lease()
 
-def dbselect(query, params=None):
-    conn = dbconnect()
-    cursor = conn.cursor(pymysql.cursors.DictCursor)
-    cursor.execute(query, params or [])
-    data = cursor.fetchall()
-    conn.close()
-    return data
 
+def dbselect(query, params=None, cache=False, user_id=None, slots=False):
+    """
+    Run a SELECT and return its rows.  cache=True serves repeat calls from
+    resultcache.py until a write touches one of the tables read; pass the
+    owning user_id so other users' writes leave the entry alone.
+    slots=True returns compact row objects (rows.py) instead of dicts.
+    """
+    def load():
+        if slots:
+            with dbpool.get_pool().cursor(pymysql.cursors.Cursor) as cursor:
+                cursor.execute(query, params or [])
+                return rowtypes.fetch_rows(cursor)
+        with dbpool.get_pool().cursor() as cursor:
+            cursor.execute(query, params or [])
+            return cursor.fetchall()
+    if cache:
+        return resultcache.get_or_load(query, params, user_id, load)
+    return load()
+
+
+def dbstream(query, params=None):
+    """
+    Yield rows one at a time from an unbuffered (server-side) cursor, so
+    memory stays flat however many rows the query returns.
+    """
+    pool = dbpool.get_pool()
+    conn = pool.acquire()
+    finished = False
+    try:
+        cursor = conn.cursor(sqlstats.traced(pymysql.cursors.SSDictCursor))
+        cursor.execute(query, params or [])
+        for row in cursor:
+            yield row
+        cursor.close()
+        finished = True
+    finally:
+        # an abandoned unbuffered result would have to be read to the end
+        # before the connection is usable again; drop it instead
+        pool.release(conn, discard=not finished)
 
-def dbupdate(query, params=None):
-    conn = dbconnect()
-    cursor = conn.cursor()
-    cursor.execute(query, params or [])
-    conn.commit()
-    conn.close()
 
 # ─── Task History ────────────────────────────────────────────────────────────
+TASK_HISTORY_SQL = """
+    SELECT
+      ut.UserTaskID,
+      t.TaskName,
+      t.TaskCategory,
+      ut.TaskStatus,
+      ut.TaskStartTime,
+      ut.TaskEndTime,
+      f.MoodBefore,
+      f.MoodAfter,
+      f.ActualDuration
+    FROM mmungoshi_user_task ut
+    JOIN mmungoshi_task      t ON ut.TaskID = t.TaskID
+    LEFT JOIN mmungoshi_feedback f
+      ON f.UserTaskID = ut.UserTaskID
+    WHERE ut.UserID = %s {keyset}
+    ORDER BY ut.TaskStartTime DESC, ut.UserTaskID DESC
+    {limit}
+"""
+HISTORY_COLUMNS = ['UserTaskID', 'TaskName', 'TaskCategory', 'TaskStatus', 'TaskStartTime',
+                   'TaskEndTime', 'MoodBefore', 'MoodAfter', 'ActualDuration']
+
 @app.route('/task_history')
 def task_history():
     if not checkSession():
         return redirect(url_for('login'))
 
     uid = session['user']['UserID']
-    query = """
-        SELECT
-          ut.UserTaskID,
-          t.TaskName,
-          t.TaskCategory,
-          ut.TaskStatus,
-          ut.TaskStartTime,
-          ut.TaskEndTime,
-          f.MoodBefore,
-          f.MoodAfter,
-          f.ActualDuration
-        FROM mmungoshi_user_task ut
-        JOIN mmungoshi_task      t ON ut.TaskID = t.TaskID
-        LEFT JOIN mmungoshi_feedback f
-          ON f.UserTaskID = ut.UserTaskID
-        WHERE ut.UserID = %s
-        ORDER BY ut.TaskStartTime DESC
-    """
-    tasks = dbselect(query, [uid])
-    return render_template('task_history_view.html', tasks=tasks)
+
+    if request.args.get('all'):
+        # whole history: rows are pulled from a server-side cursor while the
+        # page renders, so the first bytes go out before the last row is read
+        tasks = dbstream(TASK_HISTORY_SQL.format(keyset='', limit=''), [uid])
+        return Response(stream_template('task_history_view.html', tasks=tasks, show_all=True))
+
+    # one keyset page on (TaskStartTime, UserTaskID), newest first
+    keys   = ['TaskStartTime', 'UserTaskID']
+    limit  = pagination.clamp_limit(request.args.get('limit'))
+    after  = pagination.decode_cursor(request.args.get('after'), len(keys))
+    params = [uid]
+    keyset = ''
+    if after is not None:
+        clause, key_params = pagination.keyset_clause([f"ut.{k}" for k in keys], after, descending=True)
+        keyset = 'AND ' + clause
+        params.extend(key_params)
+    params.append(limit + 1)
+    rows = dbselect(TASK_HISTORY_SQL.format(keyset=keyset, limit='LIMIT %s'), params,
+                    cache=True, user_id=uid)
+    tasks, next_after = pagination.next_cursor(list(rows), keys, limit)
+    return render_template('task_history_view.html', tasks=tasks, next_after=next_after)
+
+@app.route('/task_history/export')
+def export_task_history():
+    if not checkSession():
+        return redirect(url_for('login'))
+
+    uid = session['user']['UserID']
+    fmt = request.args.get('format', 'csv')
+    rows = dbstream(TASK_HISTORY_SQL.format(keyset='', limit=''), [uid])
+
+    if fmt == 'ndjson':
+        def body():
+            for row in rows:
+                yield json.dumps(row, default=str) + '\n'
+        mimetype, ext = 'application/x-ndjson', 'ndjson'
+    else:
+        def body():
+            buf = io.StringIO()
+            out = csv.DictWriter(buf, fieldnames=HISTORY_COLUMNS)
+            out.writeheader()
+            for row in rows:
+                out.writerow(row)
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+            yield buf.getvalue()
+        mimetype, ext = 'text/csv', 'csv'
+
+    return Response(
+        stream_with_context(body()),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=task_history.{ext}'}
+    )
 
 if __name__ == '__main__':
     app.run(debug=True)
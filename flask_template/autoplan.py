@@ -0,0 +1,287 @@
+"""
+autoplan.py  –  fill free time with Flow/Motion blocks that maximise expected balance
+
+plan() chooses tasks for each day's free windows so that the expected
+balance contribution of the new assignments, i.e. the sum of their
+balance.py row scores
+
+    expected mood change × intensity × (duration / BLOCK_LENGTH),
+
+is as large as possible while Flow takes `flow_share` ± `tolerance` of the
+planned minutes.  The expected mood change of a task is the user's average
+for it, pulled towards their average for the category (or PRIOR_MOOD) while
+it has few ratings.
+
+Solver: the share constraint is moved into the objective with a Lagrange
+multiplier λ (a Flow block earns λ·(1 - share), a Motion block pays
+λ·share) and, for a given λ, a 0/1 knapsack over BLOCK_LENGTH-sized blocks
+picks each day's tasks.  One NumPy DP serves every day, since best[c] is the
+best value that fits in at most c blocks.  λ is bisected towards the
+smallest value that brings the share within tolerance; the search stops at
+the latency budget (SHIBUI_AUTOPLAN_BUDGET_MS, default 100 ms) with the best
+plan seen so far.  The chosen tasks are then packed into the day's windows,
+longest first.
+
+plan() needs no database; candidates() and free_windows() load its inputs.
+"""
+
+import math
+import os
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from flask_template import intervals
+from flask_template.dbpool import get_pool
+
+BUDGET_MS    = float(os.getenv('SHIBUI_AUTOPLAN_BUDGET_MS', 100))
+PRIOR_MOOD   = 1.0      # expected mood change of a category the user never rated
+PRIOR_WEIGHT = 3        # ratings before a task's own average outweighs its category's
+MAX_ROUNDS   = 40       # bisection steps on λ (each one halves the interval)
+CATEGORIES   = ('Flow', 'Motion')
+
+HISTORY_SQL = """
+    SELECT ut.TaskID, COUNT(*) AS Rated,
+           AVG(f.MoodAfter - f.MoodBefore) AS Mood,
+           AVG(NULLIF(f.Intensity, 0)) AS Intensity
+    FROM mmungoshi_feedback f
+    JOIN mmungoshi_user_task ut ON ut.UserTaskID = f.UserTaskID
+    WHERE ut.UserID = %s AND f.MoodBefore IS NOT NULL AND f.MoodAfter IS NOT NULL
+    GROUP BY ut.TaskID
+"""
+
+
+class Candidate:
+    """A task that may be planned, with its expected row score."""
+
+    def __init__(self, task_id, name, category, minutes, intensity, mood, block_length):
+        self.task_id   = task_id
+        self.name      = name
+        self.category  = category
+        self.minutes   = int(minutes)
+        self.intensity = float(intensity)
+        self.mood      = float(mood)
+        self.blocks    = max(1, math.ceil(self.minutes / block_length))
+        self.value     = self.mood * self.intensity * (self.minutes / block_length)
+
+
+# ─── Inputs ──────────────────────────────────────────────────────────────────
+def candidates(uid, tasks, block_length):
+    """Candidates for the user from catalog task rows and their feedback history."""
+    with get_pool().cursor() as cur:
+        cur.execute(HISTORY_SQL, [uid])
+        history = {r['TaskID']: r for r in cur.fetchall()}
+
+    category = {t['TaskID']: t['TaskCategory'] for t in tasks}
+    sums = {}
+    for task_id, h in history.items():
+        total, count = sums.get(category.get(task_id), (0.0, 0))
+        sums[category.get(task_id)] = (total + float(h['Mood']) * h['Rated'], count + h['Rated'])
+    prior = {c: (total / count if count else PRIOR_MOOD) for c, (total, count) in sums.items()}
+
+    out = []
+    for t in tasks:
+        if t['TaskCategory'] not in CATEGORIES:
+            continue
+        h = history.get(t['TaskID'])
+        base = prior.get(t['TaskCategory'], PRIOR_MOOD)
+        rated = h['Rated'] if h else 0
+        mood = (float(h['Mood']) * rated + base * PRIOR_WEIGHT) / (rated + PRIOR_WEIGHT) if h else base
+        intensity = (h and h['Intensity']) or t['DefaultIntensity'] or 1
+        minutes = t['DefaultDuration'] or block_length
+        out.append(Candidate(t['TaskID'], t['TaskName'], t['TaskCategory'],
+                             minutes, intensity, mood, block_length))
+    return out
+
+
+def free_windows(uid, first, days, day_from, day_to, now=None):
+    """Per day, the user's free (start, end) windows between day_from and day_to (see intervals.py)."""
+    now = now or datetime.now().replace(second=0, microsecond=0)
+    out = []
+    for i in range(days):
+        day = first + timedelta(days=i)
+        frm = max(datetime.combine(day, day_from), now)
+        to = datetime.combine(day, day_to)
+        out.append(intervals.free_slots(uid, frm, to, 1) if frm < to else [])
+    return out
+
+
+def _slots(windows, block_length):
+    """[start, free blocks] per window, starts rounded up to a block boundary."""
+    step = timedelta(minutes=block_length)
+    out = []
+    for start, end in windows:
+        midnight = datetime.combine(start.date(), datetime.min.time())
+        start = midnight + step * math.ceil((start - midnight) / step)
+        n = int((end - start) // step) if end > start else 0
+        if n:
+            out.append([start, n])
+    return out
+
+
+# ─── Solver ──────────────────────────────────────────────────────────────────
+def _knapsack(blocks, values, capacity):
+    """take[i, c]: item i is in the best selection of items 0..i within c blocks."""
+    best = np.zeros(capacity + 1)
+    take = np.zeros((len(blocks), capacity + 1), dtype=bool)
+    for i, (size, value) in enumerate(zip(blocks, values)):
+        if value <= 0 or size > capacity:
+            continue
+        cand = best[:capacity + 1 - size] + value
+        better = cand > best[size:]
+        take[i, size:] = better
+        best[size:] = np.where(better, cand, best[size:])
+    return take
+
+
+def _picked(take, blocks, capacity):
+    out, c = [], capacity
+    for i in range(len(blocks) - 1, -1, -1):
+        if take[i, c]:
+            out.append(i)
+            c -= blocks[i]
+    return out
+
+
+def _pack(slots, chosen, block_length):
+    """Place chosen candidates into the windows, longest first; returns (placed, dropped)."""
+    step = timedelta(minutes=block_length)
+    free = [[start, n] for start, n in slots]
+    placed, dropped = [], 0
+    for c in sorted(chosen, key=lambda c: (-c.blocks, -c.value)):
+        for w in free:
+            if w[1] >= c.blocks:
+                placed.append((w[0], c))
+                w[0] += step * c.blocks
+                w[1] -= c.blocks
+                break
+        else:
+            dropped += 1
+    placed.sort(key=lambda p: p[0])
+    return placed, dropped
+
+
+def plan(cands, days, block_length, flow_share=0.5, tolerance=0.1,
+         max_minutes=None, budget_ms=BUDGET_MS):
+    """
+    Proposed assignments for `days` (a list of each day's free (start, end)
+    windows).  max_minutes caps the planned time per day.  Returns a dict
+    with the items (start, end, candidate) and a summary of the search.
+    """
+    started = time.perf_counter()
+    deadline = started + budget_ms / 1000
+    cands = [c for c in cands if c.category in CATEGORIES]
+    slots = [_slots(w, block_length) for w in days]
+    limit = (max_minutes // block_length) if max_minutes else None
+    caps = [min(sum(n for _, n in s), limit) if limit is not None else sum(n for _, n in s) for s in slots]
+
+    blocks  = np.array([c.blocks for c in cands], dtype=np.int64)
+    values  = np.array([c.value for c in cands], dtype=float)
+    minutes = np.array([c.minutes for c in cands], dtype=float)
+    is_flow = np.array([c.category == 'Flow' for c in cands], dtype=bool)
+    share   = min(max(flow_share, 0.0), 1.0)
+    weight  = np.where(is_flow, 1.0 - share, -share) * blocks
+    capacity = max(caps, default=0)
+
+    def summary(chosen):
+        value = sum(values[p].sum() for p in chosen)
+        flow = sum(minutes[p][is_flow[p]].sum() for p in chosen)
+        total = sum(minutes[p].sum() for p in chosen)
+        got = flow / total if total else share
+        return {'chosen': chosen, 'value': float(value), 'share': float(got),
+                'feasible': bool(abs(got - share) <= tolerance + 1e-9)}
+
+    def evaluate(lam):
+        take = _knapsack(blocks, values + lam * weight, capacity)
+        by_cap = {c: _picked(take, blocks, c) for c in set(caps)}
+        return summary([list(by_cap[c]) for c in caps])
+
+    def repair(result):
+        # one task on one day at a time: add the short category or drop the other,
+        # whichever costs the least value per minute moved, without overshooting
+        chosen = [set(p) for p in result['chosen']]
+        used = [int(blocks[list(p)].sum()) for p in chosen]
+        flow = sum(minutes[list(p)][is_flow[list(p)]].sum() for p in chosen)
+        total = sum(minutes[list(p)].sum() for p in chosen)
+        while total and abs(flow / total - share) > tolerance and time.perf_counter() < deadline:
+            want_flow = flow / total < share
+            move = None
+            for d, picked in enumerate(chosen):
+                for i in range(len(cands)):
+                    if i in picked:
+                        if is_flow[i] == want_flow:
+                            continue
+                        f, t, cost = flow - minutes[i] * is_flow[i], total - minutes[i], values[i]
+                    else:
+                        if is_flow[i] != want_flow or used[d] + blocks[i] > caps[d]:
+                            continue
+                        f, t, cost = flow + minutes[i] * is_flow[i], total + minutes[i], -values[i]
+                    if t and (f / t > share + tolerance if want_flow else f / t < share - tolerance):
+                        continue
+                    cost /= minutes[i]
+                    if move is None or cost < move[0]:
+                        move = (cost, d, i, f, t)
+            if move is None:
+                break
+            _, d, i, flow, total = move
+            if i in chosen[d]:
+                chosen[d].discard(i)
+                used[d] -= blocks[i]
+            else:
+                chosen[d].add(i)
+                used[d] += blocks[i]
+        return summary([sorted(p) for p in chosen])
+
+    rounds, timed_out = 1, False
+    best = first = evaluate(0.0)
+    if not first['feasible'] and len(cands):
+        # λ just beyond this makes every block of the short category worth taking
+        bound = (np.abs(values / blocks).max() + 1.0) / max(min(share, 1.0 - share), 0.05)
+        short = first['share'] < share
+        lo, hi = 0.0, (bound if short else -bound)
+        best, near, far = None, first, None
+        while rounds < MAX_ROUNDS and abs(hi - lo) > 1e-6:
+            if time.perf_counter() >= deadline:
+                timed_out = True
+                break
+            mid = (lo + hi) / 2
+            current = evaluate(mid)
+            rounds += 1
+            if current['feasible']:
+                if best is None or current['value'] > best['value']:
+                    best = current
+                hi = mid            # feasible: try a smaller push
+            elif (current['share'] < share) == short:
+                lo, near = mid, current
+            else:
+                hi, far = mid, current      # pushed past the band: days move in step
+        # the share jumps as whole tasks flip on every day at once; repair the
+        # plans either side of the band one day at a time
+        for side in (near, far):
+            if side is not None:
+                fixed = repair(side)
+                if fixed['feasible'] and (best is None or fixed['value'] > best['value']):
+                    best = fixed
+        if best is None:
+            best = near             # closest we got; reported as not feasible
+
+    items, dropped = [], 0
+    for day_slots, picked in zip(slots, best['chosen']):
+        placed, lost = _pack(day_slots, [cands[i] for i in picked], block_length)
+        dropped += lost
+        items += [(start, start + timedelta(minutes=c.minutes), c) for start, c in placed]
+
+    planned = sum(c.minutes for _, _, c in items)
+    flow = sum(c.minutes for _, _, c in items if c.category == 'Flow')
+    return {
+        'items':          items,
+        'expected_total': round(sum(c.value for _, _, c in items), 2),
+        'expected_score': round(sum(c.value for _, _, c in items) / len(items), 2) if items else "NA",
+        'flow_share':     round(flow / planned, 3) if planned else None,
+        'feasible':       best['feasible'],
+        'complete':       not timed_out,
+        'rounds':         rounds,
+        'dropped':        dropped,
+        'elapsed_ms':     round((time.perf_counter() - started) * 1000, 2),
+    }
@@ -0,0 +1,125 @@
+"""
+balance.py  –  vectorised balance score over columnar NumPy arrays
+
+The balance score of a set of assignments is the mean, over rows, of
+
+    (MoodAfter - MoodBefore) × intensity × (duration / BLOCK_LENGTH)
+
+where a missing mood pair counts as 0, intensity falls back from the
+feedback value to the task default to 1, and duration from the actual
+duration to the task default to one block (zeros fall through like NULLs).
+
+Rows reach the arrays through SCORE_SELECT, which resolves the fallbacks in
+SQL so every value is a number: from_cursor() takes a plain tuple cursor
+running it, and from_tuples() tuple rows whose select list starts with it
+and goes on with display columns (the planner).  Only the score columns
+are read, straight into one float matrix; no dicts are involved.
+
+The overall, rolling, per-category and per-week scores are array operations
+on the result.
+"""
+
+from itertools import chain
+from operator import itemgetter
+
+import numpy as np
+
+# select list for from_cursor(); bind BLOCK_LENGTH to the %s.  Expects the
+# usual aliases: ut = user_task, t = task, f = feedback (LEFT JOIN).
+SCORE_SELECT = """
+    TO_SECONDS(ut.TaskStartTime) - 62167219200 AS StartSec,
+    ut.TaskID,
+    COALESCE(f.MoodAfter - f.MoodBefore, 0) AS Mood,
+    COALESCE(NULLIF(f.Intensity, 0), NULLIF(t.DefaultIntensity, 0), 1) AS Intensity,
+    COALESCE(NULLIF(f.ActualDuration, 0), NULLIF(t.DefaultDuration, 0), %s) AS Duration
+"""
+
+
+class Columns:
+    """Resolved per-row inputs as float arrays, plus optional start times and task ids."""
+
+    def __init__(self, mood, intensity, duration, start=None, task=None):
+        self.mood      = mood
+        self.intensity = intensity
+        self.duration  = duration
+        self.start     = start        # seconds since 1970-01-01 (naive, like the DATETIME column)
+        self.task      = task         # TaskID per row
+
+    def __len__(self):
+        return len(self.mood)
+
+
+# ─── Loading ─────────────────────────────────────────────────────────────────
+SCORE_COLUMNS = ('StartSec', 'TaskID', 'Mood', 'Intensity', 'Duration')
+
+
+def from_tuples(names, rows):
+    """Columns from tuple rows with column `names`; only the SCORE_SELECT columns are read."""
+    idx = [names.index(c) for c in SCORE_COLUMNS]
+    pick = itemgetter(*idx)
+    m = np.fromiter(chain.from_iterable(map(pick, rows)), dtype=float,
+                    count=len(rows) * len(idx)).reshape(len(rows), len(idx))
+    return Columns(m[:, 2], m[:, 3], m[:, 4], m[:, 0], m[:, 1])
+
+
+def from_cursor(cur):
+    """Columns from an executed tuple cursor whose select list includes SCORE_SELECT."""
+    return from_tuples([d[0] for d in cur.description], cur.fetchall())
+
+
+# ─── Scores ──────────────────────────────────────────────────────────────────
+def row_scores(cols, block_length):
+    return cols.mood * cols.intensity * (cols.duration / block_length)
+
+
+def score(cols, block_length):
+    """Mean score rounded to 2 places, or "NA" with no rows."""
+    if not len(cols):
+        return "NA"
+    return round(float(row_scores(cols, block_length).mean()), 2)
+
+
+def from_totals(total, count, block_length):
+    """Mean score from SUM(mood × intensity × duration) and a row count (as kept in the daily rollup)."""
+    return round(float(total) / block_length / count, 2) if count else None
+
+
+def rolling(cols, window, block_length):
+    """Mean of each row and the window-1 rows before it, in start-time order when known."""
+    s = row_scores(cols, block_length)
+    if cols.start is not None:
+        s = s[np.argsort(cols.start, kind='stable')]
+    if not len(s):
+        return s
+    c = np.concatenate(([0.0], np.cumsum(s)))
+    idx = np.arange(1, len(s) + 1)
+    lo = np.maximum(idx - window, 0)
+    return np.round((c[idx] - c[lo]) / (idx - lo), 2)
+
+
+def _grouped(keys, scores):
+    uniq, inverse = np.unique(keys, return_inverse=True)
+    sums = np.bincount(inverse, weights=scores, minlength=len(uniq))
+    counts = np.bincount(inverse, minlength=len(uniq))
+    return uniq, np.round(sums / counts, 2)
+
+
+def by_category(cols, block_length, categories):
+    """{category: score}; categories maps TaskID -> TaskCategory."""
+    if cols.task is None or not len(cols):
+        return {}
+    ids, inverse = np.unique(cols.task, return_inverse=True)
+    labels = np.array([categories.get(int(i), '') for i in ids], dtype=object)[inverse]
+    uniq, means = _grouped(labels.astype(str), row_scores(cols, block_length))
+    return {str(k): float(v) for k, v in zip(uniq, means)}
+
+
+def by_week(cols, block_length):
+    """{week's Monday as YYYY-MM-DD: score}, from the start times."""
+    if cols.start is None or not len(cols):
+        return {}
+    days = np.floor_divide(cols.start, 86400).astype(np.int64)
+    # 1970-01-01 was a Thursday: (days + 3) % 7 is 0 on Mondays
+    mondays = (days - (days + 3) % 7).astype('datetime64[D]')
+    uniq, means = _grouped(mondays, row_scores(cols, block_length))
+    return {str(k): float(v) for k, v in zip(uniq, means)}
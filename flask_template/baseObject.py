@@ -1,88 +1,386 @@
 import pymysql
-import yaml
-from pathlib import Path
+
+from flask_template import registry
+from flask_template import pagination
+from flask_template import identitymap
+from flask_template import rows as rowtypes
+from flask_template.dbpool import get_pool
+
+# callables fn(table, op, keys, rows) run after every write made through a
+# model; op is 'insert', 'update' or 'delete', keys the affected primary keys
+# and rows the written row dicts (None for deletes).  Before-listeners
+# fn(table, op, keys, cols) run ahead of updates and deletes, while the old
+# values can still be read; cols is the set of columns an update changes
+# (None when not known, e.g. for deletes).
+_write_listeners = []
+_before_write_listeners = []
+
+# optional per-row counter for optimistic concurrency (migration 0006): it is
+# left out of self.fields, checked by update() and bumped by every UPDATE
+VERSION_FIELD = 'Version'
+
+
+def _same(a, b):
+    # form values arrive as strings: '5' matches 5, '2025-01-01 09:00:00' a datetime
+    return a == b or (a is not None and b is not None and str(a) == str(b))
+
 
 class baseObject:
+    @staticmethod
+    def add_write_listener(fn):
+        """Register fn to be told about writes (used by caches such as catalog.py)."""
+        if fn not in _write_listeners:
+            _write_listeners.append(fn)
+        return fn
+
+    @staticmethod
+    def add_before_write_listener(fn):
+        """Register fn to run before updates and deletes (used by rollups.py)."""
+        if fn not in _before_write_listeners:
+            _before_write_listeners.append(fn)
+        return fn
+
+    @staticmethod
+    def before_write(tn, op, keys, cols=None):
+        """Run the before-listeners for a write made outside the models (e.g. deletes.py)."""
+        for fn in _before_write_listeners:
+            fn(tn, op, keys, cols)
+
+    @staticmethod
+    def after_write(tn, op, keys, rows=None):
+        """Tell the identity map and the listeners about a write made outside the models."""
+        identitymap.wrote(tn, op, keys, rows)
+        for fn in _write_listeners:
+            fn(tn, op, keys, rows)
+
+    def _writing(self, op, keys, cols=None):
+        baseObject.before_write(self.tn, op, keys, cols)
+
+    def _wrote(self, op, keys, rows=None):
+        baseObject.after_write(self.tn, op, keys, rows)
+
     def setup(self):
         # initialize storage for this object
         self.data = []
         self.errors = []
         self.fields = []
         self.pk = None
+        self.lastrowid = None
+        self.rowcount = 0
+        self.next_cursor = None
+        self.version_field = None
+
+        # rows as last read by getById or written, by str(primary key); bulk
+        # reads are not copied, so their rows are written in full by update()
+        self._loaded = {}
 
-        # load configuration from config.yml located beside this file
-        cfg_path = Path(__file__).parent / "config.yml"
-        raw = cfg_path.read_text()
-        config = yaml.safe_load(raw)
-
-        # table name mapping for this class
-        self.tn = config['tables'][type(self).__name__]
-
-        # establish DB connection
-        db_cfg = config['db']
-        self.conn = pymysql.connect(
-            host=db_cfg['host'],
-            port=db_cfg['port'],
-            user=db_cfg['user'],
-            passwd=db_cfg['pw'],
-            db=db_cfg['db'],
-            autocommit=True
-        )
-        self.cur = self.conn.cursor(pymysql.cursors.DictCursor)
+        # table name mapping for this class (config.yml is parsed once per process)
+        self.tn = registry.table_name(type(self).__name__)
+
+        # connections are checked out of the shared pool per statement
+        self.pool = get_pool()
 
         # load column metadata
         self.getFields()
 
+    def _query(self, sql, params=None, slots=False):
+        """
+        Run one statement on a pooled connection and return its rows: dicts,
+        or with slots=True compact row objects (see rows.py).
+        """
+        if slots:
+            with self.pool.cursor(pymysql.cursors.Cursor) as cur:
+                cur.execute(sql, params)
+                self.lastrowid = cur.lastrowid
+                self.rowcount = cur.rowcount
+                return rowtypes.fetch_rows(cur, self.tn)
+        with self.pool.cursor() as cur:
+            cur.execute(sql, params)
+            self.lastrowid = cur.lastrowid
+            self.rowcount = cur.rowcount
+            return list(cur.fetchall())
+
     def getFields(self):
-        self.fields = []
-        sql = f"DESCRIBE `{self.tn}`;"
-        self.cur.execute(sql)
-        for row in self.cur:
+        # column metadata is cached per table; DESCRIBE only runs on a cold cache
+        meta = registry.get_schema(self.tn, self._describe)
+        self.fields = list(meta['fields'])
+        self.pk = meta['pk']
+        self.version_field = meta.get('version')
+
+    def _describe(self, tn):
+        fields, pk, version = [], None, None
+        sql = f"DESCRIBE `{tn}`;"
+        for row in self._query(sql):
             if row['Extra'] == 'auto_increment':
-                self.pk = row['Field']
+                pk = row['Field']
             elif row['Field'] == 'created_at':
                 continue
+            elif row['Field'] == VERSION_FIELD:
+                version = row['Field']
             else:
-                self.fields.append(row['Field'])
+                fields.append(row['Field'])
+        return fields, pk, version
+
+    # ─── Change tracking ──────────────────────────────────────────
+    def _remember(self, rows):
+        for r in rows:
+            self._loaded[str(r[self.pk])] = r.copy()
+        return rows
+
+    def dirty(self, row):
+        """
+        Fields of row that differ from the copy loaded for its primary key, or
+        every field present if there is no copy (the row was never loaded, or
+        came from getAll/getByField/getPage).
+        """
+        present = [f for f in self.fields if f in row]
+        loaded = self._loaded.get(str(row.get(self.pk)))
+        if loaded is None:
+            return present
+        return [f for f in present if f not in loaded or not _same(row[f], loaded[f])]
+
+    def _expected_version(self, row):
+        if self.version_field is None:
+            return None
+        value = row.get(self.version_field)
+        if value in (None, ''):
+            value = (self._loaded.get(str(row.get(self.pk))) or {}).get(self.version_field)
+        return None if value in (None, '') else int(value)
 
     def set(self, d):
         self.data.append(d)
 
     def insert(self, n=0):
-        cols = ', '.join(f"`{field}`" for field in self.fields)
-        vals_placeholders = ', '.join('%s' for _ in self.fields)
+        # fields the row does not set are left to their column defaults
+        present = [f for f in self.fields if f in self.data[n]]
+        cols = ', '.join(f"`{field}`" for field in present)
+        vals_placeholders = ', '.join('%s' for _ in present)
         sql = f"INSERT INTO `{self.tn}` ({cols}) VALUES ({vals_placeholders});"
-        tokens = [self.data[n][f] for f in self.fields]
-        self.cur.execute(sql, tokens)
-        self.data[n][self.pk] = self.cur.lastrowid
+        tokens = [self.data[n][f] for f in present]
+        self._query(sql, tokens)
+        self.data[n][self.pk] = self.lastrowid
+        self._wrote('insert', [self.lastrowid], [self.data[n]])
         return True
 
     def update(self, n=0):
-        set_clauses = ', '.join(f"`{field}` = %s" for field in self.fields if field in self.data[n])
-        sql = f"UPDATE `{self.tn}` SET {set_clauses} WHERE `{self.pk}` = %s;"
-        params = [self.data[n][field] for field in self.fields if field in self.data[n]]
-        params.append(self.data[n][self.pk])
-        self.cur.execute(sql, params)
+        """
+        Write the fields of self.data[n] that changed since the row was loaded;
+        nothing is sent when none did.  On tables with a Version column the
+        UPDATE only applies if the row still has the version it was read with
+        (the row's own Version value, else the loaded copy's); otherwise it
+        adds an error and returns False.
+        """
+        row = self.data[n]
+        key = row[self.pk]
+        cols = self.dirty(row)
+        if not cols:
+            return True
+        expected = self._expected_version(row)
+
+        self._writing('update', [key], set(cols))
+        set_clauses = ', '.join(f"`{field}` = %s" for field in cols)
+        params = [row[field] for field in cols]
+        if self.version_field:
+            set_clauses += f", `{self.version_field}` = `{self.version_field}` + 1"
+        sql = f"UPDATE `{self.tn}` SET {set_clauses} WHERE `{self.pk}` = %s"
+        params.append(key)
+        if expected is not None:
+            sql += f" AND `{self.version_field}` = %s"
+            params.append(expected)
+        self._query(sql + ";", params)
+
+        if expected is not None and self.rowcount == 0:
+            self.errors.append("This record was changed by someone else in the meantime; "
+                               "reload it and try again.")
+            return False
+        if expected is not None:
+            row[self.version_field] = expected + 1
+        self._loaded[str(key)] = dict(row)
+        self._wrote('update', [key], [row])
+        return True
+
+    # ─── Bulk writes ──────────────────────────────────────────────
+    def insertMany(self, rows=None, chunk_size=500):
+        """
+        Insert rows (default: all of self.data) as multi-row INSERTs in one
+        transaction and back-fill each row's auto-increment key.  Fields
+        missing from a row get their column DEFAULT, as with insert().  Keys
+        are derived from LAST_INSERT_ID(), which InnoDB allocates
+        consecutively for one multi-row INSERT ... VALUES under
+        innodb_autoinc_lock_mode 0 or 1.  Under 2 (interleaved, the MySQL 8
+        default) a concurrent bulk insert may take keys in between, so each
+        chunk's keys are read back instead (see _read_back_keys).
+        """
+        rows = self.data if rows is None else rows
+        if not rows:
+            return 0
+        cols = ', '.join(f"`{field}`" for field in self.fields)
+        with self.pool.transaction():
+            with self.pool.cursor() as cur:
+                cur.execute("SELECT @@auto_increment_increment AS step, "
+                            "@@innodb_autoinc_lock_mode AS lock_mode;")
+                found = cur.fetchone()
+                step, interleaved = found['step'], found['lock_mode'] == 2
+                for i in range(0, len(rows), chunk_size):
+                    chunk = rows[i:i + chunk_size]
+                    values = ', '.join(
+                        '(' + ', '.join('%s' if f in r else 'DEFAULT' for f in self.fields) + ')'
+                        for r in chunk
+                    )
+                    cur.execute(f"INSERT INTO `{self.tn}` ({cols}) VALUES {values}",
+                                [r[f] for r in chunk for f in self.fields if f in r])
+                    if interleaved:
+                        self._read_back_keys(cur, chunk, cur.lastrowid)
+                    else:
+                        for k, r in enumerate(chunk):
+                            r[self.pk] = cur.lastrowid + k * step
+        self._wrote('insert', [r[self.pk] for r in rows], rows)
+        return len(rows)
 
-    def getAll(self):
+    def _read_back_keys(self, cur, chunk, first):
+        # our rows are the ones from LAST_INSERT_ID() on, in order, whose
+        # values match what was sent; rows other sessions slipped in between
+        # do not match and are passed over
+        cur.execute(f"SELECT * FROM `{self.tn}` WHERE `{self.pk}` >= %s ORDER BY `{self.pk}`", [first])
+        found = iter(cur.fetchall())
+        for r in chunk:
+            sent = [f for f in self.fields if f in r]
+            for db in found:
+                if all(_same(r[f], db[f]) for f in sent):
+                    r[self.pk] = db[self.pk]
+                    break
+            else:
+                raise pymysql.err.InternalError(f"could not read back the keys inserted into {self.tn}")
+
+    def updateMany(self, rows=None, chunk_size=500):
+        """
+        Update rows (default: all of self.data) by primary key in one
+        transaction, writing only each row's changed fields (see dirty()) and
+        skipping unchanged rows.  Rows with the same changed columns are
+        written together as UPDATE ... JOIN (SELECT ... UNION ALL SELECT ...).
+        Versions are bumped but not checked.  Returns the number of rows written.
+        """
+        rows = self.data if rows is None else rows
+        groups = {}
+        for r in rows:
+            cols = tuple(self.dirty(r))
+            if cols:
+                groups.setdefault(cols, []).append(r)
+        if not groups:
+            return 0
+        self._writing('update', [r[self.pk] for g in groups.values() for r in g],
+                      {c for cols in groups for c in cols})
+        with self.pool.transaction():
+            with self.pool.cursor() as cur:
+                for cols, group in groups.items():
+                    keys = (self.pk,) + cols
+                    select = 'SELECT ' + ', '.join(f"%s AS `{c}`" for c in keys)
+                    set_clauses = ', '.join(f"t.`{c}` = v.`{c}`" for c in cols)
+                    if self.version_field:
+                        set_clauses += f", t.`{self.version_field}` = t.`{self.version_field}` + 1"
+                    for i in range(0, len(group), chunk_size):
+                        chunk = group[i:i + chunk_size]
+                        sql = (
+                            f"UPDATE `{self.tn}` AS t JOIN ("
+                            + ' UNION ALL '.join([select] * len(chunk))
+                            + f") AS v ON t.`{self.pk}` = v.`{self.pk}` SET {set_clauses};"
+                        )
+                        cur.execute(sql, [r[c] for r in chunk for c in keys])
+        written = [r for g in groups.values() for r in g]
+        for r in written:
+            self._loaded.pop(str(r[self.pk]), None)     # versions moved on
+        identitymap.drop(self.tn, [r[self.pk] for r in written])
+        self._wrote('update', [r[self.pk] for r in written], written)
+        return len(written)
+
+    def deleteByIds(self, ids, chunk_size=1000):
+        """Delete many rows by primary key in one transaction."""
+        ids = list(ids)
+        if not ids:
+            return 0
+        self._writing('delete', ids)
+        deleted = 0
+        with self.pool.transaction():
+            with self.pool.cursor() as cur:
+                for i in range(0, len(ids), chunk_size):
+                    chunk = ids[i:i + chunk_size]
+                    marks = ', '.join('%s' for _ in chunk)
+                    deleted += cur.execute(f"DELETE FROM `{self.tn}` WHERE `{self.pk}` IN ({marks});", chunk)
+        self.data = []
+        for i in ids:
+            self._loaded.pop(str(i), None)
+        self._wrote('delete', ids)
+        return deleted
+
+    def getAll(self, slots=False):
+        # slots=True: compact row objects instead of dicts, for large tables
         sql = f"SELECT * FROM `{self.tn}`;"
-        self.cur.execute(sql)
-        self.data = list(self.cur.fetchall())
+        self.data = self._query(sql, slots=slots)
 
     def getById(self, id):
+        # rows already read in this request come from the identity map
+        row = identitymap.get(self.tn, id)
+        if row is not None:
+            self.data = self._remember([row])
+            return
         sql = f"SELECT * FROM `{self.tn}` WHERE `{self.pk}` = %s;"
-        self.cur.execute(sql, [id])
-        self.data = list(self.cur.fetchall())
+        self.data = self._remember(self._query(sql, [id]))
+        identitymap.put(self.tn, self.pk, self.data)
 
     def getByField(self, field, value):
+        if field == self.pk:
+            return self.getById(value)
+        rows = identitymap.lookup(self.tn, field, value)
+        if rows is not None:
+            self.data = rows
+            return
         sql = f"SELECT * FROM `{self.tn}` WHERE `{field}` = %s;"
-        self.cur.execute(sql, [value])
-        self.data = list(self.cur.fetchall())
+        self.data = self._query(sql, [value])
+        identitymap.put(self.tn, self.pk, self.data, field, value)
+
+    def getPage(self, after=None, limit=pagination.DEFAULT_LIMIT, order_by=None,
+                descending=False, where=None, slots=False):
+        """
+        Keyset-paginated read: up to `limit` rows ordered by (order_by, pk),
+        starting after the cursor token `after`.  `where` is an optional
+        {field: value} equality filter.  Sets self.next_cursor to the token for
+        the following page, or None on the last page.
+        """
+        order_by = order_by or self.pk
+        if order_by not in self.fields and order_by != self.pk:
+            raise ValueError(f"unknown sort column {order_by!r} for {self.tn}")
+        keys = [order_by, self.pk] if order_by != self.pk else [self.pk]
+        limit = pagination.clamp_limit(limit)
+
+        clauses, params = [], []
+        for field, value in (where or {}).items():
+            if field not in self.fields and field != self.pk:
+                raise ValueError(f"unknown filter column {field!r} for {self.tn}")
+            clauses.append(f"`{field}` = %s")
+            params.append(value)
+        start = pagination.decode_cursor(after, len(keys))
+        if start is not None:
+            sql, key_params = pagination.keyset_clause([f"`{k}`" for k in keys], start, descending)
+            clauses.append(sql)
+            params.extend(key_params)
+
+        direction = 'DESC' if descending else 'ASC'
+        sql = f"SELECT * FROM `{self.tn}`"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY " + ", ".join(f"`{k}` {direction}" for k in keys)
+        sql += " LIMIT %s;"
+        params.append(limit + 1)
+        self.data, self.next_cursor = pagination.next_cursor(self._query(sql, params, slots), keys, limit)
+        return self.data
 
     def deleteById(self, id):
+        self._writing('delete', [id])
         sql = f"DELETE FROM `{self.tn}` WHERE `{self.pk}` = %s;"
-        self.cur.execute(sql, [id])
+        self._query(sql, [id])
         self.data = []
+        self._loaded.pop(str(id), None)
+        self._wrote('delete', [id])
 
     def createBlank(self):
         blank = {field: '' for field in self.fields}
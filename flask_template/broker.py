@@ -0,0 +1,91 @@
+"""
+broker.py  –  fan-out of new notifications to open SSE streams
+
+Each worker process runs one tail thread that polls mmungoshi_notification
+for rows above the last ID it has seen (a single indexed range read per
+interval, no matter how many browsers are connected) and hands each row to
+the queues of that user's open /notifications/stream responses.  The thread
+only queries while at least one stream is open.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+
+from flask_template.notification import notification
+
+log = logging.getLogger(__name__)
+
+
+class NotificationBroker:
+    def __init__(self, poll_interval=2.0, queue_size=100):
+        self.poll_interval = poll_interval
+        self.queue_size    = queue_size
+        self._subs   = {}               # UserID -> set of queue.Queue
+        self._lock   = threading.Lock()
+        self._active = threading.Event()
+        self._last_id = None
+
+    def subscribe(self, user_id):
+        q = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subs.setdefault(user_id, set()).add(q)
+            self._active.set()
+        return q
+
+    def unsubscribe(self, user_id, q):
+        with self._lock:
+            subs = self._subs.get(user_id)
+            if subs is not None:
+                subs.discard(q)
+                if not subs:
+                    del self._subs[user_id]
+            if not self._subs:
+                self._active.clear()
+
+    def publish(self, row):
+        with self._lock:
+            targets = list(self._subs.get(row['UserID'], ()))
+        event = notification.to_event(row)
+        for q in targets:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                pass                    # a stalled client just misses the push; it replays on reconnect
+
+    def run_forever(self):
+        while True:
+            self._active.wait()
+            try:
+                n = notification()
+                if self._last_id is None:
+                    self._last_id = n.get_max_id()
+                for row in n.get_after(self._last_id):
+                    self._last_id = row['NotificationID']
+                    self.publish(row)
+            except Exception:
+                log.exception("notification broker poll failed")
+            time.sleep(self.poll_interval)
+            if not self._active.is_set():
+                self._last_id = None    # nobody listening; restart from "now" next time
+
+
+_broker = None
+_broker_pid = None
+_start_lock = threading.Lock()
+
+
+def get_broker():
+    """This process's broker, with its tail thread started (again after a fork)."""
+    global _broker, _broker_pid
+    if _broker_pid != os.getpid():
+        with _start_lock:
+            if _broker_pid != os.getpid():
+                _broker = NotificationBroker()
+                threading.Thread(
+                    target=_broker.run_forever, name='notification-broker', daemon=True
+                ).start()
+                _broker_pid = os.getpid()
+    return _broker
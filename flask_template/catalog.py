@@ -0,0 +1,127 @@
+"""
+catalog.py  –  process-local read-through cache of the task catalog and user directory
+
+Dropdowns on the assignment and feedback pages need every task and user, but
+those tables change rarely.  Each worker keeps one copy of them and reloads
+it when
+- a write goes through a model (baseObject write listener) in this process,
+- another process wrote: every write bumps the table's stamp (versions.py),
+  and the stamp is compared at most every CHECK_EVERY seconds, or
+- the copy is older than CACHE_TTL seconds (a backstop for writes made
+  outside the models).
+
+Callers get fresh dict copies, so they can modify rows freely.  Password
+hashes are never cached.
+"""
+
+import os
+import threading
+import time
+
+from flask_template import registry
+from flask_template import versions
+from flask_template.baseObject import baseObject
+from flask_template.task import task
+from flask_template.user import user
+
+CACHE_TTL   = float(os.getenv('SHIBUI_CATALOG_TTL', 300))
+CHECK_EVERY = float(os.getenv('SHIBUI_CATALOG_CHECK', 2))
+
+
+# ─── Cached tables ───────────────────────────────────────────────────────────
+class CachedTable:
+    def __init__(self, name, model, strip=()):
+        self.name  = name          # model class name, also the version-stamp key
+        self.model = model
+        self.strip = set(strip)    # columns never kept in memory
+        self._lock = threading.Lock()
+        self._rows = None
+        self._by_id = {}
+        self._version = None
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+
+    @property
+    def table(self):
+        return registry.table_name(self.name)
+
+    def _fresh(self, now):
+        if self._rows is None or now - self._loaded_at > CACHE_TTL:
+            return False
+        if now - self._checked_at < CHECK_EVERY:
+            return True
+        self._checked_at = now
+        return versions.read(self.name) == self._version
+
+    def _load(self, now):
+        # read the stamp first: a write landing mid-load bumps it past ours
+        version = versions.read(self.name)
+        m = self.model()
+        m.getAll()
+        self._rows = [{k: v for k, v in r.items() if k not in self.strip} for r in m.data]
+        self._by_id = {r[m.pk]: r for r in self._rows}
+        self._version = version
+        self._loaded_at = self._checked_at = now
+
+    def _current(self):
+        with self._lock:
+            now = time.monotonic()
+            if not self._fresh(now):
+                self._load(now)
+            return self._rows, self._by_id
+
+    def rows(self):
+        rows, _ = self._current()
+        return [dict(r) for r in rows]
+
+    def get(self, key):
+        _, by_id = self._current()
+        row = by_id.get(int(key)) if str(key).isdigit() else by_id.get(key)
+        return dict(row) if row is not None else None
+
+    def invalidate(self):
+        with self._lock:
+            self._rows = None
+
+
+_tasks = CachedTable('task', task)
+_users = CachedTable('user', user, strip=('UserPassword',))
+_caches = (_tasks, _users)
+
+
+@baseObject.add_write_listener
+def _on_write(tn, op, keys, rows):
+    for c in _caches:
+        if c.table == tn:
+            c.invalidate()
+            versions.bump(c.name)
+
+
+# ─── Public API ──────────────────────────────────────────────────────────────
+def tasks():
+    """Every master task (copies)."""
+    return _tasks.rows()
+
+
+def users():
+    """Every user without the password hash (copies)."""
+    return _users.rows()
+
+
+def get_task(task_id):
+    return _tasks.get(task_id)
+
+
+def get_user(user_id):
+    return _users.get(user_id)
+
+
+def task_names():
+    """{TaskID: TaskName} for every task."""
+    rows, _ = _tasks._current()
+    return {r['TaskID']: r['TaskName'] for r in rows}
+
+
+def invalidate():
+    for c in _caches:
+        c.invalidate()
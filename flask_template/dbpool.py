@@ -0,0 +1,270 @@
+"""
+dbpool.py  –  process-wide pool of pymysql connections
+
+Every model object and every dbselect/dbstream call checks a connection out
+of the pool instead of opening its own.  The pool is created lazily per
+process (so each gunicorn worker gets its own after fork), is bounded, pings
+connections that have sat idle for a while, and evicts ones idle too long.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+import pymysql
+from pymysql.constants import SERVER_STATUS
+
+from flask_template import registry
+from flask_template import sqlstats
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes free within the checkout timeout."""
+
+
+# ─── Connection settings ─────────────────────────────────────────────────────
+def connect_kwargs():
+    """
+    pymysql.connect() arguments.
+    - On Render: reads credentials from environment variables.
+    - Locally: falls back to config.yml in the same folder.
+    """
+    if os.getenv("DB_HOST"):
+        return {
+            'host':     os.getenv("DB_HOST"),
+            'port':     int(os.getenv("DB_PORT", 3306)),
+            'user':     os.getenv("DB_USER"),
+            'password': os.getenv("DB_PW"),
+            'database': os.getenv("DB_NAME"),
+        }
+    cfg = registry.get_config()["db"]
+    return {
+        'host':     cfg["host"],
+        'port':     cfg.get("port", 3306),
+        'user':     cfg["user"],
+        'password': cfg["pw"],
+        'database': cfg["db"],
+    }
+
+
+# ─── Pool ────────────────────────────────────────────────────────────────────
+class ConnectionPool:
+    def __init__(self, connect, max_size=10, max_idle=300, ping_after=30, timeout=10):
+        self._connect   = connect          # zero-arg factory returning a new connection
+        self.max_size   = max_size         # hard cap on open connections
+        self.max_idle   = max_idle         # seconds before an idle connection is closed
+        self.ping_after = ping_after       # seconds idle before a health check on checkout
+        self.timeout    = timeout          # seconds to wait for a free connection
+
+        self._idle  = deque()              # (conn, last_used) – most recently used on the right
+        self._open  = 0
+        self._cond  = threading.Condition()
+        self._local = threading.local()    # connection pinned by transaction()
+        self._stats = {
+            'created': 0, 'reused': 0, 'discarded': 0,
+            'evicted': 0, 'failed_pings': 0, 'waits': 0, 'timeouts': 0,
+        }
+
+    # ── checkout / return ───────────────────────────────────────────────────
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                self._evict_idle()
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._open < self.max_size:
+                    self._open += 1
+                    conn = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(f"no free DB connection after {self.timeout}s")
+                self._stats['waits'] += 1
+                self._cond.wait(remaining)
+
+        # network I/O happens outside the lock
+        if conn is not None:
+            if time.monotonic() - last_used < self.ping_after or self._ping(conn):
+                self._stats['reused'] += 1
+                return conn
+            self._close(conn)
+        try:
+            conn = self._connect()
+        except Exception:
+            self._forget()
+            raise
+        self._stats['created'] += 1
+        return conn
+
+    def release(self, conn, discard=False):
+        if not discard and not conn.open:
+            discard = True
+        if not discard and (conn.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS
+                            or not conn.get_autocommit()):
+            # a caller left a transaction open; never hand that to someone else
+            try:
+                conn.rollback()
+                conn.autocommit(True)
+            except Exception:
+                discard = True
+        if discard:
+            self._stats['discarded'] += 1
+            self._close(conn)
+            self._forget()
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Yield a connection; reuses the one pinned by an enclosing transaction()."""
+        pinned = getattr(self._local, 'conn', None)
+        if pinned is not None:
+            yield pinned
+            return
+        conn = self.acquire()
+        try:
+            yield conn
+        except pymysql.err.OperationalError:
+            self.release(conn, discard=True)
+            raise
+        except BaseException:
+            self.release(conn)
+            raise
+        self.release(conn)
+
+    @contextmanager
+    def cursor(self, cursorclass=pymysql.cursors.DictCursor):
+        with self.connection() as conn:
+            cur = conn.cursor(sqlstats.traced(cursorclass))
+            try:
+                yield cur
+            finally:
+                cur.close()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Run a block on one connection inside BEGIN … COMMIT.  Any pool.connection()
+        or pool.cursor() used by the same thread inside the block joins it.
+        """
+        if getattr(self._local, 'conn', None) is not None:
+            yield self._local.conn           # already inside a transaction
+            return
+        with self.connection() as conn:
+            conn.begin()
+            self._local.conn = conn
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                self._local.conn = None
+
+    # ── housekeeping ────────────────────────────────────────────────────────
+    def _evict_idle(self):
+        """Close connections idle longer than max_idle (caller holds the lock)."""
+        cutoff = time.monotonic() - self.max_idle
+        while self._idle and self._idle[0][1] < cutoff:
+            conn, _ = self._idle.popleft()
+            self._open -= 1
+            self._stats['evicted'] += 1
+            self._close(conn)
+
+    def _ping(self, conn):
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception:
+            self._stats['failed_pings'] += 1
+            return False
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _forget(self):
+        with self._cond:
+            self._open -= 1
+            self._cond.notify()
+
+    def close_all(self):
+        with self._cond:
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._open -= 1
+                self._close(conn)
+
+    def stats(self):
+        with self._cond:
+            idle = len(self._idle)
+            return dict(
+                self._stats,
+                open=self._open,
+                idle=idle,
+                in_use=self._open - idle,
+                max_size=self.max_size,
+            )
+
+
+# ─── Per-process singleton ───────────────────────────────────────────────────
+_pool     = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _new_connection():
+    return pymysql.connect(autocommit=True, **connect_kwargs())
+
+
+def get_pool():
+    """Return this process's pool, building a fresh one after a fork."""
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = ConnectionPool(
+                    _new_connection,
+                    max_size=int(os.getenv("DB_POOL_SIZE", 10)),
+                    max_idle=int(os.getenv("DB_POOL_MAX_IDLE", 300)),
+                    ping_after=int(os.getenv("DB_POOL_PING_AFTER", 30)),
+                    timeout=int(os.getenv("DB_POOL_TIMEOUT", 10)),
+                )
+                _pool_pid = os.getpid()
+    return _pool
+
+
+class _Lease:
+    """Connection proxy whose close() returns it to the pool instead of hanging up."""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._conn is not None:
+            self._pool.release(self._conn)
+            self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def lease():
+    pool = get_pool()
+    return _Lease(pool, pool.acquire())
@@ -0,0 +1,163 @@
+"""
+deletes.py  –  cascade deletes of users, tasks and assignments as one unit of work
+
+A user owns their assignments, feedback, notifications, repeat rules and
+rollup rows; a task owns the assignments made from it (with their
+children); an assignment owns its feedback and notifications.
+
+CascadeDelete collects the parents to remove and removes them with all
+their children in one transaction on one pooled connection, children
+first.  Each table gets one set-based statement per kind of parent
+(DELETE ... JOIN on the parent ids, in chunks of CHUNK ids), however many
+parents are listed.  Notifications follow their assignment/user through
+ON DELETE CASCADE.  Any failure rolls the whole delete back.
+
+The ids of the rows that go are read first (FOR UPDATE), so the baseObject
+write listeners (catalog, resultcache, rollups, intervals, identity map)
+hear about every removed row as if the models had deleted it.
+
+    counts = CascadeDelete().users([3, 4]).tasks([12]).commit()
+    counts = delete_assignments([881])
+"""
+
+import logging
+
+import pymysql
+
+from flask_template import registry
+from flask_template import rollups
+from flask_template.baseObject import baseObject
+from flask_template.dbpool import get_pool
+
+log = logging.getLogger(__name__)
+
+CHUNK = 1000            # parent ids per statement
+
+# parent kind -> column of user_task that points at it
+_ASSIGNMENT_COLUMN = {'user': 'UserID', 'task': 'TaskID', 'user_task': 'UserTaskID'}
+
+
+def _chunks(ids):
+    ids = sorted(ids)
+    for i in range(0, len(ids), CHUNK):
+        chunk = ids[i:i + CHUNK]
+        yield ', '.join('%s' for _ in chunk), chunk
+
+
+def _optional_table(kind):
+    # tables added by later migrations may not be configured everywhere
+    try:
+        return registry.table_name(kind)
+    except KeyError:
+        return None
+
+
+class CascadeDelete:
+    def __init__(self):
+        self.parents = {'user': set(), 'task': set(), 'user_task': set()}
+        self.counts = {}
+
+    def users(self, ids):
+        self.parents['user'] |= {int(i) for i in ids}
+        return self
+
+    def tasks(self, ids):
+        self.parents['task'] |= {int(i) for i in ids}
+        return self
+
+    def assignments(self, ids):
+        self.parents['user_task'] |= {int(i) for i in ids}
+        return self
+
+    # ── reading what goes ───────────────────────────────────────────────────
+    def _doomed(self, cur, ut, fb):
+        """(UserTaskIDs, FeedbackIDs) removed by this cascade, locked."""
+        assignments, feedback = set(), set()
+        for kind, col in _ASSIGNMENT_COLUMN.items():
+            for marks, chunk in _chunks(self.parents[kind]):
+                cur.execute(f"SELECT UserTaskID FROM `{ut}` WHERE `{col}` IN ({marks}) FOR UPDATE", chunk)
+                assignments |= {r['UserTaskID'] for r in cur.fetchall()}
+                cur.execute(
+                    f"SELECT f.FeedbackID FROM `{fb}` f JOIN `{ut}` ut ON ut.UserTaskID = f.UserTaskID "
+                    f"WHERE ut.`{col}` IN ({marks}) FOR UPDATE", chunk)
+                feedback |= {r['FeedbackID'] for r in cur.fetchall()}
+        # feedback a user left on someone else's assignment
+        for marks, chunk in _chunks(self.parents['user']):
+            cur.execute(f"SELECT FeedbackID FROM `{fb}` WHERE UserID IN ({marks}) FOR UPDATE", chunk)
+            feedback |= {r['FeedbackID'] for r in cur.fetchall()}
+        return assignments, feedback
+
+    # ── deleting ────────────────────────────────────────────────────────────
+    def _delete(self, cur, name, sql, chunk):
+        self.counts[name] = self.counts.get(name, 0) + cur.execute(sql, chunk)
+
+    def _delete_optional(self, cur, name, sql, chunk):
+        try:
+            self._delete(cur, name, sql, chunk)
+        except pymysql.err.ProgrammingError as exc:
+            # 1146 = table doesn't exist (migration not applied); MySQL only undoes the statement
+            if not (exc.args and exc.args[0] == 1146):
+                raise
+            log.info("skipping %s: table is missing", name)
+
+    def commit(self):
+        """Delete everything collected; returns {table kind: rows deleted}."""
+        ut, fb = registry.table_name('user_task'), registry.table_name('feedback')
+        tables = {kind: registry.table_name(kind) for kind in ('user', 'task')}
+        recurrences = _optional_table('recurrence')
+        pool = get_pool()
+        self.counts = {}
+
+        with pool.transaction():
+            with pool.cursor() as cur:
+                assignments, feedback = self._doomed(cur, ut, fb)
+                announced = [(fb, feedback), (ut, assignments)] + \
+                            [(tables[k], self.parents[k]) for k in ('task', 'user')]
+                for tn, keys in announced:
+                    if keys:
+                        baseObject.before_write(tn, 'delete', sorted(keys))
+
+                for kind, col in _ASSIGNMENT_COLUMN.items():
+                    for marks, chunk in _chunks(self.parents[kind]):
+                        self._delete(cur, 'feedback',
+                                     f"DELETE f FROM `{fb}` f JOIN `{ut}` ut ON ut.UserTaskID = f.UserTaskID "
+                                     f"WHERE ut.`{col}` IN ({marks})", chunk)
+                for marks, chunk in _chunks(self.parents['user']):
+                    self._delete(cur, 'feedback', f"DELETE FROM `{fb}` WHERE UserID IN ({marks})", chunk)
+
+                for kind, col in _ASSIGNMENT_COLUMN.items():
+                    for marks, chunk in _chunks(self.parents[kind]):
+                        self._delete(cur, 'user_task', f"DELETE FROM `{ut}` WHERE `{col}` IN ({marks})", chunk)
+
+                if recurrences:
+                    for kind in ('user', 'task'):
+                        for marks, chunk in _chunks(self.parents[kind]):
+                            self._delete_optional(cur, 'recurrence',
+                                                  f"DELETE FROM `{recurrences}` WHERE `{_ASSIGNMENT_COLUMN[kind]}` "
+                                                  f"IN ({marks})", chunk)
+
+                for kind in ('task', 'user'):
+                    for marks, chunk in _chunks(self.parents[kind]):
+                        self._delete(cur, kind, f"DELETE FROM `{tables[kind]}` "
+                                                f"WHERE `{_ASSIGNMENT_COLUMN[kind]}` IN ({marks})", chunk)
+
+        # caches are told after the commit, so nobody reloads the old rows in between
+        for tn, keys in announced:
+            if keys:
+                baseObject.after_write(tn, 'delete', sorted(keys))
+        if self.parents['user']:
+            rollups.drop_users(self.parents['user'])
+        return self.counts
+
+
+# ─── Shortcuts ───────────────────────────────────────────────────────────────
+def delete_users(ids):
+    return CascadeDelete().users(ids).commit()
+
+
+def delete_tasks(ids):
+    return CascadeDelete().tasks(ids).commit()
+
+
+def delete_assignments(ids):
+    return CascadeDelete().assignments(ids).commit()
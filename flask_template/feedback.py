@@ -73,8 +73,7 @@ class feedback(baseObject):
         if not self.verify_update(0):
             return False
 
-        self.update(0)
-        return True
+        return self.update(0)
 
     def delete_feedback_by_id(self, feedback_id: int) -> bool:
         self.deleteById(feedback_id)
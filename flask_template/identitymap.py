@@ -0,0 +1,114 @@
+"""
+identitymap.py  –  per-request map of rows already read through the models
+
+Within one request, baseObject.getById / getByField look here first, so
+reading the same row (or the same field lookup) twice costs one query.
+The map lives on flask.g and is dropped with the request; outside a request
+(scheduler, scripts) every call is a no-op and the models always query.
+
+Writes made through the models keep it coherent: updated rows have their
+written fields merged in, inserted and deleted rows are dropped,
+and every write to a table forgets that table's field lookups.  Code that
+writes with raw SQL during a request should call forget().
+
+Rows are stored and handed out as copies, so callers can modify
+model.data as freely as before.
+"""
+
+from flask import g, has_request_context
+
+_KEY = '_identity_map'
+
+
+class _Map:
+    def __init__(self):
+        self.rows   = {}      # (table, str(pk)) -> row
+        self.fields = {}      # (table, field, str(value)) -> [str(pk), ...]
+        self.hits   = 0
+
+
+def _current():
+    if not has_request_context():
+        return None
+    m = g.get(_KEY)
+    if m is None:
+        m = _Map()
+        setattr(g, _KEY, m)
+    return m
+
+
+# ─── Reads ───────────────────────────────────────────────────────────────────
+def get(tn, pk):
+    """A copy of the row with this primary key, or None if it was not read yet."""
+    m = _current()
+    row = m.rows.get((tn, str(pk))) if m is not None else None
+    if row is None:
+        return None
+    m.hits += 1
+    return dict(row)
+
+
+def lookup(tn, field, value):
+    """Copies of the rows an earlier getByField(field, value) returned, or None."""
+    m = _current()
+    if m is None:
+        return None
+    pks = m.fields.get((tn, field, str(value)))
+    if pks is None or any((tn, pk) not in m.rows for pk in pks):
+        return None
+    m.hits += 1
+    return [dict(m.rows[(tn, pk)]) for pk in pks]
+
+
+def put(tn, pk_field, rows, field=None, value=None):
+    """Remember rows read by primary key (and, with field/value, the lookup that found them)."""
+    m = _current()
+    if m is None:
+        return
+    for r in rows:
+        m.rows[(tn, str(r[pk_field]))] = dict(r)
+    if field is not None:
+        m.fields[(tn, field, str(value))] = [str(r[pk_field]) for r in rows]
+
+
+def hits():
+    m = _current()
+    return m.hits if m is not None else 0
+
+
+# ─── Keeping it coherent ─────────────────────────────────────────────────────
+def wrote(tn, op, keys, rows=None):
+    """Apply a model write (same arguments as baseObject write listeners)."""
+    m = _current()
+    if m is None:
+        return
+    m.fields = {k: v for k, v in m.fields.items() if k[0] != tn}
+    for i, key in enumerate(keys):
+        k = (tn, str(key))
+        if op != 'update':
+            m.rows.pop(k, None)      # inserted rows get their defaults from MySQL: read them back
+        elif k in m.rows:
+            cached = m.rows[k]
+            cached.update((c, v) for c, v in rows[i].items() if c in cached)
+
+
+def drop(tn, keys):
+    """Forget single rows, e.g. after a write whose resulting values are not known."""
+    m = _current()
+    if m is None:
+        return
+    for key in keys:
+        m.rows.pop((tn, str(key)), None)
+
+
+def forget(tn=None):
+    """Drop everything known about one table (or all of them)."""
+    m = _current()
+    if m is None:
+        return
+    if tn is None:
+        m.rows.clear()
+        m.fields.clear()
+        return
+    m.rows = {k: v for k, v in m.rows.items() if k[0] != tn}
+    m.fields = {k: v for k, v in m.fields.items() if k[0] != tn}
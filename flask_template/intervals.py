@@ -0,0 +1,306 @@
+"""
+intervals.py  –  per-user index of upcoming assignments for conflict checks
+
+Each worker keeps, per user, the [TaskStartTime, TaskEndTime) spans of
+their assignments that end after yesterday's midnight, in two sorted lists
+(by start and by end).  Lookups bisect into them instead of querying:
+- conflicts(uid, start, end):      assignments overlapping a span,
+- nearest_free(uid, start, mins):  the free slot closest to a wanted start,
+- free_slots(uid, frm, to, mins):  every gap of at least `mins` in a window.
+Each lookup is a binary search plus a walk over the assignments it actually
+steps across (spans start at most `longest` before the point of interest,
+so nothing further back is visited).  Spans longer than LONG_SPAN (a
+multi-day block, say) are kept in lists of their own and always scanned,
+so one of them cannot stretch `longest` and make every lookup linear.
+
+The index is kept in sync like catalog.py: model writes to user_task are
+applied in place (baseObject write listener) and bump the user's stamp in
+versions.py so other workers reload; the stamp is compared at most every
+CHECK_EVERY seconds and an index older than CACHE_TTL is always rebuilt.
+Code that writes assignments with raw SQL should call invalidate().
+"""
+
+import bisect
+import heapq
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from flask_template import registry
+from flask_template import versions
+from flask_template.baseObject import baseObject
+from flask_template.dbpool import get_pool
+
+MAX_USERS   = int(os.getenv('SHIBUI_INTERVALS_MAX', 1000))      # indexes kept per worker
+CACHE_TTL   = float(os.getenv('SHIBUI_INTERVALS_TTL', 300))
+CHECK_EVERY = float(os.getenv('SHIBUI_INTERVALS_CHECK', 2))
+LONG_SPAN   = timedelta(hours=float(os.getenv('SHIBUI_INTERVALS_LONG_HOURS', 24)))  # kept apart, see Schedule
+
+# an assignment without an end time lasts its logged or default duration
+UPCOMING_SQL = """
+    SELECT ut.UserTaskID, ut.TaskStartTime, ut.TaskEndTime,
+           COALESCE(f.ActualDuration, t.DefaultDuration) AS ActualDuration
+    FROM {ut} AS ut
+    LEFT JOIN {t} AS t ON t.TaskID = ut.TaskID
+    LEFT JOIN {f} AS f ON f.UserTaskID = ut.UserTaskID
+    WHERE ut.UserID = %s
+      AND (ut.TaskEndTime > %s OR (ut.TaskEndTime IS NULL AND ut.TaskStartTime > %s))
+"""
+
+
+def _dt(value):
+    if isinstance(value, str):
+        return datetime.strptime(value[:19], '%Y-%m-%d %H:%M:%S' if len(value) > 16 else '%Y-%m-%d %H:%M')
+    return value
+
+
+def span(row):
+    """(start, end) of an assignment row, or None if it has no start time."""
+    start = _dt(row.get('TaskStartTime'))
+    if start is None:
+        return None
+    end = _dt(row.get('TaskEndTime'))
+    if end is None:
+        end = start + timedelta(minutes=int(row.get('ActualDuration') or 0))
+    return start, max(start, end)
+
+
+# ─── One user's spans ────────────────────────────────────────────────────────
+class Schedule:
+    def __init__(self, since, rows=()):
+        self.since      = since
+        self.spans      = {}                # UserTaskID -> (start, end)
+        self.by_start   = []                # (start, end, UserTaskID) of spans up to LONG_SPAN, sorted
+        self.by_end     = []                # (end, start, UserTaskID) of the same, sorted
+        self.long_start = []                # the same two lists for the (few) longer spans,
+        self.long_end   = []                # which are always scanned in full
+        self.longest    = timedelta(0)      # upper bound on the length of a by_start span
+        for key, start, end in rows:
+            self.spans[_key(key)] = (start, end)
+        for key, (start, end) in self.spans.items():
+            starts, ends = self._lists(start, end)
+            starts.append((start, end, key))
+            ends.append((end, start, key))
+            if starts is self.by_start:
+                self.longest = max(self.longest, end - start)
+        for lst in (self.by_start, self.by_end, self.long_start, self.long_end):
+            lst.sort()
+        self.version = None
+        self.loaded_at = self.checked_at = 0.0
+
+    def __len__(self):
+        return len(self.spans)
+
+    def _lists(self, start, end):
+        if end - start > LONG_SPAN:
+            return self.long_start, self.long_end
+        return self.by_start, self.by_end
+
+    def add(self, key, start, end):
+        key = _key(key)
+        self.remove(key)
+        if end <= self.since:
+            return
+        self.spans[key] = (start, end)
+        starts, ends = self._lists(start, end)
+        if starts is self.by_start:
+            self.longest = max(self.longest, end - start)
+        bisect.insort(starts, (start, end, key))
+        bisect.insort(ends, (end, start, key))
+
+    def remove(self, key):
+        key = _key(key)
+        found = self.spans.pop(key, None)
+        if found is None:
+            return False
+        start, end = found
+        starts, ends = self._lists(start, end)
+        del starts[bisect.bisect_left(starts, (start, end, key))]
+        del ends[bisect.bisect_left(ends, (end, start, key))]
+        return True
+
+    def _from(self, point):
+        # spans by start that may reach `point`: a bisect into the short ones
+        # (none starts more than `longest` earlier), merged with every long one
+        i = bisect.bisect_left(self.by_start, (point - self.longest,))
+        return heapq.merge(self.by_start[i:], self.long_start)
+
+    def _to(self, point):
+        # mirror of _from over ends, latest first
+        i = bisect.bisect_right(self.by_end, (point + self.longest,))
+        return heapq.merge(reversed(self.by_end[:i]), reversed(self.long_end), reverse=True)
+
+    def conflicts(self, start, end, ignore=None):
+        """(start, end, UserTaskID) of every span overlapping [start, end)."""
+        ignore = _key(ignore)
+        out = []
+        for s, e, k in self._from(start):
+            if s >= end:
+                break
+            if e > start and k != ignore:
+                out.append((s, e, k))
+        return out
+
+    def next_free(self, start, length, ignore=None):
+        """Earliest t >= start with [t, t + length) free."""
+        ignore = _key(ignore)
+        t = start
+        for s, e, k in self._from(start):
+            if s >= t + length:
+                break
+            if e > t and k != ignore:
+                t = e
+        return t
+
+    def prev_free(self, start, length, ignore=None):
+        """Latest t <= start with [t, t + length) free (mirror of next_free)."""
+        ignore = _key(ignore)
+        t = start + length
+        for e, s, k in self._to(t):
+            if e <= t - length:
+                break
+            if s < t and k != ignore:
+                t = s
+        return t - length
+
+    def gaps(self, frm, to, length, limit=None):
+        """Free (start, end) gaps of at least `length` inside [frm, to)."""
+        out, t = [], frm
+        for s, e, _ in self._from(frm):
+            if s >= to or (limit is not None and len(out) >= limit):
+                break
+            if s - t >= length:
+                out.append((t, s))
+            t = max(t, e)
+        if to - t >= length and (limit is None or len(out) < limit):
+            out.append((t, to))
+        return out
+
+
+# ─── Per-worker cache of schedules ───────────────────────────────────────────
+_lock    = threading.Lock()
+_indexes = OrderedDict()         # UserID -> Schedule, least recently used first
+
+
+def _stamp_name(uid):
+    return f'intervals:{uid}'
+
+
+def _load(uid, now):
+    since = datetime.combine(now.date() - timedelta(days=1), datetime.min.time())
+    version = versions.read(_stamp_name(uid))       # read first: a later write only makes us reload
+    sql = UPCOMING_SQL.format(ut=registry.table_name('user_task'), t=registry.table_name('task'),
+                              f=registry.table_name('feedback'))
+    with get_pool().cursor() as cur:
+        cur.execute(sql, [uid, since, since])
+        rows = cur.fetchall()
+    spans = ((r['UserTaskID'], *span(r)) for r in rows if r['TaskStartTime'] is not None)
+    sched = Schedule(since, spans)
+    sched.version = version
+    return sched
+
+
+def schedule(uid):
+    """The user's current Schedule (loaded or refreshed as needed)."""
+    uid = int(uid)
+    clock = time.monotonic()
+    with _lock:
+        sched = _indexes.get(uid)
+        if sched is not None:
+            _indexes.move_to_end(uid)
+    if sched is not None and clock - sched.loaded_at <= CACHE_TTL:
+        if clock - sched.checked_at < CHECK_EVERY:
+            return sched
+        sched.checked_at = clock
+        if versions.read(_stamp_name(uid)) == sched.version:
+            return sched
+
+    sched = _load(uid, datetime.now())
+    sched.loaded_at = sched.checked_at = clock
+    with _lock:
+        _indexes[uid] = sched
+        _indexes.move_to_end(uid)
+        while len(_indexes) > MAX_USERS:
+            _indexes.popitem(last=False)
+    return sched
+
+
+def invalidate(user_ids=None):
+    """Forget indexes after raw-SQL writes (all of them without user_ids)."""
+    with _lock:
+        uids = list(_indexes) if user_ids is None else [int(u) for u in user_ids]
+        for uid in uids:
+            _indexes.pop(uid, None)
+    for uid in uids:
+        versions.bump(_stamp_name(uid))
+
+
+@baseObject.add_write_listener
+def _on_write(tn, op, keys, rows):
+    if tn != registry.table_name('user_task'):
+        return
+    touched = set()
+    with _lock:
+        for i, key in enumerate(keys):
+            key = _key(key)         # form edits carry the key as a string
+            # the row may have moved between users: take it out of every index first
+            for uid, sched in _indexes.items():
+                if sched.remove(key):
+                    touched.add(uid)
+            row = rows[i] if rows else None
+            if row is None:
+                continue
+            if row.get('UserID') is None or 'TaskStartTime' not in row:
+                touched |= set(_indexes)        # partial row: rebuild whoever may hold it
+                _indexes.clear()
+                continue
+            uid = int(row['UserID'])
+            touched.add(uid)
+            sched, found = _indexes.get(uid), span(row)
+            if sched is not None and found is not None:
+                sched.add(key, *found)
+    for uid in touched:
+        version = versions.bump(_stamp_name(uid))
+        with _lock:
+            sched = _indexes.get(uid)
+            if sched is None or version is None:
+                continue                         # no stamps: the in-place change is all there is
+            if sched.version is not None and version == sched.version + 1:
+                sched.version = version          # only our own write moved the stamp
+            else:
+                _indexes.pop(uid, None)          # someone else wrote too: reload
+
+
+# ─── Public API ──────────────────────────────────────────────────────────────
+def conflicts(uid, start, end, ignore=None):
+    """Assignments of the user overlapping [start, end), as row dicts."""
+    sched = schedule(uid)
+    with _lock:
+        found = sched.conflicts(_dt(start), _dt(end), _key(ignore))
+    return [{'UserTaskID': k, 'TaskStartTime': s, 'TaskEndTime': e} for s, e, k in found]
+
+
+def nearest_free(uid, start, minutes, ignore=None, not_before=None):
+    """The free start time closest to `start` with room for `minutes` (never before not_before / now)."""
+    start, length = _dt(start), timedelta(minutes=int(minutes))
+    not_before = _dt(not_before) or datetime.now().replace(second=0, microsecond=0)
+    sched = schedule(uid)
+    with _lock:
+        later = sched.next_free(max(start, not_before), length, _key(ignore))
+        earlier = sched.prev_free(start, length, _key(ignore)) if start > not_before else None
+    if earlier is not None and earlier >= not_before and start - earlier < later - start:
+        return earlier
+    return later
+
+
+def free_slots(uid, frm, to, minutes, limit=None):
+    """Free (start, end) gaps of at least `minutes` in [frm, to)."""
+    sched = schedule(uid)
+    with _lock:
+        return sched.gaps(_dt(frm), _dt(to), timedelta(minutes=int(minutes)), limit)
+
+
+def _key(value):
+    return int(value) if value not in (None, '') else None
@@ -0,0 +1,94 @@
+"""
+notification.py  –  model class for mmungoshi_notification
+"""
+
+from flask_template.baseObject import baseObject
+
+class notification(baseObject):
+
+    TYPES = {'started', 'complete_reminder'}
+
+    def __init__(self):
+        self.setup()
+
+    # ──────────────────────────────────────────────────────────
+    # Writers (used by the transition scheduler)
+    # ──────────────────────────────────────────────────────────
+    def record_many(self, events):
+        """Insert a batch of {'UserID','UserTaskID','Type','CreatedAt'} events."""
+        if not events:
+            return 0
+        sql = (
+            f"INSERT INTO `{self.tn}` (`UserID`, `UserTaskID`, `Type`, `CreatedAt`) "
+            "VALUES (%s, %s, %s, %s)"
+        )
+        rows = [(e['UserID'], e['UserTaskID'], e['Type'], e['CreatedAt']) for e in events]
+        with self.pool.cursor() as cur:
+            cur.executemany(sql, rows)
+        return len(rows)
+
+    # ──────────────────────────────────────────────────────────
+    # Readers
+    # ──────────────────────────────────────────────────────────
+    REPLAY_PAGE = 100
+
+    def get_since(self, user_id, after_id=0, limit=REPLAY_PAGE):
+        """
+        Oldest-first notifications for one user with an ID above `after_id`;
+        call again from the last ID returned until fewer than `limit` come back.
+        """
+        sql = (
+            f"SELECT * FROM `{self.tn}` "
+            "WHERE `UserID` = %s AND `NotificationID` > %s "
+            "ORDER BY `NotificationID` LIMIT %s"
+        )
+        self.data = self._query(sql, [user_id, after_id, limit])
+        return self.data
+
+    def get_unread(self, user_id, limit=20):
+        """Newest-first unread notifications plus the total unread count."""
+        sql = (
+            f"SELECT * FROM `{self.tn}` "
+            "WHERE `UserID` = %s AND `ReadAt` IS NULL "
+            "ORDER BY `NotificationID` DESC LIMIT %s"
+        )
+        self.data = self._query(sql, [user_id, limit])
+        if len(self.data) < limit:
+            return self.data, len(self.data)
+        count = self._query(
+            f"SELECT COUNT(*) AS n FROM `{self.tn}` WHERE `UserID` = %s AND `ReadAt` IS NULL",
+            [user_id]
+        )
+        return self.data, count[0]['n']
+
+    def get_after(self, after_id, limit=500):
+        """All users' notifications above `after_id`, oldest first (for the stream broker)."""
+        sql = (
+            f"SELECT * FROM `{self.tn}` "
+            "WHERE `NotificationID` > %s ORDER BY `NotificationID` LIMIT %s"
+        )
+        return self._query(sql, [after_id, limit])
+
+    def get_max_id(self):
+        rows = self._query(f"SELECT COALESCE(MAX(`NotificationID`), 0) AS m FROM `{self.tn}`")
+        return rows[0]['m']
+
+    def mark_read(self, user_id, upto_id=None):
+        """Mark a user's notifications read (all of them, or those up to `upto_id`)."""
+        sql = f"UPDATE `{self.tn}` SET `ReadAt` = NOW() WHERE `UserID` = %s AND `ReadAt` IS NULL"
+        params = [user_id]
+        if upto_id is not None:
+            sql += " AND `NotificationID` <= %s"
+            params.append(upto_id)
+        self._query(sql, params)
+
+    @staticmethod
+    def to_event(row):
+        """JSON-safe form of a notification row for the SSE stream."""
+        created = row['CreatedAt']
+        return {
+            'NotificationID': row['NotificationID'],
+            'UserTaskID':     row['UserTaskID'],
+            'Type':           row['Type'],
+            'CreatedAt':      created.strftime('%Y-%m-%d %H:%M:%S') if hasattr(created, 'strftime') else created,
+        }
@@ -0,0 +1,68 @@
+"""
+pagination.py  –  keyset (cursor) pagination helpers
+
+A page cursor is the sort key of the last row on the previous page, e.g.
+(TaskStartTime, UserTaskID), packed into an opaque URL-safe token.  The next
+page is then "rows strictly after that key", which an index on the sort
+columns answers by seeking straight to it, so every page costs the same no
+matter how deep into the table it is.
+"""
+
+import base64
+import json
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT     = 200
+
+
+def clamp_limit(raw, default=DEFAULT_LIMIT, maximum=MAX_LIMIT):
+    try:
+        limit = int(raw)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(limit, maximum))
+
+
+def encode_cursor(values):
+    raw = json.dumps(list(values), default=str).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, size):
+    """Return the key values in `token`, or None if it is missing or malformed."""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return values
+
+
+def keyset_clause(columns, values, descending=False):
+    """
+    SQL + params for "row key comes after `values`" in (columns...) order,
+    written out as OR/AND terms so MySQL can use a range scan on the index.
+    """
+    op = '<' if descending else '>'
+    terms, params = [], []
+    for i, col in enumerate(columns):
+        eqs = [f"{c} = %s" for c in columns[:i]]
+        terms.append('(' + ' AND '.join(eqs + [f"{col} {op} %s"]) + ')')
+        params.extend(values[:i] + [values[i]])
+    return '(' + ' OR '.join(terms) + ')', params
+
+
+def next_cursor(rows, columns, limit):
+    """
+    Given up to limit+1 fetched rows, trim to `limit` and return the cursor
+    for the following page (None when this is the last page).
+    """
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor([last[c] for c in columns])
@@ -0,0 +1,214 @@
+"""
+recurrence.py  –  model class for mmungoshi_recurrence (recurring assignments)
+
+A rule repeats one task for one user at a fixed time of day, either every
+N days ('daily') or on a set of weekdays every N weeks ('weekly'), from
+StartsOn until an optional Until date or MaxCount occurrences.
+
+Occurrences are ordinary mmungoshi_user_task rows (tagged with the rule's
+RecurrenceID), materialised ahead of time up to a rolling horizon with one
+batched insertMany per rule.  MaterialisedUntil records how far a rule has
+been generated; the scheduler calls extend_due() to top rules up as days
+pass.  Claiming a range goes through the rule's Version (baseObject.update),
+so two workers never generate the same days.
+"""
+
+import logging
+import os
+from datetime import date, datetime, timedelta
+
+import pymysql
+
+from flask_template import intervals
+from flask_template.baseObject import baseObject
+from flask_template.user_task import user_task
+
+log = logging.getLogger(__name__)
+
+HORIZON_DAYS = int(os.getenv('SHIBUI_RECURRENCE_HORIZON', 366))   # generated this far ahead
+REFILL_DAYS  = int(os.getenv('SHIBUI_RECURRENCE_REFILL', 7))      # top up once this much is used
+
+
+def _as_time(value):
+    # MySQL TIME columns come back as timedelta
+    if isinstance(value, timedelta):
+        return (datetime.min + value).time()
+    if isinstance(value, str):
+        return datetime.strptime(value[:5], '%H:%M').time()
+    return value
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value
+
+
+def weekday_set(value):
+    """'0,2,4' (Monday = 0) -> {0, 2, 4}."""
+    if not value:
+        return set()
+    return {int(d) for d in str(value).split(',') if d.strip() != ''}
+
+
+def occurrences(rule, start_day, end_day, limit=None, not_before=None):
+    """
+    Start datetimes of the rule's occurrences on days in [start_day, end_day)
+    and not before `not_before`, at most `limit` of them.
+    """
+    first  = _as_date(rule['StartsOn'])
+    at     = _as_time(rule['StartTime'])
+    every  = max(int(rule.get('Every') or 1), 1)
+    days   = weekday_set(rule.get('Weekdays'))
+    until  = _as_date(rule.get('Until'))
+    day    = max(start_day, first)
+    if until is not None:
+        end_day = min(end_day, until + timedelta(days=1))
+    week0  = first - timedelta(days=first.weekday())
+
+    out = []
+    while day < end_day and (limit is None or len(out) < limit):
+        if rule['Freq'] == 'daily':
+            hit = (day - first).days % every == 0
+        else:
+            hit = day.weekday() in days and ((day - week0).days // 7) % every == 0
+        if hit and (not_before is None or datetime.combine(day, at) >= not_before):
+            out.append(datetime.combine(day, at))
+        day += timedelta(days=1)
+    return out
+
+
+class recurrence(baseObject):
+
+    FREQS = {'daily', 'weekly'}
+
+    def __init__(self):
+        self.setup()
+
+    # ──────────────────────────────────────────────────────────
+    # Validation
+    # ──────────────────────────────────────────────────────────
+    def verify_new(self, n=0):
+        self.errors = []
+        rec = self.data[n]
+
+        for field in ('UserID', 'TaskID', 'StartsOn', 'StartTime', 'Duration', 'Freq'):
+            if rec.get(field) in (None, ''):
+                self.errors.append(f"{field} is required.")
+        if rec.get('Freq') not in self.FREQS:
+            self.errors.append("Repeat must be daily or weekly.")
+        if rec.get('Freq') == 'weekly' and not weekday_set(rec.get('Weekdays')):
+            self.errors.append("Pick at least one weekday for a weekly repeat.")
+        try:
+            if int(rec.get('Every') or 1) < 1:
+                self.errors.append("Repeat interval must be at least 1.")
+            if rec.get('MaxCount') not in (None, '') and int(rec['MaxCount']) < 1:
+                self.errors.append("Occurrence count must be at least 1.")
+        except ValueError:
+            self.errors.append("Repeat interval and count must be whole numbers.")
+        if rec.get('Until') and rec.get('StartsOn') and _as_date(rec['Until']) < _as_date(rec['StartsOn']):
+            self.errors.append("The repeat must end on or after its first day.")
+        return len(self.errors) == 0
+
+    # ──────────────────────────────────────────────────────────
+    # Materialisation
+    # ──────────────────────────────────────────────────────────
+    def materialise(self, rule_id, until=None, now=None, allow_overlap=False):
+        """
+        Create the rule's occurrences from where it left off up to `until`
+        (default: HORIZON_DAYS from today) in one batched insert.  Occurrences
+        that overlap another of the user's assignments (intervals.py) are
+        skipped unless allow_overlap; self.skipped counts them.  Returns the
+        number of assignments created (0 if another worker claimed the range).
+        """
+        self.skipped = 0
+        now = now or datetime.now()
+        until = until or now.date() + timedelta(days=HORIZON_DAYS)
+        self.getById(rule_id)
+        if not self.data or not self.data[0]['Active']:
+            return 0
+        rule = self.data[0]
+        begin = _as_date(rule['MaterialisedUntil']) or _as_date(rule['StartsOn'])
+        if begin >= until:
+            return 0
+
+        left = None
+        if rule.get('MaxCount') is not None:
+            left = int(rule['MaxCount']) - int(rule['Generated'])
+        # past slots (earlier today, say) are dropped before the count cap applies
+        starts = occurrences(rule, begin, until, left, not_before=now)
+        minutes = int(rule['Duration'])
+        if not allow_overlap:
+            length = timedelta(minutes=minutes)
+            free = [s for s in starts if not intervals.conflicts(rule['UserID'], s, s + length)]
+            self.skipped = len(starts) - len(free)
+            starts = free
+
+        # claim [begin, until) first: the version check makes a racing worker back off
+        previous = dict(rule)
+        rule['MaterialisedUntil'] = until
+        rule['Generated'] = int(rule['Generated']) + len(starts)
+        if (left is not None and len(starts) >= left) or \
+           (rule.get('Until') and _as_date(rule['Until']) < until):
+            rule['Active'] = 0                   # nothing more to generate
+        if not self.update(0):
+            return 0
+
+        # user_task holds only the slot; intensity is logged with the feedback
+        rows = [{
+            'UserID':         rule['UserID'],
+            'TaskID':         rule['TaskID'],
+            'TaskStartTime':  s.strftime('%Y-%m-%d %H:%M:%S'),
+            'TaskEndTime':    (s + timedelta(minutes=minutes)).strftime('%Y-%m-%d %H:%M:%S'),
+            'TaskStatus':     'pending',
+            'RecurrenceID':   rule[self.pk],
+        } for s in starts]
+        try:
+            user_task().insertMany(rows)
+        except Exception:
+            # give the range back so the next run retries it
+            self.data[0].update({k: previous[k] for k in ('MaterialisedUntil', 'Generated', 'Active')})
+            self.update(0)
+            raise
+        return len(rows)
+
+    def extend_due(self, now=None):
+        """Top up every active rule whose horizon is within REFILL_DAYS of running out."""
+        now = now or datetime.now()
+        target = now.date() + timedelta(days=HORIZON_DAYS)
+        ids = [r[self.pk] for r in self._query(
+            f"SELECT `{self.pk}` FROM `{self.tn}` "
+            "WHERE `Active` = 1 AND (`MaterialisedUntil` IS NULL OR `MaterialisedUntil` < %s)",
+            [target - timedelta(days=REFILL_DAYS)]
+        )]
+        created = 0
+        for rule_id in ids:
+            try:
+                created += recurrence().materialise(rule_id, target, now)
+            except pymysql.MySQLError:
+                log.exception("could not extend recurrence %s", rule_id)
+        return created
+
+    # ──────────────────────────────────────────────────────────
+    # Stopping a rule
+    # ──────────────────────────────────────────────────────────
+    def stop(self, rule_id, now=None):
+        """Deactivate a rule and remove its occurrences that have not started yet."""
+        now = now or datetime.now()
+        self.getById(rule_id)
+        if not self.data:
+            self.errors.append("Recurrence not found.")
+            return False
+        self.data[0]['Active'] = 0
+        if not self.update(0):
+            return False
+        ut = user_task()
+        future = ut._query(
+            f"SELECT `{ut.pk}` FROM `{ut.tn}` "
+            "WHERE `RecurrenceID` = %s AND `TaskStatus` = 'pending' AND `TaskStartTime` > %s",
+            [rule_id, now]
+        )
+        ut.deleteByIds([r[ut.pk] for r in future])
+        return True
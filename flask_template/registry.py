@@ -0,0 +1,111 @@
+"""
+registry.py  –  process-level cache of config.yml and table metadata
+
+config.yml is parsed once per process, and each table's column list and
+primary key are looked up with DESCRIBE once and then reused by every model
+instance.  If a snapshot path is configured (SHIBUI_SCHEMA_SNAPSHOT or
+`schema_snapshot:` in config.yml) the table metadata is also written to a
+JSON file so a freshly started worker can skip the DESCRIBE round trips.
+
+After a migration changes a table, call invalidate() so the next model
+instance re-reads its columns.  The cache is per process, so workers that
+were already running pick up the new columns on restart.
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+
+import yaml
+
+_lock     = threading.RLock()
+_config   = None
+_schemas  = {}          # table name -> {'fields': [...], 'pk': 'SomeID', 'version': 'Version' | None}
+_snapshot_loaded = False
+
+
+# ─── Config ──────────────────────────────────────────────────────────────────
+def get_config():
+    global _config
+    if _config is None:
+        with _lock:
+            if _config is None:
+                cfg_path = Path(__file__).parent / "config.yml"
+                _config = yaml.safe_load(cfg_path.read_text())
+    return _config
+
+
+def table_name(class_name):
+    """Table mapped to a model class in config.yml's `tables:` section."""
+    return get_config()['tables'][class_name]
+
+
+# ─── Schema cache ────────────────────────────────────────────────────────────
+def snapshot_path():
+    path = os.getenv("SHIBUI_SCHEMA_SNAPSHOT") or get_config().get('schema_snapshot')
+    if not path:
+        return None
+    path = Path(path)
+    return path if path.is_absolute() else Path(__file__).parent / path
+
+
+def _load_snapshot():
+    global _snapshot_loaded
+    _snapshot_loaded = True
+    path = snapshot_path()
+    if path is None or not path.exists():
+        return
+    try:
+        saved = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return              # a corrupt snapshot just means we DESCRIBE again
+    for tn, meta in saved.items():
+        _schemas.setdefault(tn, {'fields': list(meta['fields']), 'pk': meta['pk'],
+                                 'version': meta.get('version')})
+
+
+def _save_snapshot():
+    path = snapshot_path()
+    if path is None:
+        return
+    tmp = path.with_suffix(path.suffix + f".{os.getpid()}.tmp")
+    try:
+        tmp.write_text(json.dumps(_schemas, indent=2, sort_keys=True))
+        os.replace(tmp, path)
+    except OSError:
+        pass                # the snapshot is an optimisation, never fatal
+
+
+def get_schema(tn, describe):
+    """
+    Return {'fields': [...], 'pk': ..., 'version': ...} for table `tn`.
+    `describe` is called with the table name only when neither memory nor the
+    snapshot has it, and returns (fields, pk, version column or None).
+    """
+    with _lock:
+        if not _snapshot_loaded:
+            _load_snapshot()
+        meta = _schemas.get(tn)
+        if meta is None:
+            fields, pk, version = describe(tn)
+            meta = _schemas[tn] = {'fields': fields, 'pk': pk, 'version': version}
+            _save_snapshot()
+        return meta
+
+
+def invalidate(tn=None):
+    """Forget cached metadata for one table (or all) and refresh the snapshot."""
+    global _config
+    with _lock:
+        if tn is None:
+            _schemas.clear()
+            _config = None
+        else:
+            _schemas.pop(tn, None)
+        path = snapshot_path()
+        if path is not None:
+            if _schemas:
+                _save_snapshot()
+            elif path.exists():
+                path.unlink()
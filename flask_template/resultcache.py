@@ -0,0 +1,221 @@
+"""
+resultcache.py  –  opt-in LRU cache for dbselect results, evicted by writes
+
+    rows = dbselect(sql, [uid], cache=True, user_id=uid)
+
+Entries are keyed by the whitespace-normalised SQL and its parameters and
+tagged with the tables the statement reads (FROM / JOIN) and, optionally,
+the user the rows belong to.  A write in this process evicts the entries
+for the tables it touched – only the writer's users' entries when those are
+known (inserts through a model, the scheduler), otherwise every entry for
+the table.  Writes in other workers are picked up through per-table version
+stamps (versions.py), compared at most every CHECK_EVERY seconds.
+
+Statements whose result depends on the clock (NOW(), CURDATE(), …) are never
+cached.  Memory is bounded by entry count and total cached rows.
+"""
+
+import functools
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from flask_template import versions
+from flask_template.baseObject import baseObject
+
+ENABLED     = os.getenv('SHIBUI_RESULT_CACHE', 'on') != 'off'
+MAX_ENTRIES = int(os.getenv('SHIBUI_RESULT_CACHE_ENTRIES', 2000))
+MAX_ROWS    = int(os.getenv('SHIBUI_RESULT_CACHE_ROWS', 200_000))
+TTL         = float(os.getenv('SHIBUI_RESULT_CACHE_TTL', 300))
+CHECK_EVERY = float(os.getenv('SHIBUI_RESULT_CACHE_CHECK', 2))
+
+_VOLATILE = re.compile(
+    r"\b(NOW|CURDATE|CURTIME|CURRENT_DATE|CURRENT_TIME|CURRENT_TIMESTAMP|SYSDATE|"
+    r"UTC_DATE|UTC_TIME|UTC_TIMESTAMP|UNIX_TIMESTAMP|RAND|UUID)\b", re.I)
+_READS  = re.compile(r"\b(?:FROM|JOIN)\s+`?(\w+)`?", re.I)
+
+
+@functools.lru_cache(maxsize=1024)
+def analyse(sql):
+    """(normalised SQL, tables read, depends on the clock?) for one statement."""
+    return ' '.join(sql.split()), frozenset(_READS.findall(sql)), bool(_VOLATILE.search(sql))
+
+
+def _stamp_name(table):
+    return 'rc:' + table
+
+
+def _freeze(params):
+    if params is None:
+        return ()
+    if isinstance(params, dict):
+        return tuple(sorted(params.items()))
+    return tuple(params)
+
+
+class _Entry:
+    __slots__ = ('rows', 'tables', 'user', 'stamps', 'stored_at')
+
+    def __init__(self, rows, tables, user, stamps, stored_at):
+        self.rows      = rows
+        self.tables    = tables
+        self.user      = user
+        self.stamps    = stamps       # table -> version stamp when stored
+        self.stored_at = stored_at
+
+
+# ─── Cache ───────────────────────────────────────────────────────────────────
+class ResultCache:
+    def __init__(self, max_entries=MAX_ENTRIES, max_rows=MAX_ROWS, ttl=TTL, check_every=CHECK_EVERY):
+        self.max_entries = max_entries
+        self.max_rows    = max_rows
+        self.ttl         = ttl
+        self.check_every = check_every
+
+        self._lock     = threading.Lock()
+        self._entries  = OrderedDict()    # key -> _Entry, least recently used first
+        self._by_table = {}               # table -> set of keys
+        self._rows     = 0
+        self._known    = {}               # table -> latest stamp this process has seen
+        self._epoch    = {}               # table -> local invalidation count
+        self._checked_at = 0.0
+        self._stats = {'hits': 0, 'misses': 0, 'uncacheable': 0,
+                       'evicted': 0, 'invalidated': 0, 'stale': 0}
+
+    # ── reads ───────────────────────────────────────────────────────────────
+    def get_or_load(self, sql, params, user_id, load):
+        """Serve a cached result for (sql, params) or call load() and keep its rows."""
+        norm, tables, volatile = analyse(sql)
+        if volatile or not tables:
+            with self._lock:
+                self._stats['uncacheable'] += 1
+            return load()
+
+        key = (norm, _freeze(params))
+        self._sync(tables)
+        now = time.monotonic()
+        with self._lock:
+            e = self._entries.get(key)
+            if e is not None:
+                if now - e.stored_at <= self.ttl and all(self._known.get(t) == e.stamps[t] for t in tables):
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return [r.copy() for r in e.rows]
+                self._drop(key)
+                self._stats['stale'] += 1
+            self._stats['misses'] += 1
+            stamps = {t: self._known.get(t) for t in tables}
+            epochs = {t: self._epoch.get(t, 0) for t in tables}
+
+        rows = list(load())
+
+        with self._lock:
+            # a write to one of the tables while we were loading: don't keep the result
+            if all(self._epoch.get(t, 0) == epochs[t] for t in tables):
+                if key in self._entries:
+                    self._drop(key)
+                self._entries[key] = _Entry([r.copy() for r in rows], tables, user_id, stamps, now)
+                for t in tables:
+                    self._by_table.setdefault(t, set()).add(key)
+                self._rows += len(rows)
+                self._trim()
+        return rows
+
+    def _sync(self, tables):
+        """Refresh the stamps of every table seen so far, at most every check_every seconds."""
+        now = time.monotonic()
+        with self._lock:
+            new = [t for t in tables if t not in self._known]
+            if not new and now - self._checked_at < self.check_every:
+                return
+            self._checked_at = now
+            names = set(self._known) | set(tables)
+        found = versions.read_many([_stamp_name(t) for t in names])
+        with self._lock:
+            for t in names:
+                self._known[t] = None if found is None else found.get(_stamp_name(t), 0)
+
+    # ── writes ──────────────────────────────────────────────────────────────
+    def invalidate(self, tables, user_ids=None):
+        """
+        Evict entries reading any of `tables`.  With user_ids, entries tagged
+        with another user survive (entries without a user tag never do).
+        """
+        for t in tables:
+            stamp = versions.bump(_stamp_name(t))
+            with self._lock:
+                self._epoch[t] = self._epoch.get(t, 0) + 1
+                prev = self._known.get(t)
+                # the bump is ours alone only if the stamp moved by exactly one
+                only_ours = stamp is not None and prev is not None and stamp == prev + 1
+                for key in list(self._by_table.get(t, ())):
+                    e = self._entries[key]
+                    if (only_ours and e.stamps[t] == prev and user_ids is not None
+                            and e.user is not None and e.user not in user_ids):
+                        e.stamps[t] = stamp
+                    else:
+                        self._drop(key)
+                        self._stats['invalidated'] += 1
+                if stamp is not None:
+                    self._known[t] = stamp
+
+    # ── bookkeeping (caller holds the lock) ─────────────────────────────────
+    def _drop(self, key):
+        e = self._entries.pop(key)
+        self._rows -= len(e.rows)
+        for t in e.tables:
+            keys = self._by_table.get(t)
+            if keys is not None:
+                keys.discard(key)
+
+    def _trim(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._rows > self.max_rows):
+            self._drop(next(iter(self._entries)))
+            self._stats['evicted'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_table.clear()
+            self._rows = 0
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), rows=self._rows)
+
+
+# ─── Process-wide instance ───────────────────────────────────────────────────
+_cache = ResultCache()
+
+
+def get_or_load(sql, params, user_id, load):
+    if not ENABLED:
+        return load()
+    return _cache.get_or_load(sql, params, user_id, load)
+
+
+def invalidate(tables, user_ids=None):
+    if ENABLED and tables:
+        _cache.invalidate(tables, user_ids)
+
+
+def stats():
+    return _cache.stats()
+
+
+def table_versions(tables):
+    """{table: write stamp} for the tables (bumped on every write to them), or None without stamps."""
+    found = versions.read_many([_stamp_name(t) for t in tables])
+    return None if found is None else {t: found.get(_stamp_name(t), 0) for t in tables}
+
+
+@baseObject.add_write_listener
+def on_model_write(tn, op, keys, rows):
+    """baseObject write listener: inserts only touch their own users' entries."""
+    users = None
+    if op == 'insert' and rows and all(r.get('UserID') is not None for r in rows):
+        users = {int(r['UserID']) for r in rows}
+    # an update may have moved the row to another user, so it evicts the whole table
+    invalidate([tn], users)
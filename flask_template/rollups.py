@@ -0,0 +1,272 @@
+"""
+rollups.py  –  incrementally maintained per-user daily aggregates
+
+mmungoshi_daily_rollup holds one row per (user, day, task category) with
+what happened that day: assignments started (count, minutes, hour-of-day
+histogram), assignments completed, and feedback mood scores.  The /api
+reporting endpoints read these O(days) rows instead of the user's raw
+history (the metrics themselves are computed in analytics.py).
+
+A write only touches a few (user, day) buckets, so instead of adjusting
+counters we recompute those buckets from the source rows:
+- model writes to user_task, feedback and task are picked up by baseObject
+  listeners (the before-listener captures the buckets the old values fed),
+- the scheduler calls recompute() for assignments it completes,
+- raw-SQL writers call buckets_for() before and recompute() after (deletes.py
+  announces its deletes to the same listeners instead).
+
+Every change to a user's rows also bumps that user's data version
+(versions.py, name 'rollup:<UserID>'), which the reporting APIs use as
+their ETag.  Backfill or repair with scripts/rebuild_rollups.py.
+"""
+
+import json
+import threading
+from datetime import datetime, timedelta
+
+from flask_template import registry
+from flask_template import resultcache
+from flask_template import versions
+from flask_template.baseObject import baseObject
+from flask_template.dbpool import get_pool
+
+ROLLUP_TABLE = 'mmungoshi_daily_rollup'
+COLUMNS = ['UserID', 'Day', 'TaskCategory', 'Minutes', 'TaskCount', 'CompletedCount',
+           'HourHist', 'MoodScoreSum', 'FeedbackCount']
+
+_local = threading.local()      # buckets captured by the before-listener, per thread
+
+
+# ─── Which buckets a row feeds ───────────────────────────────────────────────
+def _day(value):
+    if value is None:
+        return None
+    return value.date() if isinstance(value, datetime) else value
+
+
+def buckets_for(kind, keys):
+    """
+    {(UserID, day)} fed by the given user_task / feedback / task rows, read
+    from their current state in the database.
+    """
+    keys = list(keys)
+    if not keys:
+        return set()
+    marks = ', '.join('%s' for _ in keys)
+    if kind == 'feedback':
+        sql = f"""
+            SELECT ut.UserID, DATE(f.Timestamp) AS d1, NULL AS d2, NULL AS d3
+            FROM mmungoshi_feedback f
+            JOIN mmungoshi_user_task ut ON ut.UserTaskID = f.UserTaskID
+            WHERE f.FeedbackID IN ({marks})
+        """
+    else:
+        # an assignment feeds its start day, its end day and its feedback days;
+        # a master task feeds every assignment of it (its category is in the key)
+        col = 'ut.UserTaskID' if kind == 'user_task' else 'ut.TaskID'
+        sql = f"""
+            SELECT ut.UserID, DATE(ut.TaskStartTime) AS d1, DATE(ut.TaskEndTime) AS d2,
+                   DATE(f.Timestamp) AS d3
+            FROM mmungoshi_user_task ut
+            LEFT JOIN mmungoshi_feedback f ON f.UserTaskID = ut.UserTaskID
+            WHERE {col} IN ({marks})
+        """
+    found = set()
+    with get_pool().cursor() as cur:
+        cur.execute(sql, keys)
+        for r in cur.fetchall():
+            for d in (r['d1'], r['d2'], r['d3']):
+                if d is not None:
+                    found.add((r['UserID'], _day(d)))
+    return found
+
+
+# ─── Recomputing buckets ─────────────────────────────────────────────────────
+def _aggregate(cur, user_id, lo=None, hi=None):
+    """
+    {(Day, TaskCategory): row} for one user, from the source tables.  With
+    lo/hi only events in [lo, hi) are read.
+    """
+    def window(col):
+        if lo is None:
+            return '', []
+        return f" AND {col} >= %s AND {col} < %s", [lo, hi]
+
+    rows = {}
+
+    def bucket(day, cat):
+        key = (_day(day), cat)
+        if key not in rows:
+            rows[key] = {'UserID': user_id, 'Day': key[0], 'TaskCategory': cat,
+                         'Minutes': 0, 'TaskCount': 0, 'CompletedCount': 0,
+                         'HourHist': [0] * 24, 'MoodScoreSum': 0.0, 'FeedbackCount': 0}
+        return rows[key]
+
+    clause, params = window('ut.TaskStartTime')
+    cur.execute(f"""
+        SELECT DATE(ut.TaskStartTime) AS Day, t.TaskCategory, HOUR(ut.TaskStartTime) AS Hr,
+               COUNT(*) AS n,
+               SUM(TIMESTAMPDIFF(MINUTE, ut.TaskStartTime, ut.TaskEndTime)) AS mins
+        FROM mmungoshi_user_task ut
+        JOIN mmungoshi_task t ON t.TaskID = ut.TaskID
+        WHERE ut.UserID = %s{clause}
+        GROUP BY Day, t.TaskCategory, Hr
+    """, [user_id] + params)
+    for r in cur.fetchall():
+        b = bucket(r['Day'], r['TaskCategory'])
+        b['TaskCount'] += r['n']
+        b['Minutes']   += int(r['mins'] or 0)
+        b['HourHist'][r['Hr']] += r['n']
+
+    clause, params = window('ut.TaskEndTime')
+    cur.execute(f"""
+        SELECT DATE(ut.TaskEndTime) AS Day, t.TaskCategory, COUNT(*) AS n
+        FROM mmungoshi_user_task ut
+        JOIN mmungoshi_task t ON t.TaskID = ut.TaskID
+        WHERE ut.UserID = %s AND ut.TaskStatus = 'completed'
+          AND ut.TaskEndTime IS NOT NULL{clause}
+        GROUP BY Day, t.TaskCategory
+    """, [user_id] + params)
+    for r in cur.fetchall():
+        bucket(r['Day'], r['TaskCategory'])['CompletedCount'] += r['n']
+
+    clause, params = window('f.Timestamp')
+    cur.execute(f"""
+        SELECT DATE(f.Timestamp) AS Day, t.TaskCategory,
+               SUM((f.MoodAfter - f.MoodBefore) * f.Intensity * f.ActualDuration)   AS s,
+               COUNT((f.MoodAfter - f.MoodBefore) * f.Intensity * f.ActualDuration) AS n
+        FROM mmungoshi_feedback f
+        JOIN mmungoshi_user_task ut ON ut.UserTaskID = f.UserTaskID
+        JOIN mmungoshi_task t ON t.TaskID = ut.TaskID
+        WHERE ut.UserID = %s{clause}
+        GROUP BY Day, t.TaskCategory
+    """, [user_id] + params)
+    for r in cur.fetchall():
+        b = bucket(r['Day'], r['TaskCategory'])
+        b['MoodScoreSum']  += float(r['s'] or 0)
+        b['FeedbackCount'] += r['n']
+
+    return rows
+
+
+def _write(cur, rows):
+    if not rows:
+        return
+    one_row = '(' + ', '.join('%s' for _ in COLUMNS) + ')'
+    cur.execute(
+        f"INSERT INTO {ROLLUP_TABLE} ({', '.join(COLUMNS)}) VALUES "
+        + ', '.join([one_row] * len(rows)),
+        [json.dumps(r[c]) if c == 'HourHist' else r[c] for r in rows for c in COLUMNS]
+    )
+
+
+def recompute(buckets):
+    """Rebuild the rollup rows for a set of (UserID, day) buckets."""
+    by_user = {}
+    for uid, day in buckets:
+        if uid is not None and day is not None:
+            by_user.setdefault(int(uid), set()).add(_day(day))
+    if not by_user:
+        return
+    pool = get_pool()
+    with pool.transaction():
+        with pool.cursor() as cur:
+            for uid, days in by_user.items():
+                # one range read per user covers every touched day
+                lo, hi = min(days), max(days) + timedelta(days=1)
+                rows = [r for (d, _), r in _aggregate(cur, uid, lo, hi).items() if d in days]
+                marks = ', '.join('%s' for _ in days)
+                cur.execute(f"DELETE FROM {ROLLUP_TABLE} WHERE UserID = %s AND Day IN ({marks})",
+                            [uid] + sorted(days))
+                _write(cur, rows)
+    resultcache.invalidate([ROLLUP_TABLE], set(by_user))
+    for uid in by_user:
+        versions.bump(_version_name(uid))
+
+
+def rebuild(user_ids=None):
+    """Recompute every bucket for the given users (default: everyone with assignments)."""
+    pool = get_pool()
+    if user_ids is None:
+        with pool.cursor() as cur:
+            cur.execute("SELECT DISTINCT UserID FROM mmungoshi_user_task ORDER BY UserID")
+            user_ids = [r['UserID'] for r in cur.fetchall()]
+    count = 0
+    for uid in user_ids:
+        with pool.transaction():
+            with pool.cursor() as cur:
+                rows = list(_aggregate(cur, uid).values())
+                cur.execute(f"DELETE FROM {ROLLUP_TABLE} WHERE UserID = %s", [uid])
+                _write(cur, rows)
+        versions.bump(_version_name(uid))
+        count += len(rows)
+    resultcache.invalidate([ROLLUP_TABLE])
+    return len(user_ids), count
+
+
+def drop_user(user_id):
+    drop_users([user_id])
+
+
+def drop_users(user_ids):
+    """Remove every rollup row of the given (deleted) users in one statement."""
+    user_ids = sorted({int(u) for u in user_ids})
+    if not user_ids:
+        return
+    marks = ', '.join('%s' for _ in user_ids)
+    with get_pool().cursor() as cur:
+        cur.execute(f"DELETE FROM {ROLLUP_TABLE} WHERE UserID IN ({marks})", user_ids)
+    resultcache.invalidate([ROLLUP_TABLE], set(user_ids))
+    for uid in user_ids:
+        versions.bump(_version_name(uid))
+
+
+# ─── Per-user data version ───────────────────────────────────────────────────
+def _version_name(user_id):
+    return f"rollup:{int(user_id)}"
+
+
+def data_version(user_id):
+    """Counter bumped on every change to this user's rollups (None without the version table)."""
+    return versions.read(_version_name(user_id))
+
+
+# ─── Model write listeners ───────────────────────────────────────────────────
+def _kind(tn):
+    for kind in ('user_task', 'feedback', 'task'):
+        if registry.table_name(kind) == tn:
+            return kind
+    return None
+
+
+# only a master task's category reaches the rollups (it is part of the key)
+def _affects_rollups(kind, op, cols):
+    if kind == 'task':
+        return op == 'update' and (cols is None or 'TaskCategory' in cols)
+    return kind is not None
+
+
+@baseObject.add_before_write_listener
+def _before_write(tn, op, keys, cols=None):
+    kind = _kind(tn)
+    if not _affects_rollups(kind, op, cols):
+        _local.skipped = (tn, tuple(keys))     # tells _after_write to leave this write alone
+        return
+    pending = getattr(_local, 'pending', None)
+    if pending is None:
+        pending = _local.pending = set()
+    pending |= buckets_for(kind, keys)
+
+
+@baseObject.add_write_listener
+def _after_write(tn, op, keys, rows):
+    kind = _kind(tn)
+    skipped, _local.skipped = getattr(_local, 'skipped', None), None
+    if kind is None or (kind == 'task' and op != 'update') or skipped == (tn, tuple(keys)):
+        return
+    touched = getattr(_local, 'pending', None) or set()
+    _local.pending = None
+    if op != 'delete':
+        touched |= buckets_for(kind, keys)
+    recompute(touched)
+
@@ -0,0 +1,113 @@
+"""
+rows.py  –  compact row objects with generated __slots__
+
+A DictCursor row is a dict: a hash table sized for growth plus a key
+pointer per column, several hundred bytes per row for a typical table.
+row_class() generates, once per column list, a class whose instances keep
+the values in fixed __slots__ (no per-instance dict), which is a fraction of
+the size (see scripts/bench_rows.py).
+
+The rows behave like read-mostly dicts wherever the app uses them:
+    r['TaskName'], r.TaskName, r.get('x'), 'x' in r, dict(r), r.items(),
+    r['TaskName'] = 'new'   (existing columns only), r.copy()
+so Jinja templates ({{ row.TaskName }} / {{ row['TaskName'] }}) and the
+model code work unchanged.  Use to_dict() before handing rows to jsonify.
+
+Build them straight from a plain tuple cursor with fetch_rows(); dicts are
+never created.
+"""
+
+import keyword
+import threading
+from collections.abc import Mapping
+
+_lock    = threading.Lock()
+_classes = {}           # (name, columns) -> generated class
+
+
+class Row(Mapping):
+    """Base of the generated row classes; subclasses define __slots__ = columns."""
+
+    __slots__ = ()
+    columns = ()
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        if key not in self.columns:
+            raise KeyError(f"{type(self).__name__} has no column {key!r}")
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.columns
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def __len__(self):
+        return len(self.columns)
+
+    def __eq__(self, other):
+        if isinstance(other, Mapping):
+            return dict(self.items()) == dict(other.items())
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self.items())!r})"
+
+    def copy(self):
+        return type(self)(*[getattr(self, c) for c in self.columns])
+
+    def to_dict(self):
+        return {c: getattr(self, c) for c in self.columns}
+
+
+def usable(columns):
+    """True if every column name can be a slot (aliases like COUNT(*) cannot)."""
+    return (len(set(columns)) == len(columns)
+            and all(c.isidentifier() and not keyword.iskeyword(c) and not c.startswith('__')
+                    and not hasattr(Row, c) for c in columns))
+
+
+def row_class(name, columns):
+    """The slotted row class for this column list (generated on first use)."""
+    columns = tuple(columns)
+    key = (name, columns)
+    cls = _classes.get(key)
+    if cls is not None:
+        return cls
+    if not usable(columns):
+        raise ValueError(f"columns of {name} cannot all be slots: {columns!r}")
+    # a positional __init__ written out per class keeps construction to one call
+    args = ', '.join(columns)
+    body = '\n'.join(f"    self.{c} = {c}" for c in columns) or "    pass"
+    namespace = {}
+    exec(f"def __init__(self, {args}):\n{body}\n", namespace)
+    with _lock:
+        cls = _classes.get(key)
+        if cls is None:
+            cls = _classes[key] = type(f"{name}_row", (Row,), {
+                '__slots__': columns,
+                'columns':   columns,
+                '__init__':  namespace['__init__'],
+            })
+    return cls
+
+
+def fetch_rows(cursor, name='row'):
+    """
+    All remaining rows of an executed plain-tuple cursor as slotted rows, or
+    as dicts if the column names cannot be slots.
+    """
+    columns = [d[0] for d in cursor.description]
+    rows = cursor.fetchall()
+    if not usable(columns):
+        return [dict(zip(columns, r)) for r in rows]
+    cls = row_class(name, columns)
+    return [cls(*r) for r in rows]
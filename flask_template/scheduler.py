@@ -0,0 +1,263 @@
+"""
+scheduler.py  –  background pending → in_progress → completed transitions
+
+One scheduler per deployment keeps a min-heap of upcoming TaskStartTime /
+TaskEndTime deadlines and flips statuses in batches as they fall due, writing
+a per-user notification for each flip.  Leadership is a MySQL named lock
+(GET_LOCK) held on a dedicated connection, so any number of gunicorn workers
+(or hosts) can run the thread and exactly one of them does the work.
+
+Run it in-process (app.py starts it unless SHIBUI_SCHEDULER=off) or as a
+standalone worker:
+
+    python -m flask_template.scheduler
+"""
+
+import heapq
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+import pymysql
+
+from flask_template import dbpool
+from flask_template import registry
+from flask_template import resultcache
+from flask_template import rollups
+from flask_template.notification import notification
+from flask_template.recurrence import recurrence
+from flask_template.user_task import user_task
+
+log = logging.getLogger(__name__)
+
+LOCK_NAME = 'shibui_transition_scheduler'
+
+# kind -> (status it leaves, status it enters, deadline column, notification type)
+TRANSITIONS = {
+    'start':    ('pending',     'in_progress', 'TaskStartTime', 'started'),
+    'complete': ('in_progress', 'completed',   'TaskEndTime',   'complete_reminder'),
+}
+
+
+def _utcnow():
+    return datetime.utcnow().replace(microsecond=0)
+
+
+class TransitionScheduler:
+    def __init__(self, horizon=900, refresh=30, batch_size=500, elect_every=15, recur_every=3600):
+        self.horizon     = horizon        # seconds of future deadlines kept in the heap
+        self.refresh     = refresh        # seconds between reloads (picks up new/edited rows)
+        self.batch_size  = batch_size     # max rows per load and per UPDATE
+        self.elect_every = elect_every    # seconds between leadership attempts
+        self.recur_every = recur_every    # seconds between recurrence top-ups (None = off)
+
+        self._heap    = []                # (due, kind, UserTaskID, UserID, TaskEndTime)
+        self._queued  = {}                # (kind, UserTaskID) -> due, to skip duplicates
+        self._wake    = threading.Event()
+        self._stop    = threading.Event()
+        self._lock_conn = None
+        self._next_refresh = None
+        self._next_recur = None
+
+    # ── heap maintenance ────────────────────────────────────────────────────
+    def _push(self, due, kind, row):
+        key = (kind, row['UserTaskID'])
+        if self._queued.get(key) == due:
+            return
+        self._queued[key] = due
+        heapq.heappush(self._heap, (due, kind, row['UserTaskID'], row['UserID'], row.get('TaskEndTime')))
+
+    def load(self, now):
+        """Queue every deadline that is already overdue or due within the horizon."""
+        until = now + timedelta(seconds=self.horizon)
+        pool  = dbpool.get_pool()
+        backlog = False
+        for kind, (status, _, col, _) in TRANSITIONS.items():
+            with pool.cursor() as cur:
+                cur.execute(
+                    f"SELECT UserTaskID, UserID, TaskEndTime, {col} AS due "
+                    f"FROM mmungoshi_user_task "
+                    f"WHERE TaskStatus=%s AND {col} <= %s "
+                    f"ORDER BY {col} LIMIT %s",
+                    [status, until, self.batch_size]
+                )
+                rows = cur.fetchall()
+            for row in rows:
+                self._push(row['due'], kind, row)
+            if len(rows) == self.batch_size:
+                backlog = True
+        # a full batch means more rows are waiting: reload again on the next tick
+        self._next_refresh = now if backlog else now + timedelta(seconds=self.refresh)
+
+    def wake(self):
+        """Ask the loop to reload early (e.g. right after an assignment is saved)."""
+        self._next_refresh = None
+        self._wake.set()
+
+    # ── applying transitions ────────────────────────────────────────────────
+    def run_due(self, now):
+        """Pop and apply everything due at `now`; returns the number of rows flipped."""
+        flipped = 0
+        while self._heap and self._heap[0][0] <= now:
+            due = {'start': [], 'complete': []}
+            while self._heap and self._heap[0][0] <= now:
+                entry = heapq.heappop(self._heap)
+                key = (entry[1], entry[2])
+                if self._queued.get(key) == entry[0]:
+                    del self._queued[key]
+                due[entry[1]].append(entry)
+            for kind in ('start', 'complete'):
+                for i in range(0, len(due[kind]), self.batch_size):
+                    flipped += self._apply(kind, due[kind][i:i + self.batch_size], now)
+        return flipped
+
+    def _apply(self, kind, entries, now):
+        old, new, col, ntype = TRANSITIONS[kind]
+        ids  = [e[2] for e in entries]
+        ends = {e[2]: e[4] for e in entries}
+        marks = ','.join(['%s'] * len(ids))
+        pool = dbpool.get_pool()
+        with pool.transaction():
+            with pool.cursor() as cur:
+                # re-check under lock: the row may have been edited or flipped already
+                cur.execute(
+                    f"SELECT UserTaskID, UserID, TaskEndTime FROM mmungoshi_user_task "
+                    f"WHERE UserTaskID IN ({marks}) AND TaskStatus=%s AND {col} <= %s "
+                    f"FOR UPDATE",
+                    ids + [old, now]
+                )
+                rows = cur.fetchall()
+                if not rows:
+                    return 0
+                live = [r['UserTaskID'] for r in rows]
+                # bump the optimistic-lock column when the table has one (migration 0006)
+                version = user_task().version_field
+                bump = f", `{version}`=`{version}`+1" if version else ""
+                cur.execute(
+                    f"UPDATE mmungoshi_user_task SET TaskStatus=%s{bump} "
+                    f"WHERE UserTaskID IN ({','.join(['%s'] * len(live))})",
+                    [new] + live
+                )
+            notification().record_many([
+                {'UserID': r['UserID'], 'UserTaskID': r['UserTaskID'],
+                 'Type': ntype, 'CreatedAt': now}
+                for r in rows
+            ])
+
+        resultcache.invalidate([registry.table_name('user_task')], {r['UserID'] for r in rows})
+        if kind == 'complete':
+            # completions are counted on their end day
+            rollups.recompute({(r['UserID'], r['TaskEndTime'] or ends.get(r['UserTaskID'])) for r in rows})
+
+        if kind == 'start':
+            # a started task now waits for its end time
+            for r in rows:
+                end = r['TaskEndTime'] or ends.get(r['UserTaskID'])
+                if end is not None and end <= now + timedelta(seconds=self.horizon):
+                    self._push(end, 'complete', r)
+        return len(rows)
+
+    # ── recurring assignments ───────────────────────────────────────────────
+    def extend_recurrences(self, now):
+        """Materialise recurring assignments ahead of time (see recurrence.py)."""
+        if self.recur_every is None or (self._next_recur is not None and now < self._next_recur):
+            return 0
+        self._next_recur = now + timedelta(seconds=self.recur_every)
+        try:
+            created = recurrence().extend_due()
+        except (KeyError, pymysql.err.ProgrammingError):
+            # no `recurrence` table in config.yml, or migration 0007 not applied
+            log.warning("recurrences are not set up; not extending them")
+            self.recur_every = None
+            return 0
+        if created:
+            log.info("materialised %d recurring assignments", created)
+            self._next_refresh = None          # queue their deadlines on this tick
+        return created
+
+    # ── leadership ──────────────────────────────────────────────────────────
+    def _is_leader(self):
+        if self._lock_conn is not None:
+            try:
+                self._lock_conn.ping(reconnect=False)
+                return True
+            except Exception:
+                log.warning("scheduler lost its lock connection; stepping down")
+                self._lock_conn = None
+                self._heap, self._queued = [], {}
+        try:
+            conn = pymysql.connect(autocommit=True, **dbpool.connect_kwargs())
+            with conn.cursor() as cur:
+                cur.execute("SELECT GET_LOCK(%s, 0)", [LOCK_NAME])
+                got = cur.fetchone()[0] == 1
+        except Exception:
+            log.exception("scheduler could not reach the database")
+            return False
+        if not got:
+            conn.close()
+            return False
+        self._lock_conn = conn
+        self._next_refresh = None
+        log.info("transition scheduler elected in pid %s", os.getpid())
+        return True
+
+    # ── main loop ───────────────────────────────────────────────────────────
+    def run_forever(self):
+        while not self._stop.is_set():
+            if not self._is_leader():
+                self._stop.wait(self.elect_every)
+                continue
+            try:
+                now = _utcnow()
+                self.extend_recurrences(now)
+                if self._next_refresh is None or now >= self._next_refresh:
+                    self.load(now)
+                self.run_due(now)
+            except Exception:
+                log.exception("transition scheduler tick failed")
+                self._next_refresh = _utcnow() + timedelta(seconds=5)
+
+            now  = _utcnow()
+            nxt  = self._next_refresh
+            wait = (nxt - now).total_seconds() if nxt is not None else 0
+            if self._heap:
+                wait = min(wait, (self._heap[0][0] - now).total_seconds())
+            self._wake.wait(max(wait, 0.5))
+            self._wake.clear()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._lock_conn is not None:
+            try:
+                self._lock_conn.close()
+            except Exception:
+                pass
+            self._lock_conn = None
+
+
+# ─── In-process thread (one per worker; only the lock holder does work) ─────
+_scheduler = None
+_scheduler_pid = None
+_start_lock = threading.Lock()
+
+
+def ensure_started():
+    """Start this process's scheduler thread once (again after a fork)."""
+    global _scheduler, _scheduler_pid
+    if _scheduler_pid == os.getpid():
+        return _scheduler
+    with _start_lock:
+        if _scheduler_pid != os.getpid():
+            _scheduler = TransitionScheduler()
+            threading.Thread(
+                target=_scheduler.run_forever, name='transition-scheduler', daemon=True
+            ).start()
+            _scheduler_pid = os.getpid()
+    return _scheduler
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    TransitionScheduler().run_forever()
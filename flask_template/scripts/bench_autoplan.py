@@ -0,0 +1,115 @@
+"""
+bench_autoplan.py  –  latency and quality of autoplan.plan() on synthetic weeks
+
+    python -m flask_template.scripts.bench_autoplan
+    python -m flask_template.scripts.bench_autoplan --tasks 80 --days 7 --repeat 50 --share 0.7
+
+No database needed.  Each run draws a catalog of Flow/Motion candidates
+(random expected mood, intensity and duration) and a week of free windows
+between 06:00 and 22:00 with a few busy hours a day, then times plan() and
+reports, over all runs:
+- p50 / p95 / max latency against the budget,
+- how many plans met the Flow share and how many searches hit the budget,
+- the planned value as a fraction of the unconstrained optimum (the same
+  knapsack without the share constraint, an upper bound on any plan),
+- the value of a greedy baseline (best value per block first, share ignored).
+"""
+
+import argparse
+import random
+import statistics
+import sys
+from datetime import datetime, timedelta
+
+from flask_template import autoplan
+
+BLOCK_LENGTH = 30
+
+
+def make_candidates(n, rnd):
+    out = []
+    for i in range(n):
+        category = 'Flow' if i % 2 == 0 else 'Motion'
+        out.append(autoplan.Candidate(
+            i + 1, f"task {i + 1}", category,
+            minutes=rnd.choice((15, 30, 45, 60, 90, 120)),
+            intensity=rnd.randint(1, 10),
+            mood=rnd.uniform(-2, 4) if category == 'Flow' else rnd.uniform(-1, 2),
+            block_length=BLOCK_LENGTH))
+    return out
+
+
+def make_days(days, rnd, first=datetime(2030, 1, 7)):
+    out = []
+    for d in range(days):
+        day = first + timedelta(days=d)
+        t, end, windows = day.replace(hour=6), day.replace(hour=22), []
+        while t < end:
+            busy = t + timedelta(minutes=30 * rnd.randint(1, 4))
+            free = busy + timedelta(minutes=30 * rnd.randint(1, 8))
+            windows.append((busy, min(free, end)))
+            t = free
+        out.append([w for w in windows if w[0] < w[1]])
+    return out
+
+
+def greedy(cands, days, max_minutes):
+    total = 0.0
+    for windows in days:
+        room = sum(int((e - s).total_seconds() // 60) // BLOCK_LENGTH for s, e in windows)
+        if max_minutes:
+            room = min(room, max_minutes // BLOCK_LENGTH)
+        for c in sorted(cands, key=lambda c: -c.value / c.blocks):
+            if c.value > 0 and c.blocks <= room:
+                total += c.value
+                room -= c.blocks
+    return total
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--tasks', type=int, default=40)
+    ap.add_argument('--days', type=int, default=7)
+    ap.add_argument('--repeat', type=int, default=30)
+    ap.add_argument('--share', type=float, default=0.5, help="target Flow share of planned minutes")
+    ap.add_argument('--tolerance', type=float, default=0.1)
+    ap.add_argument('--max-minutes', type=int, default=None, help="cap on planned minutes per day")
+    ap.add_argument('--budget-ms', type=float, default=autoplan.BUDGET_MS)
+    ap.add_argument('--seed', type=int, default=0)
+    args = ap.parse_args(argv)
+
+    rnd = random.Random(args.seed)
+    times, quality, vs_greedy = [], [], []
+    feasible = timed_out = 0
+    for _ in range(args.repeat):
+        cands, days = make_candidates(args.tasks, rnd), make_days(args.days, rnd)
+        result = autoplan.plan(cands, days, BLOCK_LENGTH, args.share, args.tolerance,
+                               args.max_minutes, args.budget_ms)
+        bound = autoplan.plan(cands, days, BLOCK_LENGTH, args.share, tolerance=1.0,
+                              max_minutes=args.max_minutes, budget_ms=args.budget_ms)
+        times.append(result['elapsed_ms'])
+        feasible += result['feasible']
+        timed_out += not result['complete']
+        if bound['expected_total'] > 0:
+            quality.append(result['expected_total'] / bound['expected_total'])
+        base = greedy(cands, days, args.max_minutes)
+        if base > 0:
+            vs_greedy.append(result['expected_total'] / base)
+
+    times.sort()
+    p95 = times[min(len(times) - 1, int(0.95 * len(times)))]
+    print(f"{args.repeat} runs, {args.tasks} tasks, {args.days} days of {BLOCK_LENGTH}-minute blocks, "
+          f"Flow share {args.share} ± {args.tolerance}")
+    print(f"latency ms   p50 {statistics.median(times):7.2f}   p95 {p95:7.2f}   "
+          f"max {times[-1]:7.2f}   (budget {args.budget_ms:g})")
+    print(f"share met    {feasible}/{args.repeat}        budget hit {timed_out}/{args.repeat}")
+    if quality:
+        print(f"value        {statistics.mean(quality):.1%} of the unconstrained optimum (mean), "
+              f"worst {min(quality):.1%}")
+    if vs_greedy:
+        print(f"vs greedy    {statistics.mean(vs_greedy):.2f}x the greedy baseline's value (share ignored)")
+    return 0 if times[-1] <= args.budget_ms * 1.5 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
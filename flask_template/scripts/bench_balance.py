@@ -0,0 +1,125 @@
+"""
+bench_balance.py  –  pure-Python loop vs. balance.py on synthetic rows
+
+    python -m flask_template.scripts.bench_balance
+    python -m flask_template.scripts.bench_balance --sizes 10000 100000 --repeat 5
+
+No database needed.  For each size it builds rows shaped like the planner's
+result set and times
+- loop:       the original per-row loop over dict rows,
+- planner:    balance.score via from_tuples on SCORE_SELECT tuples followed by
+              display columns, as the planner fetches them,
+- cursor:     balance.score on the tuples a plain cursor returns for
+              balance.SCORE_SELECT (fallbacks already resolved, as MySQL would),
+- compute:    balance.score alone on columns already loaded,
+and checks that they all agree.  "speedup" is loop / cursor.
+"""
+
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from flask_template import balance
+
+BLOCK_LENGTH = 30
+COLUMNS = ['TaskStartTime', 'TaskID', 'MoodBefore', 'MoodAfter',
+           'FeedbackIntensity', 'DefaultIntensity', 'ActualDuration', 'DefaultDuration']
+SCORE_COLUMNS = ['StartSec', 'TaskID', 'Mood', 'Intensity', 'Duration']
+PLANNER_COLUMNS = SCORE_COLUMNS + ['UserTaskID', 'TaskName', 'TaskStatus']
+EPOCH = datetime(1970, 1, 1)
+
+
+def loop_score(tasks):
+    """The per-row implementation balance.py replaced, kept as the reference."""
+    if not tasks:
+        return "NA"
+    total = 0
+    for row in tasks:
+        mb        = row['MoodBefore']; ma = row['MoodAfter']
+        mood_diff = (int(ma)-int(mb)) if (mb is not None and ma is not None) else 0
+        intensity = int(row.get('FeedbackIntensity') or row['DefaultIntensity'] or 1)
+        duration  = int(row.get('ActualDuration') or row['DefaultDuration'] or BLOCK_LENGTH)
+        total    += mood_diff * intensity * (duration / BLOCK_LENGTH)
+    return round(total/len(tasks),2)
+
+
+def make_rows(n, seed=0):
+    rnd = random.Random(seed)
+    t0 = datetime(2025, 1, 1)
+    rows = []
+    for i in range(n):
+        has_fb = rnd.random() < 0.7
+        rows.append((
+            t0 + timedelta(minutes=30 * i),
+            rnd.randint(1, 40),
+            rnd.randint(1, 10) if has_fb else None,
+            rnd.randint(1, 10) if has_fb else None,
+            rnd.randint(1, 10) if has_fb and rnd.random() < 0.8 else None,
+            rnd.randint(1, 10),
+            rnd.randint(5, 90) if has_fb else None,
+            rnd.randint(5, 90),
+        ))
+    return rows
+
+
+def as_selected(row):
+    """What SCORE_SELECT returns for one raw row."""
+    start, task_id, mb, ma, fi, di, ad, dd = row
+    return (int((start - EPOCH).total_seconds()), task_id,
+            ma - mb if mb is not None and ma is not None else 0,
+            fi or di or 1, ad or dd or BLOCK_LENGTH)
+
+
+class TupleCursor:
+    """Stands in for an executed pymysql.cursors.Cursor."""
+    description = [(name,) for name in SCORE_COLUMNS]
+
+    def __init__(self, rows):
+        self._rows = rows
+
+    def fetchall(self):
+        return self._rows
+
+
+def best_of(repeat, fn):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    ap.add_argument('--repeat', type=int, default=3)
+    args = ap.parse_args(argv)
+
+    print(f"{'rows':>10}  {'loop':>10}  {'planner':>10}  {'cursor':>10}  {'compute':>10}  {'speedup':>8}")
+    for n in args.sizes:
+        raw = make_rows(n)
+        dicts = [dict(zip(COLUMNS, t)) for t in raw]
+        selected = [as_selected(t) for t in raw]
+        planner = [s + (i, f"task {s[1]}", 'pending') for i, s in enumerate(selected)]
+        loaded = balance.from_cursor(TupleCursor(selected))
+
+        t_loop, s_loop = best_of(args.repeat, lambda: loop_score(dicts))
+        t_rows, s_rows = best_of(args.repeat, lambda: balance.score(
+            balance.from_tuples(PLANNER_COLUMNS, planner), BLOCK_LENGTH))
+        t_cur, s_cur = best_of(args.repeat, lambda: balance.score(
+            balance.from_cursor(TupleCursor(selected)), BLOCK_LENGTH))
+        t_cmp, s_cmp = best_of(args.repeat, lambda: balance.score(loaded, BLOCK_LENGTH))
+
+        if not (s_loop == s_rows == s_cur == s_cmp):
+            print(f"mismatch at {n} rows: {s_loop} / {s_rows} / {s_cur} / {s_cmp}", file=sys.stderr)
+            return 1
+        print(f"{n:>10,}  {t_loop * 1000:>8.1f}ms  {t_rows * 1000:>8.1f}ms  {t_cur * 1000:>8.1f}ms  "
+              f"{t_cmp * 1000:>8.1f}ms  {t_loop / t_cur:>7.1f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""
+bench_rows.py  –  memory and build time of dict rows vs. slotted rows
+
+    python -m flask_template.scripts.bench_rows
+    python -m flask_template.scripts.bench_rows --rows 100000 500000
+
+No database needed.  Rows are shaped like mmungoshi_user_task.  The column
+values are created once up front (as the driver would), so the numbers are
+the per-row container cost only:
+- dict:     what DictCursor builds, dict(zip(columns, values)),
+- slotted:  rows.row_class(...)(*values), what slots=True builds,
+- tuple:    the raw cursor tuples, as a lower bound.
+"""
+
+import argparse
+import gc
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from flask_template import rows
+
+COLUMNS = ('UserTaskID', 'UserID', 'TaskID', 'TaskStartTime', 'TaskEndTime',
+           'Intensity', 'ActualDuration', 'TaskStatus', 'Version')
+
+
+def make_values(n, seed=0):
+    rnd = random.Random(seed)
+    t0 = datetime(2025, 1, 1)
+    out = []
+    for i in range(n):
+        start = t0 + timedelta(minutes=30 * i)
+        out.append((i + 1, rnd.randint(1, 500), rnd.randint(1, 40), start,
+                    start + timedelta(minutes=30), rnd.randint(1, 10), rnd.randint(5, 90),
+                    rnd.choice(('pending', 'in_progress', 'completed')), 0))
+    return out
+
+
+def measure(build):
+    """(bytes allocated by build() that are still alive, seconds, result)."""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    seconds = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, seconds, result
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--rows', type=int, nargs='+', default=[100_000])
+    args = ap.parse_args(argv)
+
+    cls = rows.row_class('mmungoshi_user_task', COLUMNS)
+    print(f"{'rows':>10}  {'kind':>8}  {'total MB':>9}  {'B/row':>6}  {'build ms':>9}")
+    for n in args.rows:
+        values = make_values(n)
+        builds = [
+            ('dict',    lambda: [dict(zip(COLUMNS, v)) for v in values]),
+            ('slotted', lambda: [cls(*v) for v in values]),
+            ('tuple',   lambda: [(*v,) for v in values]),
+        ]
+        results = {}
+        for kind, build in builds:
+            size, seconds, results[kind] = measure(build)
+            print(f"{n:>10,}  {kind:>8}  {size / 1e6:>9.1f}  {size / n:>6.0f}  {seconds * 1000:>9.1f}")
+        if [dict(r) for r in results['slotted']] != results['dict']:
+            print("slotted rows differ from dict rows", file=sys.stderr)
+            return 1
+        del results
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,274 @@
+"""
+bulk_import.py  –  stream CSV / JSONL files into tasks, assignments or feedback
+
+    python -m flask_template.scripts.bulk_import tasks.csv --kind task
+    python -m flask_template.scripts.bulk_import history.jsonl --kind user_task --batch-size 2000
+
+Rows are read one at a time, checked with the same rules the web forms use
+(task._validate_core, user_task.verify_new, feedback.verify_new) and written
+with insertMany in batched transactions, so memory stays flat however large
+the file is.  Rejected rows go to a side file (<input>.rejects.jsonl) with
+their line number and errors.  Every batch commits together with a checkpoint
+row in mmungoshi_import_checkpoint (migration 0008) recording the byte offset
+reached; running the same command again seeks there and carries on.  Pass
+--restart to ignore it.
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import sys
+import time
+from pathlib import Path
+
+import pymysql
+
+from flask_template import dbpool
+from flask_template.task import task
+from flask_template.user_task import user_task
+from flask_template.feedback import feedback
+# registers their write listeners, so running web workers see the new rows
+from flask_template import catalog, resultcache, rollups  # noqa: F401
+
+MODELS = {'task': task, 'user_task': user_task, 'feedback': feedback}
+
+CHECKPOINT_TABLE = 'mmungoshi_import_checkpoint'
+
+
+# ─── Validation ──────────────────────────────────────────────────────────────
+def validate(model, kind, rec):
+    """Return a list of errors for one record (empty when it is valid)."""
+    if kind == 'task':
+        return model._validate_core(rec)
+    model.data = [rec]
+    model.verify_new(0)
+    return list(model.errors)
+
+
+def clean(rec):
+    # CSV has no NULL; an empty cell means "not given"
+    return {k: (None if v == '' else v) for k, v in rec.items()}
+
+
+# ─── Readers ─────────────────────────────────────────────────────────────────
+class Lines:
+    """
+    Decoded lines of a file opened in binary mode, counting the bytes and
+    lines handed out so far.  csv.reader pulls only the lines a record needs,
+    so after each record `offset` is exactly where the next one starts.
+    """
+
+    def __init__(self, fh, offset=0, lines=0):
+        self.fh = fh
+        self.offset = offset
+        self.lines = lines
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        raw = self.fh.readline()
+        if not raw:
+            raise StopIteration
+        self.offset += len(raw)
+        self.lines += 1
+        return raw.decode('utf-8')
+
+
+def read_rows(path, fmt, offset=0, lines=0):
+    """
+    Yield (line_number, record, offset) without loading the file, starting
+    at byte `offset` (line `lines`); offset is where the next record begins.
+    """
+    with open(path, 'rb') as fh:
+        src = Lines(fh)
+        if fmt == 'csv':
+            header = next(csv.reader(src), None)
+            if header is None:
+                return
+            if offset:
+                fh.seek(offset)
+                src.offset, src.lines = offset, lines
+            for rec in csv.DictReader(src, fieldnames=header):
+                yield src.lines, rec, src.offset
+        else:
+            fh.seek(offset)
+            src.offset, src.lines = offset, lines
+            for line in src:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rec = json.loads(line)
+                except ValueError as exc:
+                    rec = {'__error__': f"Invalid JSON: {exc}"}
+                if not isinstance(rec, dict):
+                    rec = {'__error__': f"Expected a JSON object, got {type(rec).__name__}"}
+                yield src.lines, rec, src.offset
+
+
+# ─── Checkpoints ─────────────────────────────────────────────────────────────
+def checkpoint_name(source, kind):
+    return hashlib.sha1(f"{kind}:{source}".encode('utf-8')).hexdigest()
+
+
+def _checkpoint_query(sql, params):
+    try:
+        with dbpool.get_pool().cursor() as cur:
+            cur.execute(sql, params)
+            return cur.fetchone()
+    except pymysql.err.ProgrammingError as exc:
+        # 1146 = table doesn't exist
+        if exc.args and exc.args[0] == 1146:
+            sys.exit(f"{CHECKPOINT_TABLE} is missing; run migrate.py up first.")
+        raise
+
+
+def load_checkpoint(name, source, kind):
+    row = _checkpoint_query(f"SELECT State FROM {CHECKPOINT_TABLE} WHERE Name = %s", [name])
+    if row is None:
+        return None
+    cp = json.loads(row['State'])
+    if cp.get('source') != str(source) or cp.get('kind') != kind:
+        sys.exit(f"checkpoint {name} belongs to a different import; use --restart or --checkpoint.")
+    return cp
+
+
+def save_checkpoint(name, cp):
+    """Upsert the checkpoint row; inside pool.transaction() it commits with the batch."""
+    _checkpoint_query(
+        f"INSERT INTO {CHECKPOINT_TABLE} (Name, Source, Kind, State) VALUES (%s, %s, %s, %s) "
+        "ON DUPLICATE KEY UPDATE Source = VALUES(Source), Kind = VALUES(Kind), State = VALUES(State)",
+        [name, cp['source'], cp['kind'], json.dumps(cp)]
+    )
+
+
+# ─── Import loop ─────────────────────────────────────────────────────────────
+class Importer:
+    def __init__(self, kind, batch_size, rejects_fh, checkpoint_name, cp):
+        self.kind       = kind
+        self.model      = MODELS[kind]()
+        self.pool       = dbpool.get_pool()
+        self.batch_size = batch_size
+        self.rejects_fh = rejects_fh
+        self.checkpoint_name = checkpoint_name
+        self.cp         = cp
+        self.batch      = []
+        self.pending_rejects = []
+        self.started    = time.monotonic()
+        self.last_report = self.started
+        self.done_this_run = 0
+
+    def reject(self, line_no, rec, errors):
+        self.pending_rejects.append({'line': line_no, 'errors': errors, 'record': rec})
+
+    def add(self, line_no, rec, offset):
+        if '__error__' in rec:
+            self.reject(line_no, None, [rec['__error__']])
+        else:
+            errors = validate(self.model, self.kind, rec)
+            if errors:
+                self.reject(line_no, rec, errors)
+            else:
+                self.batch.append((line_no, clean(rec)))
+        self.cp['rows_read'] += 1
+        self.cp['offset'], self.cp['lines'] = offset, line_no
+        self.done_this_run += 1
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+        self.report()
+
+    def insert(self, rows):
+        """insertMany under a savepoint, so a failure undoes only these rows."""
+        with self.pool.cursor() as cur:
+            cur.execute("SAVEPOINT import_rows")
+        try:
+            # copies: insertMany back-fills keys, and a retry must not send them
+            self.model.insertMany([dict(rec) for rec in rows])
+        except (pymysql.err.IntegrityError, pymysql.err.DataError):
+            with self.pool.cursor() as cur:
+                cur.execute("ROLLBACK TO SAVEPOINT import_rows")
+            raise
+
+    def flush(self):
+        # the batch and the checkpoint that covers it commit together
+        with self.pool.transaction():
+            if self.batch:
+                try:
+                    self.insert([rec for _, rec in self.batch])
+                    self.cp['inserted'] += len(self.batch)
+                except (pymysql.err.IntegrityError, pymysql.err.DataError):
+                    # one bad row fails the whole batch; retry row by row to isolate it
+                    for line_no, rec in self.batch:
+                        try:
+                            self.insert([rec])
+                            self.cp['inserted'] += 1
+                        except (pymysql.err.IntegrityError, pymysql.err.DataError) as exc:
+                            self.reject(line_no, rec, [str(exc)])
+
+            # rejects are written first and the file size is checkpointed, so a
+            # resume truncates whatever an uncommitted batch left behind
+            for r in self.pending_rejects:
+                self.rejects_fh.write(json.dumps(r, default=str) + '\n')
+            self.rejects_fh.flush()
+            self.cp['rejected'] += len(self.pending_rejects)
+            self.cp['rejects_size'] = self.rejects_fh.tell()
+            save_checkpoint(self.checkpoint_name, self.cp)
+        self.batch = []
+        self.pending_rejects = []
+
+    def report(self, force=False):
+        now = time.monotonic()
+        if not force and now - self.last_report < 2:
+            return
+        self.last_report = now
+        rate = self.done_this_run / max(now - self.started, 1e-9)
+        print(
+            f"read {self.cp['rows_read']:,}  inserted {self.cp['inserted']:,}  "
+            f"rejected {self.cp['rejected']:,}  {rate:,.0f} rows/sec",
+            file=sys.stderr
+        )
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('path', type=Path)
+    ap.add_argument('--kind', required=True, choices=sorted(MODELS))
+    ap.add_argument('--format', choices=['csv', 'jsonl'],
+                    help="defaults to the file extension (.csv, otherwise JSONL)")
+    ap.add_argument('--batch-size', type=int, default=1000)
+    ap.add_argument('--rejects', type=Path)
+    ap.add_argument('--checkpoint', help="checkpoint name (default: derived from the file and --kind)")
+    ap.add_argument('--restart', action='store_true', help="ignore an existing checkpoint")
+    args = ap.parse_args(argv)
+
+    fmt = args.format or ('csv' if args.path.suffix.lower() == '.csv' else 'jsonl')
+    rejects_path = args.rejects or args.path.with_name(args.path.name + '.rejects.jsonl')
+    source = args.path.resolve()
+    name   = args.checkpoint or checkpoint_name(source, args.kind)
+
+    cp = None if args.restart else load_checkpoint(name, source, args.kind)
+    resuming = cp is not None
+    if cp is None:
+        cp = {'source': str(source), 'kind': args.kind, 'rows_read': 0, 'inserted': 0, 'rejected': 0,
+              'offset': 0, 'lines': 0, 'rejects_size': 0}
+    if resuming:
+        print(f"resuming after {cp['rows_read']:,} rows (line {cp['lines']:,})", file=sys.stderr)
+
+    with open(rejects_path, 'a' if resuming else 'w', encoding='utf-8') as rejects_fh:
+        if resuming:
+            rejects_fh.truncate(cp['rejects_size'])
+        imp = Importer(args.kind, args.batch_size, rejects_fh, name, cp)
+        for line_no, rec, offset in read_rows(args.path, fmt, cp['offset'], cp['lines']):
+            imp.add(line_no, rec, offset)
+        imp.flush()
+        imp.report(force=True)
+
+    cp['finished'] = True
+    save_checkpoint(name, cp)
+    return 0 if cp['rejected'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,175 @@
+"""
+migrate.py  –  versioned schema migrations and an index check for hot queries
+
+    python -m flask_template.scripts.migrate up        # apply pending migrations
+    python -m flask_template.scripts.migrate status    # list applied / pending
+    python -m flask_template.scripts.migrate check     # EXPLAIN the hot queries
+
+A fresh database is created from tables.sql and then brought up to date with
+`up`.  Migrations are the NNNN_name.sql files in scripts/migrations, applied
+in order and recorded in mmungoshi_schema_migrations.  `check` exits non-zero
+if any registered hot query would read its table with a full scan.
+"""
+
+import argparse
+import hashlib
+import re
+import sys
+from pathlib import Path
+
+from flask_template import dbpool
+from flask_template import registry
+
+MIGRATIONS_DIR = Path(__file__).parent / "migrations"
+TRACKING_TABLE = "mmungoshi_schema_migrations"
+
+# (name, SQL, sample params, table aliases that must not be full-scanned)
+# These mirror the query shapes in app.py and scheduler.py.
+HOT_QUERIES = [
+    ("scheduler: due starts",
+     "SELECT UserTaskID, UserID, TaskEndTime, TaskStartTime FROM mmungoshi_user_task "
+     "WHERE TaskStatus='pending' AND TaskStartTime <= %s ORDER BY TaskStartTime LIMIT 500",
+     ['2030-01-01 00:00:00'], ['mmungoshi_user_task']),
+    ("scheduler: due completions",
+     "SELECT UserTaskID, UserID, TaskEndTime FROM mmungoshi_user_task "
+     "WHERE TaskStatus='in_progress' AND TaskEndTime <= %s ORDER BY TaskEndTime LIMIT 500",
+     ['2030-01-01 00:00:00'], ['mmungoshi_user_task']),
+    ("assignment list / history: one user's assignments",
+     "SELECT ut.UserTaskID, t.TaskName, f.MoodBefore FROM mmungoshi_user_task ut "
+     "JOIN mmungoshi_task t ON ut.TaskID = t.TaskID "
+     "LEFT JOIN mmungoshi_feedback f ON f.UserTaskID = ut.UserTaskID "
+     "WHERE ut.UserID = %s ORDER BY ut.TaskStartTime DESC, ut.UserTaskID DESC LIMIT 51",
+     [1], ['ut', 'f']),
+    ("planner: one user's assignments in a date window",
+     "SELECT ut.UserTaskID, t.TaskName, f.MoodBefore FROM mmungoshi_user_task ut "
+     "JOIN mmungoshi_task t ON ut.TaskID = t.TaskID "
+     "LEFT JOIN mmungoshi_feedback f ON f.UserTaskID = ut.UserTaskID "
+     "WHERE ut.UserID = %s AND ut.TaskStartTime >= %s AND ut.TaskStartTime < %s "
+     "AND t.TaskCategory = %s ORDER BY ut.TaskStartTime",
+     [1, '2030-01-01', '2030-01-08', 'Flow'], ['ut', 'f']),
+    ("conflict index: one user's upcoming assignments",
+     "SELECT ut.UserTaskID, ut.TaskStartTime, ut.TaskEndTime, "
+     "COALESCE(f.ActualDuration, t.DefaultDuration) FROM mmungoshi_user_task ut "
+     "LEFT JOIN mmungoshi_task t ON t.TaskID = ut.TaskID "
+     "LEFT JOIN mmungoshi_feedback f ON f.UserTaskID = ut.UserTaskID "
+     "WHERE ut.UserID = %s AND (ut.TaskEndTime > %s OR (ut.TaskEndTime IS NULL AND ut.TaskStartTime > %s))",
+     [1, '2030-01-01', '2030-01-01'], ['ut', 'f']),
+    ("auto-plan: one user's mood history per task",
+     "SELECT ut.TaskID, COUNT(*), AVG(f.MoodAfter - f.MoodBefore) FROM mmungoshi_feedback f "
+     "JOIN mmungoshi_user_task ut ON ut.UserTaskID = f.UserTaskID "
+     "WHERE ut.UserID = %s AND f.MoodBefore IS NOT NULL AND f.MoodAfter IS NOT NULL GROUP BY ut.TaskID",
+     [1], ['ut', 'f']),
+    ("feedback for one assignment",
+     "SELECT * FROM mmungoshi_feedback WHERE UserTaskID = %s",
+     [1], ['mmungoshi_feedback']),
+    ("weekly balance: one user's feedback window",
+     "SELECT AVG(f.MoodAfter - f.MoodBefore) FROM mmungoshi_user_task ut "
+     "JOIN mmungoshi_feedback f ON f.UserTaskID = ut.UserTaskID "
+     "WHERE ut.UserID = %s AND f.Timestamp >= %s AND f.Timestamp < DATE_ADD(%s, INTERVAL 7 DAY)",
+     [1, '2030-01-01', '2030-01-01'], ['ut', 'f']),
+    ("reporting APIs: one user's daily rollups",
+     "SELECT Day, HourHist FROM mmungoshi_daily_rollup WHERE UserID = %s AND Day >= %s",
+     [1, '2030-01-01'], ['mmungoshi_daily_rollup']),
+    ("notifications for one user",
+     "SELECT * FROM mmungoshi_notification WHERE UserID = %s AND NotificationID > %s "
+     "ORDER BY NotificationID DESC LIMIT 20",
+     [1, 0], ['mmungoshi_notification']),
+]
+
+
+# ─── Migration files ─────────────────────────────────────────────────────────
+def discover():
+    """[(version, name, path)] for every migration file, in order."""
+    found = []
+    for path in sorted(MIGRATIONS_DIR.glob("*.sql")):
+        m = re.match(r"(\d+)_(.+)\.sql$", path.name)
+        if m:
+            found.append((m.group(1), m.group(2), path))
+    return found
+
+
+def statements(sql):
+    body = "\n".join(line for line in sql.splitlines() if not line.strip().startswith("--"))
+    return [s.strip() for s in body.split(";") if s.strip()]
+
+
+def checksum(path):
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+# ─── Commands ────────────────────────────────────────────────────────────────
+def ensure_tracking(cur):
+    cur.execute(
+        f"CREATE TABLE IF NOT EXISTS {TRACKING_TABLE} ("
+        "  Version VARCHAR(32) NOT NULL PRIMARY KEY,"
+        "  Name VARCHAR(255) NOT NULL,"
+        "  Checksum CHAR(64) NOT NULL,"
+        "  AppliedAt DATETIME DEFAULT CURRENT_TIMESTAMP"
+        ")"
+    )
+
+
+def applied(cur):
+    cur.execute(f"SELECT Version, Checksum FROM {TRACKING_TABLE}")
+    return {r['Version']: r['Checksum'] for r in cur.fetchall()}
+
+
+def cmd_up(cur):
+    done = applied(cur)
+    count = 0
+    for version, name, path in discover():
+        if version in done:
+            if done[version] != checksum(path):
+                print(f"warning: {path.name} changed after it was applied", file=sys.stderr)
+            continue
+        print(f"applying {path.name} ...")
+        # MySQL DDL commits implicitly, so each statement stands on its own
+        for stmt in statements(path.read_text()):
+            cur.execute(stmt)
+        cur.execute(
+            f"INSERT INTO {TRACKING_TABLE} (Version, Name, Checksum) VALUES (%s, %s, %s)",
+            [version, name, checksum(path)]
+        )
+        count += 1
+    if count:
+        # columns and keys may have changed; drop cached DESCRIBE results
+        registry.invalidate()
+    print(f"{count} migration(s) applied.")
+    return 0
+
+
+def cmd_status(cur):
+    done = applied(cur)
+    for version, name, path in discover():
+        mark = "applied" if version in done else "pending"
+        print(f"{version}  {mark:8}  {name}")
+    return 0
+
+
+def cmd_check(cur):
+    failures = 0
+    for name, sql, params, tables in HOT_QUERIES:
+        cur.execute("EXPLAIN " + sql, params)
+        plan = cur.fetchall()
+        scans = [r for r in plan if r['table'] in tables and r['type'] == 'ALL']
+        status = "FULL SCAN" if scans else "ok"
+        keys = ", ".join(f"{r['table']}:{r['key'] or '-'}" for r in plan)
+        print(f"{status:9}  {name}  [{keys}]")
+        failures += bool(scans)
+    if failures:
+        print(f"{failures} hot quer{'y' if failures == 1 else 'ies'} fell back to a full scan.", file=sys.stderr)
+    return 1 if failures else 0
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('command', choices=['up', 'status', 'check'])
+    args = ap.parse_args(argv)
+
+    with dbpool.get_pool().cursor() as cur:
+        ensure_tracking(cur)
+        return {'up': cmd_up, 'status': cmd_status, 'check': cmd_check}[args.command](cur)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,15 @@
+-- Per-user notifications written by the transition scheduler (see tables.sql).
+CREATE TABLE IF NOT EXISTS mmungoshi_notification
+(
+  NotificationID INT AUTO_INCREMENT,
+  UserID INT NOT NULL,
+  UserTaskID INT NOT NULL,
+  Type ENUM('started', 'complete_reminder') NOT NULL,
+  CreatedAt DATETIME NOT NULL,
+  ReadAt DATETIME,
+  created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (NotificationID),
+  KEY idx_notification_user (UserID, NotificationID),
+  FOREIGN KEY (UserID) REFERENCES mmungoshi_user(UserID) ON DELETE CASCADE,
+  FOREIGN KEY (UserTaskID) REFERENCES mmungoshi_user_task(UserTaskID) ON DELETE CASCADE
+);
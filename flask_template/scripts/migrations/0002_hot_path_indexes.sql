@@ -0,0 +1,14 @@
+-- Composite indexes for the hot query shapes.
+
+-- scheduler: pending rows by start time, in-progress rows by end time
+CREATE INDEX idx_ut_status_start ON mmungoshi_user_task (TaskStatus, TaskStartTime);
+CREATE INDEX idx_ut_status_end   ON mmungoshi_user_task (TaskStatus, TaskEndTime);
+
+-- planner, assignment list, task history: one user's rows in start-time order
+CREATE INDEX idx_ut_user_start   ON mmungoshi_user_task (UserID, TaskStartTime, UserTaskID);
+
+-- weekly balance: one user's feedback in a time window
+CREATE INDEX idx_fb_user_time    ON mmungoshi_feedback (UserID, Timestamp);
+
+-- feedback by UserTaskID is already served by the index InnoDB creates for
+-- its foreign key; `migrate.py check` verifies that lookup too.
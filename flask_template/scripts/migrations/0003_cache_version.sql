@@ -0,0 +1,10 @@
+-- Version stamps for process-local caches (catalog.py).  Every write to a
+-- cached table bumps its row, and each worker compares the stamp it loaded
+-- against this table to notice writes made by the other workers.
+CREATE TABLE IF NOT EXISTS mmungoshi_cache_version (
+  Name      VARCHAR(64)     NOT NULL PRIMARY KEY,
+  Version   BIGINT UNSIGNED NOT NULL DEFAULT 0,
+  UpdatedAt TIMESTAMP       DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+INSERT IGNORE INTO mmungoshi_cache_version (Name, Version) VALUES ('task', 0), ('user', 0);
@@ -0,0 +1,18 @@
+-- Per-user, per-day, per-category aggregates behind the /api reporting
+-- endpoints, kept current by rollups.py.  Each column counts events on Day:
+-- assignments starting that day (TaskCount, Minutes, HourHist), assignments
+-- completed that day (CompletedCount) and feedback given that day
+-- (MoodScoreSum, FeedbackCount).  Backfill with scripts/rebuild_rollups.py.
+CREATE TABLE IF NOT EXISTS mmungoshi_daily_rollup (
+  UserID         INT          NOT NULL,
+  Day            DATE         NOT NULL,
+  TaskCategory   VARCHAR(100) NOT NULL,
+  Minutes        INT          NOT NULL DEFAULT 0,   -- SUM(TaskEndTime - TaskStartTime) in minutes
+  TaskCount      INT          NOT NULL DEFAULT 0,
+  CompletedCount INT          NOT NULL DEFAULT 0,
+  HourHist       JSON         NULL,                 -- 24 counts of starts by HOUR(TaskStartTime)
+  MoodScoreSum   DOUBLE       NOT NULL DEFAULT 0,   -- SUM((MoodAfter - MoodBefore) * Intensity * ActualDuration)
+  FeedbackCount  INT          NOT NULL DEFAULT 0,   -- feedback rows where that product is not NULL
+  UpdatedAt      TIMESTAMP(6) DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+  PRIMARY KEY (UserID, Day, TaskCategory)
+);
@@ -0,0 +1,8 @@
+-- Server-side sessions for the 'mysql' session store (sessions.py).  Rows
+-- are looked up by SessionID; the expiry sweeper deletes by ExpiresAt.
+CREATE TABLE IF NOT EXISTS mmungoshi_session (
+  SessionID VARCHAR(64)  NOT NULL PRIMARY KEY,
+  Data      TEXT         NOT NULL,
+  ExpiresAt DOUBLE       NOT NULL,
+  INDEX idx_session_expires (ExpiresAt)
+);
@@ -0,0 +1,8 @@
+-- Per-row version counters for optimistic concurrency (baseObject.update).
+-- Every UPDATE through a model or the scheduler bumps Version; a model
+-- update of a row read at an older version matches nothing and is reported
+-- as a conflict instead of silently overwriting the newer row.
+ALTER TABLE mmungoshi_user_task ADD COLUMN Version INT UNSIGNED NOT NULL DEFAULT 0;
+ALTER TABLE mmungoshi_task      ADD COLUMN Version INT UNSIGNED NOT NULL DEFAULT 0;
+ALTER TABLE mmungoshi_feedback  ADD COLUMN Version INT UNSIGNED NOT NULL DEFAULT 0;
+ALTER TABLE mmungoshi_user      ADD COLUMN Version INT UNSIGNED NOT NULL DEFAULT 0;
@@ -0,0 +1,31 @@
+-- Recurring assignments (recurrence.py).  A rule describes a block that
+-- repeats daily or on chosen weekdays; its occurrences are materialised into
+-- mmungoshi_user_task ahead of time, up to MaterialisedUntil (exclusive),
+-- and the scheduler extends that horizon as days pass.
+CREATE TABLE IF NOT EXISTS mmungoshi_recurrence (
+  RecurrenceID      INT AUTO_INCREMENT PRIMARY KEY,
+  UserID            INT          NOT NULL,
+  TaskID            INT          NOT NULL,
+  StartsOn          DATE         NOT NULL,
+  StartTime         TIME         NOT NULL,
+  Duration          INT          NOT NULL,
+  Intensity         INT          NULL,
+  Freq              ENUM('daily', 'weekly') NOT NULL,
+  Every             INT          NOT NULL DEFAULT 1,
+  Weekdays          VARCHAR(13)  NULL,
+  Until             DATE         NULL,
+  MaxCount          INT          NULL,
+  MaterialisedUntil DATE         NULL,
+  Generated         INT          NOT NULL DEFAULT 0,
+  Active            TINYINT(1)   NOT NULL DEFAULT 1,
+  Version           INT UNSIGNED NOT NULL DEFAULT 0,
+  created_at        TIMESTAMP    DEFAULT CURRENT_TIMESTAMP,
+  INDEX idx_recurrence_user (UserID),
+  INDEX idx_recurrence_due  (Active, MaterialisedUntil)
+);
+
+-- occurrences point back at their rule; the unique key makes a second
+-- materialisation of the same slot fail instead of duplicating it
+ALTER TABLE mmungoshi_user_task
+  ADD COLUMN RecurrenceID INT NULL,
+  ADD UNIQUE KEY uq_ut_recurrence_start (RecurrenceID, TaskStartTime);
@@ -0,0 +1,10 @@
+-- Resume points for scripts/bulk_import.py.  The row for an import is
+-- written in the same transaction as each batch it inserts, so the
+-- checkpoint and the imported rows can never disagree after a crash.
+CREATE TABLE IF NOT EXISTS mmungoshi_import_checkpoint (
+  Name      VARCHAR(255) NOT NULL PRIMARY KEY,
+  Source    TEXT         NOT NULL,
+  Kind      VARCHAR(32)  NOT NULL,
+  State     TEXT         NOT NULL,
+  UpdatedAt TIMESTAMP    DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
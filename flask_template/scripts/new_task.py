@@ -1,4 +1,4 @@
-from task import task
+from flask_template.task import task
 
 # Define the tasks you want to add
 sample_tasks = [
@@ -14,13 +14,15 @@ sample_tasks = [
     }
 ]
 
-# Insert them
+# Validate them all with one model instance, then insert in a single batch
+t = task()
 for tdata in sample_tasks:
-    t = task()
-    t.set(tdata)
-    if t.verify_new():
-        t.insert()
-        print(f"✅ Inserted task: {tdata['TaskName']}")
+    errors = t._validate_core(tdata)
+    if errors:
+        print(f"❌ Errors for {tdata['TaskName']}: {errors}")
     else:
-        print(f"❌ Errors for {tdata['TaskName']}: {t.errors}")
+        t.set(tdata)
 
+t.insertMany()
+for row in t.data:
+    print(f"✅ Inserted task: {row['TaskName']} (TaskID {row['TaskID']})")
@@ -0,0 +1,34 @@
+"""
+rebuild_rollups.py  –  recompute mmungoshi_daily_rollup from the source tables
+
+    python -m flask_template.scripts.rebuild_rollups            # every user
+    python -m flask_template.scripts.rebuild_rollups --user 7 --user 9
+
+Run it once after applying migration 0004 (backfill), after bulk loads made
+with raw SQL, or whenever the rollups are suspected to have drifted.  Each
+user is rebuilt in its own transaction, so readers never see a half-built
+user.
+"""
+
+import argparse
+import sys
+import time
+
+from flask_template import rollups
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--user', type=int, action='append', dest='users',
+                    help="rebuild only this UserID (repeatable)")
+    args = ap.parse_args(argv)
+
+    started = time.monotonic()
+    users, rows = rollups.rebuild(args.users)
+    print(f"rebuilt {rows:,} rollup rows for {users:,} user(s) "
+          f"in {time.monotonic() - started:.1f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
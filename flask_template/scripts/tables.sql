@@ -49,4 +49,19 @@ CREATE TABLE mmungoshi_feedback
   PRIMARY KEY (FeedbackID),
   FOREIGN KEY (UserID) REFERENCES mmungoshi_user(UserID),
   FOREIGN KEY (UserTaskID) REFERENCES mmungoshi_user_task(UserTaskID)
-);
\ No newline at end of file
+);
+
+CREATE TABLE mmungoshi_notification
+(
+  NotificationID INT AUTO_INCREMENT,
+  UserID INT NOT NULL,
+  UserTaskID INT NOT NULL,
+  Type ENUM('started', 'complete_reminder') NOT NULL,
+  CreatedAt DATETIME NOT NULL,
+  ReadAt DATETIME,
+  created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (NotificationID),
+  KEY idx_notification_user (UserID, NotificationID),
+  FOREIGN KEY (UserID) REFERENCES mmungoshi_user(UserID) ON DELETE CASCADE,
+  FOREIGN KEY (UserTaskID) REFERENCES mmungoshi_user_task(UserTaskID) ON DELETE CASCADE
+);
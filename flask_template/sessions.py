@@ -0,0 +1,309 @@
+"""
+sessions.py  –  server-side sessions in a pluggable, bounded store
+
+The browser only holds a signed random session id; the session itself is
+kept in one of three stores, picked with SHIBUI_SESSION_STORE:
+
+- memory:  an LRU dict capped at SHIBUI_SESSION_MAX entries.  Per process,
+           so only for a single worker (and development).
+- sqlite:  one table in a local SQLite file (SHIBUI_SESSION_DB).  Shared by
+           every worker on the host.  The default.
+- mysql:   mmungoshi_session (migration 0005), shared by every host.
+
+Sessions are serialised as tagged JSON (Flask's cookie-session format), not
+pickled, and only written back when they changed; an empty session is never
+stored.  Login calls session.regenerate(), so an id handed out before login
+(say with a flash message) never becomes an authenticated session.  A
+daemon thread per process deletes expired rows every SWEEP_EVERY seconds,
+and every store call is timed for /metrics.
+"""
+
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask.sessions import SessionInterface, SessionMixin, session_json_serializer
+from itsdangerous import BadSignature, Signer
+from werkzeug.datastructures import CallbackDict
+
+from flask_template.dbpool import get_pool
+
+STORE       = os.getenv('SHIBUI_SESSION_STORE', 'sqlite')
+MAX_ENTRIES = int(os.getenv('SHIBUI_SESSION_MAX', 10000))
+SWEEP_EVERY = float(os.getenv('SHIBUI_SESSION_SWEEP', 60))
+
+SESSION_TABLE = 'mmungoshi_session'
+
+
+# ─── Stores ──────────────────────────────────────────────────────────────────
+# Every store keeps (data, expires_at) per session id, with expires_at in
+# epoch seconds, and never returns an expired session.
+class MemoryStore:
+    name = 'memory'
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def load(self, sid):
+        with self._lock:
+            found = self._data.get(sid)
+            if found is None:
+                return None
+            if found[1] <= time.time():
+                del self._data[sid]
+                return None
+            self._data.move_to_end(sid)
+            return found[0]
+
+    def save(self, sid, data, expires_at):
+        with self._lock:
+            self._data[sid] = (data, expires_at)
+            self._data.move_to_end(sid)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)      # least recently used
+
+    def delete(self, sid):
+        with self._lock:
+            self._data.pop(sid, None)
+
+    def sweep(self, now):
+        with self._lock:
+            dead = [sid for sid, (_, exp) in self._data.items() if exp <= now]
+            for sid in dead:
+                del self._data[sid]
+        return len(dead)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteStore:
+    name = 'sqlite'
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS session ("
+            "  sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)")
+        self._conn().execute("CREATE INDEX IF NOT EXISTS session_expires ON session (expires_at)")
+
+    def _conn(self):
+        # one connection per thread (and per process: forked workers must not share one)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def load(self, sid):
+        row = self._conn().execute(
+            "SELECT data FROM session WHERE sid = ? AND expires_at > ?", (sid, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def save(self, sid, data, expires_at):
+        self._conn().execute(
+            "INSERT INTO session (sid, data, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(sid) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at",
+            (sid, data, expires_at))
+
+    def delete(self, sid):
+        self._conn().execute("DELETE FROM session WHERE sid = ?", (sid,))
+
+    def sweep(self, now):
+        return self._conn().execute("DELETE FROM session WHERE expires_at <= ?", (now,)).rowcount
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM session").fetchone()[0]
+
+
+class MySQLStore:
+    name = 'mysql'
+
+    def load(self, sid):
+        with get_pool().cursor() as cur:
+            cur.execute(f"SELECT Data FROM {SESSION_TABLE} WHERE SessionID = %s AND ExpiresAt > %s",
+                        [sid, time.time()])
+            row = cur.fetchone()
+        return row['Data'] if row else None
+
+    def save(self, sid, data, expires_at):
+        with get_pool().cursor() as cur:
+            cur.execute(
+                f"INSERT INTO {SESSION_TABLE} (SessionID, Data, ExpiresAt) VALUES (%s, %s, %s) "
+                "ON DUPLICATE KEY UPDATE Data = VALUES(Data), ExpiresAt = VALUES(ExpiresAt)",
+                [sid, data, expires_at])
+
+    def delete(self, sid):
+        with get_pool().cursor() as cur:
+            cur.execute(f"DELETE FROM {SESSION_TABLE} WHERE SessionID = %s", [sid])
+
+    def sweep(self, now):
+        # in batches, so a large backlog never holds long locks
+        total = 0
+        while True:
+            with get_pool().cursor() as cur:
+                n = cur.execute(f"DELETE FROM {SESSION_TABLE} WHERE ExpiresAt <= %s LIMIT 1000", [now])
+            total += n
+            if n < 1000:
+                return total
+
+
+def make_store(kind=STORE, path=None):
+    if kind == 'memory':
+        return MemoryStore()
+    if kind == 'mysql':
+        return MySQLStore()
+    if kind == 'sqlite':
+        return SQLiteStore(path or os.getenv('SHIBUI_SESSION_DB', 'sessions.sqlite3'))
+    raise ValueError(f"unknown session store {kind!r} (memory, sqlite or mysql)")
+
+
+# ─── Store metrics ───────────────────────────────────────────────────────────
+class _Timings:
+    """Call count and total seconds per store operation, plus load outcomes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.ops = {}
+        self.counts = {'hits': 0, 'misses': 0, 'expired': 0, 'errors': 0}
+
+    def record(self, op, seconds):
+        with self._lock:
+            n, total = self.ops.get(op, (0, 0.0))
+            self.ops[op] = (n + 1, total + seconds)
+
+    def count(self, key, n=1):
+        with self._lock:
+            self.counts[key] += n
+
+
+# ─── Flask session interface ─────────────────────────────────────────────────
+class StoreSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(_):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.replaces = None
+
+    def regenerate(self):
+        """Move the session to a fresh id (on login); the old id is deleted on save."""
+        if not self.new and self.replaces is None:
+            self.replaces = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.modified = True
+
+
+class StoreSessionInterface(SessionInterface):
+    """Keeps sessions in a store; the cookie carries only the signed session id."""
+
+    salt = 'shibui-session'
+
+    def __init__(self, store):
+        self.store = store
+        self.timings = _Timings()
+        self._sweeper_pid = None
+        self._start_lock = threading.Lock()
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt=self.salt, key_derivation='hmac')
+
+    def _timed(self, op, fn, *args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self.timings.record(op, time.perf_counter() - start)
+
+    def _ensure_sweeper(self):
+        if self._sweeper_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._sweeper_pid != os.getpid():
+                threading.Thread(target=self._sweep_forever, name='session-sweeper', daemon=True).start()
+                self._sweeper_pid = os.getpid()
+
+    def _sweep_forever(self):
+        while True:
+            time.sleep(SWEEP_EVERY)
+            try:
+                self.timings.count('expired', self._timed('sweep', self.store.sweep, time.time()))
+            except Exception:
+                self.timings.count('errors')
+
+    def open_session(self, app, request):
+        self._ensure_sweeper()
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode()
+            except BadSignature:
+                sid = None
+            if sid:
+                data = self._timed('load', self.store.load, sid)
+                if data is not None:
+                    self.timings.count('hits')
+                    return StoreSession(session_json_serializer.loads(data), sid=sid)
+            self.timings.count('misses')
+        return StoreSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name   = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path   = self.get_cookie_path(app)
+
+        if session.replaces is not None:
+            # rotated on login: the pre-login id must not stay usable
+            self._timed('delete', self.store.delete, session.replaces)
+        if not session:
+            # cleared (logout, timeout): drop the stored copy and the cookie
+            if session.modified and not session.new:
+                self._timed('delete', self.store.delete, session.sid)
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app))
+            return
+        if not session.modified:
+            return
+
+        expires = self.get_expiration_time(app, session)
+        expires_at = (expires.timestamp() if expires is not None
+                      else time.time() + app.permanent_session_lifetime.total_seconds())
+        self._timed('save', self.store.save, session.sid,
+                    session_json_serializer.dumps(dict(session)), expires_at)
+        response.set_cookie(
+            name, self._signer(app).sign(session.sid).decode(),
+            expires=expires, httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+            secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app),
+        )
+        response.vary.add('Cookie')
+
+    def stats(self):
+        with self.timings._lock:
+            out = {'store': self.store.name, 'ops': dict(self.timings.ops), **self.timings.counts}
+        try:
+            out['entries'] = len(self.store)
+        except TypeError:
+            pass                      # the mysql store does not count its rows
+        return out
+
+
+def init_app(app, kind=STORE):
+    """Install the server-side session interface on app."""
+    path = None
+    if kind == 'sqlite' and 'SHIBUI_SESSION_DB' not in os.environ:
+        os.makedirs(app.instance_path, exist_ok=True)
+        path = os.path.join(app.instance_path, 'sessions.sqlite3')
+    app.session_interface = StoreSessionInterface(make_store(kind, path))
+    return app.session_interface
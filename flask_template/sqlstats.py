@@ -0,0 +1,307 @@
+"""
+sqlstats.py  –  per-request and per-query-shape SQL instrumentation
+
+Every cursor handed out by the pool (dbpool.ConnectionPool.cursor) and by
+dbstream is a traced subclass of the requested pymysql cursor class, so model
+queries, dbselect/dbstream and the scheduler are all measured without any
+change at the call sites.
+
+Two views are kept:
+- per request (on flask.g): query count, time, rows, and repeats.  A query
+  run twice with identical parameters, or one shape run many times with
+  different parameters (the N+1 pattern), is flagged and logged.
+- per process, per normalised SQL shape: counts, totals and a reservoir of
+  latencies for p50/p95/p99, rendered by /metrics in Prometheus text format.
+
+Set SHIBUI_SQLSTATS=off to hand out plain cursors.
+"""
+
+import functools
+import hashlib
+import logging
+import os
+import random
+import re
+import threading
+import time
+
+import pymysql
+from flask import g, has_request_context
+
+log = logging.getLogger(__name__)
+
+ENABLED        = os.getenv('SHIBUI_SQLSTATS', 'on') != 'off'
+RESERVOIR_SIZE = 512     # latency samples kept per shape
+N_PLUS_ONE     = int(os.getenv('SHIBUI_N_PLUS_ONE', 10))   # same shape this often in one request
+MAX_SHAPES     = int(os.getenv('SHIBUI_SQLSTATS_SHAPES', 1000))  # beyond this, new shapes share one entry
+OTHER_SHAPE    = '(other)'
+
+
+# ─── SQL shapes ──────────────────────────────────────────────────────────────
+_STRING  = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_NUMBER  = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*(?:\?|%s|DEFAULT)(?:\s*,\s*(?:\?|%s|DEFAULT))*\s*\)")
+_SPACE   = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=2048)
+def normalize(sql):
+    """Collapse literals, placeholder lists and whitespace so equal query shapes compare equal."""
+    shape = _STRING.sub('?', sql)
+    shape = _NUMBER.sub('?', shape)
+    shape = _IN_LIST.sub('(…)', shape)
+    # multi-row VALUES / UNION ALL chains of any length are one shape
+    shape = re.sub(r"(\(…\))(?:\s*,\s*\(…\))+", r"\1", shape)
+    shape = re.sub(r"(SELECT [^()]*?)(?:\s+UNION ALL\s+\1)+", r"\1", shape)
+    return _SPACE.sub(' ', shape).strip().rstrip(';')
+
+
+def shape_id(shape):
+    return hashlib.sha1(shape.encode()).hexdigest()[:10]
+
+
+def _fingerprint(query, args):
+    try:
+        frozen = tuple(args) if isinstance(args, list) else args
+        if isinstance(frozen, dict):
+            frozen = tuple(sorted(frozen.items()))
+        return hash((query, frozen))
+    except TypeError:
+        return hash((query, repr(args)))
+
+
+# ─── Process-wide aggregates ─────────────────────────────────────────────────
+class ShapeStats:
+    __slots__ = ('shape', 'count', 'seconds', 'rows', 'repeats', 'samples', 'seen')
+
+    def __init__(self, shape):
+        self.shape   = shape
+        self.count   = 0
+        self.seconds = 0.0
+        self.rows    = 0
+        self.repeats = 0
+        self.samples = []
+        self.seen    = 0
+
+    def add(self, elapsed, rows):
+        self.count   += 1
+        self.seconds += elapsed
+        self.rows    += max(rows, 0)
+        # reservoir sampling keeps a uniform sample of all latencies seen
+        self.seen += 1
+        if len(self.samples) < RESERVOIR_SIZE:
+            self.samples.append(elapsed)
+        else:
+            j = random.randrange(self.seen)
+            if j < RESERVOIR_SIZE:
+                self.samples[j] = elapsed
+
+    def quantiles(self, qs=(0.5, 0.95, 0.99)):
+        if not self.samples:
+            return {q: 0.0 for q in qs}
+        ordered = sorted(self.samples)
+        last = len(ordered) - 1
+        return {q: ordered[min(last, int(round(q * last)))] for q in qs}
+
+
+_shapes = {}
+_lock   = threading.Lock()
+
+
+def snapshot():
+    """Copy of the per-shape aggregates, safe to read while queries run."""
+    with _lock:
+        return [(s.shape, s.count, s.seconds, s.rows, s.repeats, s.quantiles())
+                for s in _shapes.values()]
+
+
+def reset():
+    with _lock:
+        _shapes.clear()
+
+
+# ─── Per-request view ────────────────────────────────────────────────────────
+class RequestStats:
+    def __init__(self):
+        self.count   = 0
+        self.seconds = 0.0
+        self.rows    = 0
+        self.calls   = {}       # fingerprint -> times run with identical parameters
+        self.shapes  = {}       # shape -> times run
+        self.repeated = set()   # shapes run more than once with identical parameters
+        self.n_plus_one = set() # shapes run N_PLUS_ONE times or more
+
+    def add(self, shape, fingerprint, elapsed, rows):
+        self.count   += 1
+        self.seconds += elapsed
+        self.rows    += max(rows, 0)
+        repeat = fingerprint is not None and fingerprint in self.calls
+        if fingerprint is not None:
+            self.calls[fingerprint] = self.calls.get(fingerprint, 0) + 1
+        if repeat:
+            self.repeated.add(shape)
+        n = self.shapes[shape] = self.shapes.get(shape, 0) + 1
+        if n == N_PLUS_ONE:
+            self.n_plus_one.add(shape)
+        return repeat
+
+    def server_timing(self):
+        parts = [f'db;dur={self.seconds * 1000:.1f};desc="{self.count} queries, {self.rows} rows"']
+        if self.repeated or self.n_plus_one:
+            parts.append(f'db-repeat;desc="{len(self.repeated)} repeated, '
+                         f'{len(self.n_plus_one)} n+1"')
+        return ', '.join(parts)
+
+
+def current():
+    """This request's RequestStats, or None outside a request."""
+    if not has_request_context():
+        return None
+    stats = g.get('_sqlstats')
+    if stats is None:
+        stats = g._sqlstats = RequestStats()
+    return stats
+
+
+def record(query, args, elapsed, rows):
+    shape = normalize(query)
+    req = current()
+    repeat = False
+    if req is not None:
+        repeat = req.add(shape, _fingerprint(query, args), elapsed, rows)
+    with _lock:
+        s = _shapes.get(shape)
+        if s is None:
+            if len(_shapes) >= MAX_SHAPES:
+                # unbounded shape variety (generated SQL) must not grow memory or /metrics
+                shape = OTHER_SHAPE
+                s = _shapes.get(shape)
+            if s is None:
+                s = _shapes[shape] = ShapeStats(shape)
+        s.add(elapsed, rows)
+        if repeat:
+            s.repeats += 1
+
+
+def report(req, endpoint):
+    """Log repeated and N+1 query shapes seen during one request."""
+    for shape in sorted(req.repeated):
+        log.warning("%s: identical query repeated: %s", endpoint, shape[:200])
+    for shape in sorted(req.n_plus_one):
+        log.warning("%s: %d× same query shape (N+1?): %s",
+                    endpoint, req.shapes[shape], shape[:200])
+
+
+# ─── Traced cursors ──────────────────────────────────────────────────────────
+class _Traced:
+    """Mixin timing execute()/executemany() on any pymysql cursor class."""
+    _in_many = False
+    _streamed = None
+
+    def execute(self, query, args=None):
+        if self._in_many:
+            # executemany() batches through execute(); it is recorded once as a whole
+            return super().execute(query, args)
+        start = time.perf_counter()
+        result = super().execute(query, args)
+        elapsed = time.perf_counter() - start
+        if isinstance(self, pymysql.cursors.SSCursor):
+            # rows arrive later; counted as they are fetched and recorded on close()
+            self._streamed = (query, args, elapsed, 0)
+        else:
+            record(query, args, elapsed, self.rowcount)
+        return result
+
+    def executemany(self, query, args):
+        self._in_many = True
+        start = time.perf_counter()
+        try:
+            result = super().executemany(query, args)
+        finally:
+            self._in_many = False
+        record(query, None, time.perf_counter() - start, self.rowcount)
+        return result
+
+    def fetchone(self):
+        row = super().fetchone()
+        if self._streamed is not None and row is not None:
+            q, a, e, n = self._streamed
+            self._streamed = (q, a, e, n + 1)
+        return row
+
+    def close(self):
+        if self._streamed is not None:
+            record(*self._streamed)
+            self._streamed = None
+        super().close()
+
+
+@functools.lru_cache(maxsize=None)
+def traced(cursorclass):
+    """Traced subclass of a pymysql cursor class (the class itself when disabled)."""
+    if not ENABLED:
+        return cursorclass
+    return type('Traced' + cursorclass.__name__, (_Traced, cursorclass), {})
+
+
+# ─── Prometheus exposition ───────────────────────────────────────────────────
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+
+POOL_GAUGES  = {'open', 'idle', 'in_use', 'max_size'}
+CACHE_GAUGES = {'entries', 'rows'}
+
+
+def render_prometheus(pool_stats=None, cache_stats=None, session_stats=None):
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(samples)
+
+    shapes = snapshot()
+    labels = {shape: f'shape="{shape_id(shape)}",sql="{_label(shape[:300])}"' for shape, *_ in shapes}
+
+    metric('shibui_sql_queries_total', 'counter', 'Statements executed, by query shape.',
+           [f'shibui_sql_queries_total{{{labels[s]}}} {c}' for s, c, *_ in shapes])
+    metric('shibui_sql_seconds', 'summary', 'Statement latency in seconds, by query shape.',
+           [f'shibui_sql_seconds{{{labels[s]},quantile="{q}"}} {v:.6f}'
+            for s, _, _, _, _, qs in shapes for q, v in qs.items()]
+           + [f'shibui_sql_seconds_sum{{{labels[s]}}} {sec:.6f}' for s, _, sec, *_ in shapes]
+           + [f'shibui_sql_seconds_count{{{labels[s]}}} {c}' for s, c, *_ in shapes])
+    metric('shibui_sql_rows_total', 'counter', 'Rows returned or affected, by query shape.',
+           [f'shibui_sql_rows_total{{{labels[s]}}} {r}' for s, _, _, r, *_ in shapes])
+    metric('shibui_sql_repeated_total', 'counter',
+           'Statements that repeated an identical query earlier in the same request.',
+           [f'shibui_sql_repeated_total{{{labels[s]}}} {rep}' for s, _, _, _, rep, _ in shapes])
+
+    for key, value in sorted((pool_stats or {}).items()):
+        # open/idle/in_use/max_size are levels; everything else counts events
+        kind = 'gauge' if key in POOL_GAUGES else 'counter'
+        name = f'shibui_db_pool_{key}' + ('' if kind == 'gauge' else '_total')
+        metric(name, kind, f'Connection pool: {key.replace("_", " ")}.', [f'{name} {value}'])
+
+    for key, value in sorted((cache_stats or {}).items()):
+        kind = 'gauge' if key in CACHE_GAUGES else 'counter'
+        name = f'shibui_result_cache_{key}' + ('' if kind == 'gauge' else '_total')
+        metric(name, kind, f'Result cache: {key}.', [f'{name} {value}'])
+
+    if session_stats:
+        store = session_stats['store']
+        ops = sorted(session_stats['ops'].items())
+        metric('shibui_session_store_seconds', 'summary', 'Session store latency in seconds, by operation.',
+               [f'shibui_session_store_seconds_sum{{store="{store}",op="{op}"}} {sec:.6f}' for op, (_, sec) in ops]
+               + [f'shibui_session_store_seconds_count{{store="{store}",op="{op}"}} {n}' for op, (n, _) in ops])
+        metric('shibui_session_loads_total', 'counter', 'Session lookups, by whether a live session was found.',
+               [f'shibui_session_loads_total{{store="{store}",result="hit"}} {session_stats["hits"]}',
+                f'shibui_session_loads_total{{store="{store}",result="miss"}} {session_stats["misses"]}'])
+        metric('shibui_session_expired_total', 'counter', 'Expired sessions deleted by the sweeper.',
+               [f'shibui_session_expired_total{{store="{store}"}} {session_stats["expired"]}'])
+        metric('shibui_session_sweep_errors_total', 'counter', 'Sweeper runs that failed.',
+               [f'shibui_session_sweep_errors_total{{store="{store}"}} {session_stats["errors"]}'])
+        if 'entries' in session_stats:
+            metric('shibui_session_entries', 'gauge', 'Sessions held by the store.',
+                   [f'shibui_session_entries{{store="{store}"}} {session_stats["entries"]}'])
+    return '\n'.join(lines) + '\n'
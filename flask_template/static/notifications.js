@@ -0,0 +1,65 @@
+// Live navbar notifications: fed by /notifications/stream (Server-Sent Events).
+(function () {
+  const menu  = document.getElementById('notifMenu');
+  const badge = document.getElementById('notifBadge');
+  const list  = document.getElementById('notifList');
+  if (!menu || !badge || !list || !window.EventSource) return;
+
+  const seen = new Set();
+  let unread = 0;
+  let newest = 0;
+
+  function label(n) {
+    const type = n.Type.replace('_', ' ');
+    const time = (n.CreatedAt || '').slice(11, 16);
+    return `${type.charAt(0).toUpperCase()}${type.slice(1)} (Task ${n.UserTaskID}) at ${time}`;
+  }
+
+  function render() {
+    badge.textContent = unread;
+    badge.classList.toggle('d-none', unread === 0);
+  }
+
+  function add(n, append) {
+    if (seen.has(n.NotificationID)) return false;
+    seen.add(n.NotificationID);
+    newest = Math.max(newest, n.NotificationID);
+
+    const empty = list.querySelector('.notif-empty');
+    if (empty) empty.remove();
+
+    const li = document.createElement('li');
+    const span = document.createElement('span');
+    span.className = 'dropdown-item small';
+    span.textContent = label(n);
+    li.appendChild(span);
+    if (append) list.appendChild(li); else list.prepend(li);
+    while (list.children.length > 20) list.lastElementChild.remove();
+    return true;
+  }
+
+  const source = new EventSource('/notifications/stream');
+
+  source.addEventListener('snapshot', (e) => {
+    const data = JSON.parse(e.data);
+    data.items.forEach((n) => add(n, true));
+    unread = data.unread;
+    render();
+  });
+
+  source.addEventListener('notification', (e) => {
+    if (add(JSON.parse(e.data), false)) {
+      unread += 1;
+      render();
+    }
+  });
+
+  // opening the dropdown marks everything shown so far as read
+  menu.addEventListener('show.bs.dropdown', () => {
+    if (!unread) return;
+    const body = new URLSearchParams({ upto: newest });
+    fetch('/notifications/read', { method: 'POST', body: body });
+    unread = 0;
+    render();
+  });
+})();
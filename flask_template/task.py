@@ -94,8 +94,7 @@ class task(baseObject):
             return False
 
         # Persist
-        self.update(0)
-        return True
+        return self.update(0)
 
     # ──────────────────────────────────────────────────────────
     # Delete
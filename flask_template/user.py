@@ -110,7 +110,6 @@ class user(baseObject):
             "WHERE `UserEmail` = %s AND `UserPassword` = %s"
         )
 
-        self.cur.execute(sql, [email, hashed_pw])
-        self.data = self.cur.fetchall()
+        self.data = self._query(sql, [email, hashed_pw])
 
         return len(self.data) == 1
\ No newline at end of file
@@ -73,8 +73,7 @@ class user_task(baseObject):
         if not row.get('TaskStartTime'):
             row['TaskStartTime'] = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
-        self.update(0)
-        return True
+        return self.update(0)
 
     def complete_task(self, user_task_id):
         self.getById(user_task_id)
@@ -90,6 +89,5 @@ class user_task(baseObject):
         if not row.get('TaskEndTime'):
             row['TaskEndTime'] = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
-        self.update(0)
-        return True
+        return self.update(0)
 
@@ -0,0 +1,72 @@
+"""
+versions.py  –  shared version stamps for process-local caches
+
+Each cache keeps its stamps as rows of mmungoshi_cache_version (migration
+0003).  A writer bumps the row for what it changed; every worker compares
+the stamp it loaded against the table to notice writes made by the others.
+If the table does not exist yet, reads return None and bumps are no-ops, so
+caches fall back to their TTLs.
+"""
+
+import logging
+
+import pymysql
+
+from flask_template.dbpool import get_pool
+
+log = logging.getLogger(__name__)
+
+VERSION_TABLE = 'mmungoshi_cache_version'
+
+_warned = False
+
+
+def _missing_table(exc):
+    # 1146 = table doesn't exist: migration 0003 has not been applied
+    global _warned
+    if exc.args and exc.args[0] == 1146:
+        if not _warned:
+            log.warning("%s is missing; caches rely on their TTL only (run migrate.py up)", VERSION_TABLE)
+            _warned = True
+        return True
+    return False
+
+
+def read(name):
+    """Current stamp for one name (0 if never bumped, None without the table)."""
+    found = read_many([name])
+    return None if found is None else found.get(name, 0)
+
+
+def read_many(names):
+    """{name: stamp} for the given names in one query (None without the table)."""
+    names = list(names)
+    if not names:
+        return {}
+    marks = ', '.join('%s' for _ in names)
+    try:
+        with get_pool().cursor() as cur:
+            cur.execute(f"SELECT Name, Version FROM {VERSION_TABLE} WHERE Name IN ({marks})", names)
+            rows = cur.fetchall()
+    except pymysql.err.ProgrammingError as exc:
+        if _missing_table(exc):
+            return None
+        raise
+    return {r['Name']: r['Version'] for r in rows}
+
+
+def bump(name):
+    """Increment one stamp and return its new value (None without the table)."""
+    try:
+        with get_pool().cursor() as cur:
+            # LAST_INSERT_ID(expr) hands the new value back without a second query
+            cur.execute(
+                f"INSERT INTO {VERSION_TABLE} (Name, Version) VALUES (%s, LAST_INSERT_ID(1)) "
+                "ON DUPLICATE KEY UPDATE Version = LAST_INSERT_ID(Version + 1)",
+                [name]
+            )
+            return cur.lastrowid
+    except pymysql.err.ProgrammingError as exc:
+        if _missing_table(exc):
+            return None
+        raise